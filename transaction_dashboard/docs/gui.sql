@@ -57,7 +57,7 @@ SELECT
         'date', date,
         'client_id', client_id
     ) as metadata
-FROM django_db.core_transaction;
+FROM django_db.transactions_flat;
 
 -- Verify the data was inserted
 SELECT COUNT(*) as client_count FROM client_kb;
@@ -120,7 +120,7 @@ CREATE JOB update_transaction_kb_job (
             'date', date,
             'client_id', client_id
         ) as metadata
-    FROM django_db.core_transaction
+    FROM django_db.transactions_flat
     WHERE date > (
         SELECT MAX(CAST(JSON_EXTRACT(metadata, '$.date') AS DATETIME)) 
         FROM transaction_kb
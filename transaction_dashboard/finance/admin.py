@@ -1,5 +1,155 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
 from django.contrib import admin
-from .models import Client, Card, Transaction
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .models import Client, Card, Merchant, Transaction, ClientProfile, CardProfile
+from .planner import estimate_rows
+from .search import SearchError, search_clients, search_merchants
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses PostgreSQL's row estimate instead of COUNT(*) once a
+    result set is large enough that an exact count would dominate the page load
+    """
+
+    @cached_property
+    def count(self):
+        try:
+            estimated = estimate_rows(self.object_list)
+        except Exception:
+            return super().count
+        if estimated < getattr(settings, 'FINANCE_ADMIN_EXACT_COUNT_LIMIT', 100000):
+            return super().count
+        return estimated
+
+
+class PerformanceModeAdmin(admin.ModelAdmin):
+    """Changelist settings for tables too large for the admin defaults"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class CachedChoicesListFilter(admin.SimpleListFilter):
+    """
+    List filter whose choices (the distinct values of a column) are computed
+    once and kept in the cache, instead of on every changelist request
+
+    Choices are read from choices_model (the admin's own model by default),
+    so a dimension table can supply them; lookup is the filter applied to the
+    changelist queryset (field_name by default).
+    """
+    field_name = None
+    choices_model = None
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        model = self.choices_model or model_admin.model
+        key = f'finance:admin:choices:{model._meta.db_table}:{self.field_name}'
+        values = cache.get(key)
+        if values is None:
+            values = [
+                value for value in model.objects.order_by(self.field_name)
+                .values_list(self.field_name, flat=True).distinct()
+                if value
+            ]
+            cache.set(key, values, getattr(settings, 'FINANCE_ADMIN_FILTER_CACHE_TTL', 3600))
+        return [(value, value) for value in values]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.lookup or self.field_name: self.value()})
+        return queryset
+
+
+class MerchantStateListFilter(CachedChoicesListFilter):
+    title = 'merchant state'
+    parameter_name = 'merchant_state'
+    field_name = 'state'
+    choices_model = Merchant
+    lookup = 'merchant__state'
+
+
+class DateDrilldownListFilter(admin.SimpleListFilter):
+    """
+    Year -> month -> day drill-down on Transaction.date
+
+    Unlike date_hierarchy, which runs DISTINCT date_trunc() over the filtered
+    rows to build its links, the choices here are derived from the cached
+    MIN/MAX date (two index lookups) and every selection is a date range that
+    the date index can answer.
+    """
+    title = 'date'
+    parameter_name = 'date_bucket'
+
+    def _bounds(self):
+        bounds = cache.get('finance:admin:transaction_date_bounds')
+        if bounds is None:
+            bounds = Transaction.objects.aggregate(first=Min('date'), last=Max('date'))
+            cache.set('finance:admin:transaction_date_bounds', bounds,
+                      getattr(settings, 'FINANCE_ADMIN_FILTER_CACHE_TTL', 3600))
+        return bounds
+
+    def _parts(self):
+        """(year[, month[, day]]) of the selection; () when there is none or it is not a real date"""
+        value = self.value()
+        if not value:
+            return ()
+        try:
+            parts = tuple(int(p) for p in value.split('-'))
+            if len(parts) > 3:
+                return ()
+            date(*(parts + (1, 1))[:3])
+        except ValueError:
+            return ()
+        return parts
+
+    def lookups(self, request, model_admin):
+        bounds = self._bounds()
+        if not bounds['first']:
+            return []
+        parts = self._parts()
+        years = range(bounds['last'].year, bounds['first'].year - 1, -1)
+        if len(parts) == 0:
+            return [(str(y), str(y)) for y in years]
+
+        year = parts[0]
+        choices = [(str(year), str(year))]
+        choices += [(f'{year}-{m:02d}', f'{calendar.month_abbr[m]} {year}') for m in range(1, 13)]
+        if len(parts) >= 2:
+            month = parts[1]
+            days = calendar.monthrange(year, month)[1]
+            choices += [(f'{year}-{month:02d}-{d:02d}', f'{calendar.month_abbr[month]} {d}, {year}')
+                        for d in range(1, days + 1)]
+        return choices
+
+    def queryset(self, request, queryset):
+        parts = self._parts()
+        if not parts:
+            return queryset
+        try:
+            if len(parts) == 1:
+                start, end = date(parts[0], 1, 1), date(parts[0] + 1, 1, 1)
+            elif len(parts) == 2:
+                start = date(parts[0], parts[1], 1)
+                end = (start + timedelta(days=32)).replace(day=1)
+            else:
+                start = date(*parts[:3])
+                end = start + timedelta(days=1)
+        except (ValueError, OverflowError):
+            # The range ends past date.max
+            return queryset
+        tz = timezone.get_current_timezone()
+        return queryset.filter(
+            date__gte=datetime.combine(start, datetime.min.time(), tzinfo=tz),
+            date__lt=datetime.combine(end, datetime.min.time(), tzinfo=tz),
+        )
 
 
 @admin.register(Client)
@@ -7,8 +157,22 @@ class ClientAdmin(admin.ModelAdmin):
     list_display = ('id', 'current_age', 'retirement_age', 'gender', 'per_capita_income')
     list_filter = ('gender', 'birth_month', 'current_age')
     search_fields = ('id', 'address')
+    search_help_text = 'Numbers match the client id; text matches address words by prefix or similarity.'
     ordering = ('id',)
     
+    def get_search_results(self, request, queryset, search_term):
+        """Use the address full-text and trigram indexes instead of icontains"""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(id=int(term)), False
+        try:
+            return search_clients(term, queryset, ranked=False), False
+        except SearchError:
+            # No letter or digit to search for, e.g. "#"
+            return queryset.none(), False
+    
     fieldsets = (
         ('Personal Information', {
             'fields': ('current_age', 'retirement_age', 'birth_year', 'birth_month', 'gender')
@@ -23,8 +187,9 @@ class ClientAdmin(admin.ModelAdmin):
 
 
 @admin.register(Card)
-class CardAdmin(admin.ModelAdmin):
+class CardAdmin(PerformanceModeAdmin):
     list_display = ('id', 'client', 'card_brand', 'card_type', 'has_chip', 'credit_limit', 'expires')
+    list_select_related = ('client',)
     list_filter = ('card_brand', 'card_type', 'has_chip', 'expires')
     search_fields = ('id', 'client__id', 'card_number')
     ordering = ('id',)
@@ -40,17 +205,72 @@ class CardAdmin(admin.ModelAdmin):
 
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(PerformanceModeAdmin):
     list_display = ('id', 'date', 'client', 'card', 'amount', 'merchant_city', 'merchant_state')
-    list_filter = ('date', 'use_chip', 'merchant_state', 'card__card_brand')
-    search_fields = ('id', 'client__id', 'card__id', 'merchant_id', 'merchant_city')
+    list_filter = (DateDrilldownListFilter, 'use_chip', MerchantStateListFilter, 'card__card_brand')
+    list_select_related = ('client', 'card', 'merchant')
+    raw_id_fields = ('merchant',)
+    search_fields = ('merchant__code', 'merchant__city')
+    search_help_text = (
+        'Numbers match transaction, client, card or merchant id; '
+        'text matches merchant city, state or ZIP by prefix or similarity.'
+    )
     ordering = ('-date', 'id')
     
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Use indexed exact matches for numeric terms and the merchant full-text
+        and trigram indexes for text, instead of icontains over every search field
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            value = int(term)
+            return queryset.filter(
+                Q(id=value) | Q(client_id=value) | Q(card_id=value) | Q(merchant__code=term)
+            ), False
+        try:
+            return queryset.filter(merchant__in=search_merchants(term, ranked=False).values('id')), False
+        except SearchError:
+            # No letter or digit to search for, e.g. "#"
+            return queryset.none(), False
+    
     fieldsets = (
         ('Transaction Details', {
             'fields': ('date', 'client', 'card', 'amount', 'use_chip')
         }),
         ('Merchant Information', {
-            'fields': ('merchant_id', 'merchant_city', 'merchant_state', 'zip')
+            'fields': ('merchant',)
         }),
     )
+
+
+@admin.register(Merchant)
+class MerchantAdmin(PerformanceModeAdmin):
+    list_display = ('id', 'code', 'city', 'state', 'zip', 'mcc')
+    list_filter = ('state',)
+    search_fields = ('code', 'city')
+    search_help_text = 'Numbers match the id, merchant id or ZIP; text matches city or state words by prefix or similarity.'
+    ordering = ('id',)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Use the merchant full-text and trigram indexes instead of icontains"""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        try:
+            matches = search_merchants(term, queryset, ranked=False)
+        except SearchError:
+            # No letter or digit to search for, e.g. "#"
+            return queryset.none(), False
+        if term.isdigit():
+            matches = matches | queryset.filter(id=int(term))
+        return matches, False
+
+
+@admin.register(ClientProfile, CardProfile)
+class SpendProfileAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'txn_count', 'amount_mean', 'chip_count', 'last_seen')
+    readonly_fields = ('txn_count', 'amount_mean', 'amount_m2', 'amount_total',
+                       'chip_count', 'state_mask', 'last_seen', 'updated_at')
@@ -0,0 +1,269 @@
+"""
+Spend over time, aggregated in PostgreSQL.
+
+A spend series groups transactions into day, week or month buckets
+(date_trunc in settings.TIME_ZONE), optionally split by one dimension, and
+adds per-dimension window columns:
+
+    total            sum of amounts in the bucket
+    transactions     number of transactions in the bucket
+    running_total    cumulative total since the start of the range
+    moving_average   trailing average over the last `window` buckets, with
+                     empty buckets counted as zero
+
+Only the bucketed rows leave the database, so a year of daily spend is at most
+366 rows per dimension value. The date range is read through the covering
+indexes on (date) and (client_id, date). Results are cached for
+FINANCE_ANALYTICS_CACHE_TTL seconds. The cache key includes the newest
+transaction id, so ingested rows show up straight away.
+
+When the range reaches before the archive cutoff (finance.archive), the
+archived rows are bucketed from the Parquet files and passed in as arrays, so
+the window columns cover both.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Max
+from django.utils import timezone
+
+from .archive import archive_cutoff, read_archive, read_manifest
+from .models import Card, Merchant, Transaction
+
+
+GRANULARITIES = {
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'month': timedelta(days=31),
+}
+# dimension -> (SQL expression, table to join)
+DIMENSIONS = {
+    'merchant_state': ("NULLIF(m.state, '')", 'merchant'),
+    'mcc': ('m.mcc', 'merchant'),
+    'card_brand': ('c.card_brand', 'card'),
+    'use_chip': ('t.use_chip', None),
+}
+# dimension -> SQL type of its values, for archived buckets (text otherwise)
+DIMENSION_TYPES = {'mcc': 'integer'}
+
+
+class AnalyticsError(ValueError):
+    """Raised for an invalid granularity, dimension or date range"""
+
+
+def _window_span(granularity: str, window: int) -> str:
+    # The RANGE offset covering `window` buckets including the current one
+    unit = 'days' if granularity == 'day' else 'weeks' if granularity == 'week' else 'months'
+    return f'{window - 1} {unit}'
+
+
+def build_spend_query(granularity: str, dimension: Optional[str], start: datetime, end: datetime,
+                      window: int, client_id: Optional[int] = None, card_id: Optional[int] = None,
+                      archived: Optional[Dict[str, list]] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    SQL and params for a spend series; see the module docstring for the columns
+
+    archived holds buckets computed from the archive (see archived_buckets),
+    which are added to the buckets read from the table.
+    """
+    joins = []
+    dimension_sql = 'NULL'
+    if dimension is not None:
+        dimension_sql, join = DIMENSIONS[dimension]
+        if join == 'merchant':
+            joins.append(f'JOIN {Merchant._meta.db_table} m ON m.id = t.merchant_id')
+        elif join == 'card':
+            joins.append(f'JOIN {Card._meta.db_table} c ON c.id = t.card_id')
+
+    # Rows from before `start` feed the first moving averages but are not returned
+    conditions = [
+        't.date >= (date_trunc(%(granularity)s, %(start)s AT TIME ZONE %(tz)s) - %(span)s::interval) AT TIME ZONE %(tz)s',
+        't.date < %(end)s',
+    ]
+    if client_id is not None:
+        conditions.append('t.client_id = %(client_id)s')
+    if card_id is not None:
+        conditions.append('t.card_id = %(card_id)s')
+
+    buckets_sql = f"""
+            SELECT date_trunc(%(granularity)s, t.date AT TIME ZONE %(tz)s) AS bucket,
+                   {dimension_sql} AS dimension,
+                   SUM(t.amount) AS total,
+                   COUNT(*) AS transactions
+            FROM {Transaction._meta.db_table} t
+            {' '.join(joins)}
+            WHERE {' AND '.join(conditions)}
+            GROUP BY 1, 2
+    """
+    if archived:
+        dimension_type = DIMENSION_TYPES.get(dimension, 'text')
+        buckets_sql = f"""
+            SELECT bucket, dimension, SUM(total) AS total, SUM(transactions)::bigint AS transactions
+            FROM (
+                {buckets_sql}
+                UNION ALL
+                SELECT * FROM unnest(
+                    %(archived_buckets)s::timestamp[], %(archived_dimensions)s::{dimension_type}[],
+                    %(archived_totals)s::numeric[], %(archived_counts)s::bigint[]
+                )
+            ) combined
+            WHERE bucket >= date_trunc(%(granularity)s, %(start)s AT TIME ZONE %(tz)s) - %(span)s::interval
+            GROUP BY 1, 2
+        """
+
+    sql = f"""
+        WITH buckets AS ({buckets_sql}),
+        windowed AS (
+            SELECT bucket, dimension, total, transactions,
+                   SUM(total) OVER (
+                       PARTITION BY dimension ORDER BY bucket
+                       RANGE BETWEEN %(span)s::interval PRECEDING AND CURRENT ROW
+                   ) / %(window)s AS moving_average
+            FROM buckets
+        )
+        SELECT bucket, dimension, total, transactions,
+               SUM(total) OVER (PARTITION BY dimension ORDER BY bucket) AS running_total,
+               moving_average
+        FROM windowed
+        WHERE bucket >= date_trunc(%(granularity)s, %(start)s AT TIME ZONE %(tz)s)
+        ORDER BY bucket, dimension NULLS LAST
+    """
+    params = {
+        'granularity': granularity,
+        'tz': settings.TIME_ZONE,
+        'start': start,
+        'end': end,
+        'span': _window_span(granularity, window),
+        'window': window,
+        'client_id': client_id,
+        'card_id': card_id,
+    }
+    if archived:
+        params.update({f'archived_{name}': values for name, values in archived.items()})
+    return sql, params
+
+
+def archived_buckets(granularity: str, dimension: Optional[str], start: datetime, end: datetime,
+                     window: int, client_id: Optional[int] = None,
+                     card_id: Optional[int] = None) -> Optional[Dict[str, list]]:
+    """
+    Archived spend grouped like the buckets CTE, or None when the range and
+    its moving-average lead-in are all newer than the archive cutoff
+    """
+    cutoff = archive_cutoff()
+    # Covers date_trunc(start) minus window - 1 buckets for any granularity
+    lower = start - GRANULARITIES[granularity] * window
+    if cutoff is None or lower >= cutoff:
+        return None
+    column = 'card_id' if dimension == 'card_brand' else dimension
+    table = read_archive(
+        ['date', 'amount'] + ([column] if column else []), start=lower, end=min(end, cutoff),
+        client_id=client_id, card_id=card_id,
+    )
+    if not table.num_rows:
+        return None
+
+    frame = table.to_pandas()
+    local = frame['date'].dt.tz_convert(settings.TIME_ZONE).dt.tz_localize(None).dt.normalize()
+    if granularity == 'week':
+        local = local - pd.to_timedelta(local.dt.weekday, unit='D')
+    elif granularity == 'month':
+        local = local.dt.to_period('M').dt.to_timestamp()
+    frame['bucket'] = local
+    if dimension == 'card_brand':
+        brands = dict(Card.objects.filter(id__in=frame['card_id'].unique().tolist()).values_list('id', 'card_brand'))
+        frame['dimension'] = frame['card_id'].map(brands)
+    else:
+        frame['dimension'] = frame[column].astype(object) if column else None
+    frame['cents'] = (frame['amount'].astype(float) * 100).round().astype('int64')
+
+    grouped = frame.groupby(['bucket', 'dimension'], dropna=False).agg(
+        cents=('cents', 'sum'), transactions=('cents', 'size')
+    ).reset_index()
+    dimensions = [None if pd.isna(value) else value for value in grouped['dimension']]
+    if dimension == 'mcc':
+        dimensions = [None if value is None else int(value) for value in dimensions]
+    return {
+        'buckets': [bucket.to_pydatetime() for bucket in grouped['bucket']],
+        'dimensions': dimensions,
+        'totals': [cents / 100 for cents in grouped['cents'].tolist()],
+        'counts': grouped['transactions'].tolist(),
+    }
+
+
+def spend_series(granularity: str = 'day', dimension: Optional[str] = None,
+                 start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 window: int = 7, client_id: Optional[int] = None,
+                 card_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Bucketed spend between start (inclusive) and end (exclusive)
+
+    Defaults to the 365 days up to the end of today.
+
+    Returns:
+        Tuple of (rows, cache info with hit and the transaction id it reflects)
+
+    Raises:
+        AnalyticsError: for an unknown granularity or dimension, a window
+            over FINANCE_ANALYTICS_MAX_WINDOW, or a range that with the
+            window's lead-in spans more than FINANCE_ANALYTICS_MAX_BUCKETS
+            buckets
+    """
+    if granularity not in GRANULARITIES:
+        raise AnalyticsError(f'granularity must be one of {", ".join(GRANULARITIES)}')
+    if dimension is not None and dimension not in DIMENSIONS:
+        raise AnalyticsError(f'dimension must be one of {", ".join(DIMENSIONS)}')
+    max_window = getattr(settings, 'FINANCE_ANALYTICS_MAX_WINDOW', 366)
+    if not 1 <= window <= max_window:
+        raise AnalyticsError(f'window must be between 1 and {max_window}')
+    if end is None:
+        # The end of today rather than now, so repeated requests share a cache entry
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        end = today + timedelta(days=1)
+    start = start or end - timedelta(days=365)
+    if start >= end:
+        raise AnalyticsError('start must be before end')
+    max_buckets = getattr(settings, 'FINANCE_ANALYTICS_MAX_BUCKETS', 1100)
+    # The moving average reads window - 1 buckets before the range as well
+    if (end - start) / GRANULARITIES[granularity] + window - 1 > max_buckets:
+        raise AnalyticsError(
+            f'at most {max_buckets} {granularity} buckets per request, including the {window - 1} '
+            f'before start that the moving average reads; narrow the range or the window'
+        )
+
+    alias = router.db_for_read(Transaction)
+    sql, params = build_spend_query(granularity, dimension, start, end, window, client_id, card_id)
+    latest_id = Transaction.objects.using(alias).aggregate(m=Max('id'))['m']
+    archive_version = read_manifest().get('updated_at')
+    key = 'finance:analytics:spend:' + hashlib.sha1(
+        json.dumps([sql, params, latest_id, archive_version], sort_keys=True, default=str).encode()
+    ).hexdigest()
+    rows = cache.get(key)
+    cache_info = {'hit': rows is not None, 'latest_transaction_id': latest_id}
+    if rows is None:
+        archived = archived_buckets(granularity, dimension, start, end, window, client_id, card_id)
+        if archived:
+            sql, params = build_spend_query(
+                granularity, dimension, start, end, window, client_id, card_id, archived=archived
+            )
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = [
+                {
+                    'bucket': bucket.date().isoformat(),
+                    'dimension': value,
+                    'total': float(total),
+                    'transactions': transactions,
+                    'running_total': float(running_total),
+                    'moving_average': round(float(moving_average), 2),
+                }
+                for bucket, value, total, transactions, running_total, moving_average in cursor.fetchall()
+            ]
+        cache.set(key, rows, getattr(settings, 'FINANCE_ANALYTICS_CACHE_TTL', 300))
+    return rows, cache_info
@@ -0,0 +1,399 @@
+"""
+Cold archive of old transactions in Parquet files.
+
+archive_transactions moves transactions older than a cutoff out of the
+transactions table into FINANCE_ARCHIVE_DIR, one directory per month:
+
+    archive/
+        _manifest.json
+        month=2015-01/part-<first id>-<last id>.parquet
+        month=2015-02/...
+
+Each file holds a chunk of rows with the merchant fields denormalized, so the
+archive reads without the database. Rows that a leaderboard or a velocity
+alert still points to stay in the table.
+
+read_archive() scans the files with pyarrow.dataset. Months outside the
+requested range are skipped by their directory name, only the requested
+columns are decoded, and the filters are checked against the row group
+statistics before any data is read. read_latest() serves pages of the
+newest rows: it scans months newest first and stops once the page is full.
+The transaction list and the spend analytics add archived rows for ranges
+that reach before the cutoff.
+
+Needs the pyarrow package.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+
+from .models import TopTransaction, Transaction, VelocityAlert
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+
+MANIFEST = '_manifest.json'
+# Columns that can be filtered on, besides the date range
+FILTERS = ('client_id', 'card_id', 'merchant_state', 'mcc')
+
+
+class ArchiveError(ValueError):
+    """Raised for an invalid archive read or when pyarrow is not installed"""
+
+
+def _schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.timestamp('us', tz='UTC')),
+        ('client_id', pa.int32()),
+        ('card_id', pa.int32()),
+        ('amount', pa.decimal128(10, 2)),
+        ('use_chip', pa.dictionary(pa.int8(), pa.string())),
+        ('errors', pa.string()),
+        ('merchant_id', pa.int32()),
+        ('merchant_code', pa.string()),
+        ('merchant_city', pa.string()),
+        ('merchant_state', pa.string()),
+        ('zip', pa.string()),
+        ('mcc', pa.int32()),
+    ])
+
+
+COLUMNS = (
+    'id', 'date', 'client_id', 'card_id', 'amount', 'use_chip', 'errors', 'merchant_id',
+    'merchant_code', 'merchant_city', 'merchant_state', 'zip', 'mcc',
+)
+# Archive column -> Transaction lookup
+SOURCE_FIELDS = {
+    'id': 'id',
+    'date': 'date',
+    'client_id': 'client_id',
+    'card_id': 'card_id',
+    'amount': 'amount',
+    'use_chip': 'use_chip',
+    'errors': 'errors',
+    'merchant_id': 'merchant_id',
+    'merchant_code': 'merchant__code',
+    'merchant_city': 'merchant__city',
+    'merchant_state': 'merchant__state',
+    'zip': 'merchant__zip',
+    'mcc': 'merchant__mcc',
+}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ArchiveError('the transaction archive needs the pyarrow package')
+
+
+def archive_dir() -> Path:
+    return Path(getattr(settings, 'FINANCE_ARCHIVE_DIR', settings.BASE_DIR / 'archive'))
+
+
+def read_manifest() -> Dict[str, Any]:
+    """Cutoff, last update and per-month row counts of the archive ({} when empty)"""
+    try:
+        with open(archive_dir() / MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_manifest(manifest: Dict[str, Any]):
+    path = archive_dir() / MANIFEST
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def archive_cutoff() -> Optional[datetime]:
+    """Transactions before this moment may be in the archive rather than the table"""
+    if pa is None:
+        return None
+    cutoff = read_manifest().get('cutoff')
+    return datetime.fromisoformat(cutoff) if cutoff else None
+
+
+def _rows_to_table(rows: List[tuple]):
+    columns = list(zip(*rows))
+    data = dict(zip(COLUMNS, columns))
+    # The merchant dimension stores a missing state and ZIP as ''
+    data['merchant_state'] = [s or None for s in data['merchant_state']]
+    data['zip'] = [z or None for z in data['zip']]
+    return pa.Table.from_pydict(data, schema=_schema())
+
+
+_lock = threading.Lock()
+
+
+def _publish(staged: List[tuple], counts: Dict[str, int], before: datetime):
+    # Committed: from here on the staging files must never be discarded
+    pending = list(staged)
+    staged.clear()
+    for tmp, final in pending:
+        os.replace(tmp, final)
+    _record(counts, before)
+
+
+def _record(counts: Dict[str, int], before: Optional[datetime]):
+    """Add published rows to the manifest; callers hold _lock"""
+    if not counts:
+        return
+    manifest = read_manifest()
+    cutoff = manifest.get('cutoff')
+    if before is not None and (not cutoff or datetime.fromisoformat(cutoff) < before):
+        manifest['cutoff'] = before.isoformat()
+    months = manifest.setdefault('months', {})
+    for month, rows in counts.items():
+        months[month] = months.get(month, 0) + rows
+    manifest['updated_at'] = timezone.now().isoformat()
+    _write_manifest(manifest)
+
+
+def _discard(staged: List[tuple]):
+    for tmp, _ in staged:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+
+
+def _recover_staged(root: Path, log=print) -> Dict[str, int]:
+    """
+    Publish staging files left by a run that died after its commit, and
+    remove those whose transaction never committed
+
+    Returns:
+        Rows published per month
+    """
+    counts: Dict[str, int] = {}
+    for tmp in root.glob('month=*/.part-*.parquet.tmp'):
+        final = tmp.with_name(tmp.name[1:-len('.tmp')])
+        first_id = int(final.stem.split('-')[1])
+        if Transaction.objects.filter(id=first_id).exists():
+            tmp.unlink()
+            continue
+        os.replace(tmp, final)
+        month = tmp.parent.name.split('=', 1)[1]
+        rows = pq.read_metadata(final).num_rows
+        counts[month] = counts.get(month, 0) + rows
+        log(f'  recovered {rows} archived transactions from {final.name}')
+    # The run that staged them died before recording them; the cutoff of
+    # the next run covers them
+    _record(counts, None)
+    return counts
+
+
+def archive_transactions(before: datetime, batch_size: Optional[int] = None, dry_run: bool = False,
+                         log=print) -> Dict[str, int]:
+    """
+    Move transactions dated before `before` into the archive
+
+    Each chunk is locked, written to dot-prefixed staging files and deleted
+    from the table in one database transaction. The staging files are
+    renamed into place only once that transaction has committed and are
+    removed if it rolls back, so a failed COMMIT (e.g. a deferred foreign
+    key) never leaves rows both in the table and the archive. A crash
+    between the commit and the rename leaves staging files behind; the next
+    run publishes those whose rows are gone from the table and removes the
+    rest. The manifest is updated as each chunk is published, so rows from
+    an interrupted run are readable too.
+
+    Returns:
+        Rows archived per month (YYYY-MM)
+    """
+    _require_pyarrow()
+    if timezone.is_naive(before):
+        before = timezone.make_aware(before)
+    batch_size = batch_size or getattr(settings, 'FINANCE_ARCHIVE_BATCH_SIZE', 100000)
+    compression = getattr(settings, 'FINANCE_ARCHIVE_COMPRESSION', 'zstd')
+    root = archive_dir()
+
+    candidates = (
+        Transaction.objects.filter(date__lt=before)
+        .exclude(id__in=TopTransaction.objects.values('transaction_id'))
+        .exclude(id__in=VelocityAlert.objects.values('transaction_id'))
+    )
+
+    counts: Dict[str, int] = {}
+    with _lock:
+        if not dry_run:
+            for month, rows in _recover_staged(root, log).items():
+                counts[month] = counts.get(month, 0) + rows
+        last_id = 0
+        while True:
+            staged = []
+            try:
+                with db_transaction.atomic():
+                    chunk = candidates.filter(id__gt=last_id).order_by('id')
+                    if not dry_run:
+                        # Nothing may change a row between writing its file and deleting it
+                        chunk = chunk.select_for_update(of=('self',))
+                    rows = list(chunk.values_list(*SOURCE_FIELDS.values())[:batch_size])
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
+                    if dry_run:
+                        for row in rows:
+                            month = row[1].astimezone(dt_timezone.utc).strftime('%Y-%m')
+                            counts[month] = counts.get(month, 0) + 1
+                        log(f'  would archive {len(rows)} transactions up to id {last_id}')
+                        continue
+
+                    # One file per month the chunk touches
+                    by_month: Dict[str, List[tuple]] = {}
+                    for row in rows:
+                        by_month.setdefault(row[1].astimezone(dt_timezone.utc).strftime('%Y-%m'), []).append(row)
+                    for month, month_rows in by_month.items():
+                        directory = root / f'month={month}'
+                        directory.mkdir(parents=True, exist_ok=True)
+                        final = directory / f'part-{month_rows[0][0]}-{month_rows[-1][0]}.parquet'
+                        # Dot-prefixed, so readers skip it until it is renamed
+                        tmp = directory / f'.{final.name}.tmp'
+                        pq.write_table(_rows_to_table(month_rows), tmp, compression=compression)
+                        staged.append((tmp, final))
+
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            f'DELETE FROM {Transaction._meta.db_table} WHERE id = ANY(%s)', [[row[0] for row in rows]]
+                        )
+                    chunk_counts = {month: len(month_rows) for month, month_rows in by_month.items()}
+                    # Readers find the chunk through the manifest as soon as its files are live
+                    db_transaction.on_commit(
+                        lambda staged=staged, chunk_counts=chunk_counts: _publish(staged, chunk_counts, before)
+                    )
+            except BaseException:
+                # Rolled back, or the COMMIT itself failed: the rows stay in the table
+                _discard(staged)
+                raise
+            for month, month_rows in chunk_counts.items():
+                counts[month] = counts.get(month, 0) + month_rows
+            log(f'  archived {len(rows)} transactions up to id {last_id}')
+    return counts
+
+
+def _dataset():
+    partitioning = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+    return ds.dataset(
+        str(archive_dir()), format='parquet', partitioning=partitioning, ignore_prefixes=['_', '.'],
+    )
+
+
+def _filter(columns: Optional[List[str]], start: Optional[datetime], end: Optional[datetime],
+            filters: Dict[str, Any]):
+    """Validated column list and the dataset filter expression (None for everything)"""
+    _require_pyarrow()
+    columns = list(columns or COLUMNS)
+    unknown = [c for c in columns if c not in COLUMNS]
+    if unknown:
+        raise ArchiveError(f'unknown archive column(s): {", ".join(unknown)}; expected {", ".join(COLUMNS)}')
+
+    expression = None
+
+    def both(condition):
+        return condition if expression is None else expression & condition
+
+    if start is not None:
+        # The month directory prunes whole partitions, the date column the rest
+        expression = both(ds.field('month') >= start.astimezone(dt_timezone.utc).strftime('%Y-%m'))
+        expression = both(ds.field('date') >= pa.scalar(start, type=pa.timestamp('us', tz='UTC')))
+    if end is not None:
+        expression = both(ds.field('month') <= end.astimezone(dt_timezone.utc).strftime('%Y-%m'))
+        expression = both(ds.field('date') < pa.scalar(end, type=pa.timestamp('us', tz='UTC')))
+    for name, value in filters.items():
+        if name not in FILTERS:
+            raise ArchiveError(f'cannot filter the archive on {name}; expected one of {", ".join(FILTERS)}')
+        if value is not None:
+            expression = both(ds.field(name) == value)
+    return columns, expression
+
+
+def read_archive(columns: Optional[List[str]] = None, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, **filters):
+    """
+    Archived transactions with start <= date < end matching the filters
+
+    Args:
+        columns: Archive columns to return (default: all)
+        start, end: Date range; aware datetimes
+        **filters: Equality filters on client_id, card_id, merchant_state or mcc
+
+    Returns:
+        pyarrow.Table, empty when nothing has been archived
+
+    Raises:
+        ArchiveError: for an unknown column or filter, or without pyarrow
+    """
+    columns, expression = _filter(columns, start, end, filters)
+    if not read_manifest().get('months'):
+        return _schema().empty_table().select(columns)
+    return _dataset().to_table(columns=columns, filter=expression)
+
+
+def read_latest(limit: int, columns: Optional[List[str]] = None, start: Optional[datetime] = None,
+                end: Optional[datetime] = None, **filters):
+    """
+    The newest `limit` archived transactions matching the filters, ordered by
+    date descending and id ascending
+
+    Months are scanned newest first and the scan stops as soon as limit rows
+    are collected, so a page of recent rows never reads older partitions.
+    Within a month only the best limit rows are kept between record batches.
+    Arguments and errors are those of read_archive.
+    """
+    columns, expression = _filter(columns, start, end, filters)
+    months = sorted(read_manifest().get('months', {}), reverse=True)
+    if start is not None:
+        months = [m for m in months if m >= start.astimezone(dt_timezone.utc).strftime('%Y-%m')]
+    if end is not None:
+        months = [m for m in months if m <= end.astimezone(dt_timezone.utc).strftime('%Y-%m')]
+
+    scanned = list(dict.fromkeys(columns + ['date', 'id']))
+    order = [('date', 'descending'), ('id', 'ascending')]
+    dataset = _dataset() if months else None
+    found = []
+    collected = 0
+    for month in months:
+        if collected >= limit:
+            break
+        condition = ds.field('month') == month
+        if expression is not None:
+            condition = condition & expression
+        best = None
+        for batch in dataset.scanner(columns=scanned, filter=condition).to_batches():
+            if not batch.num_rows:
+                continue
+            table = pa.Table.from_batches([batch])
+            if best is not None:
+                table = pa.concat_tables([best, table])
+            best = table.sort_by(order).slice(0, limit - collected)
+        if best is not None:
+            found.append(best)
+            collected += best.num_rows
+    if not found:
+        return _schema().empty_table().select(columns)
+    return pa.concat_tables(found).select(columns)
+
+
+def table_to_rows(table) -> List[Dict[str, Any]]:
+    """Archive rows as dicts shaped like the transaction API's"""
+    rows = table.to_pylist()
+    for row in rows:
+        if 'date' in row:
+            row['date'] = row['date'].isoformat()
+        if 'amount' in row:
+            row['amount'] = float(row['amount'])
+    return rows
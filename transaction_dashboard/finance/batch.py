@@ -0,0 +1,248 @@
+"""
+Several MindsDB dashboard queries in one request.
+
+A batch is a list of named query specs such as
+
+    {"name": "rich", "type": "wealthy_clients", "params": {"min_age": 40}}
+
+Each spec is parsed into a MindsDBUtil method call. The calls run concurrently
+on a process-wide thread pool, so a batch takes about as long as its slowest
+query. Identical calls are only run once: within a batch they share a result,
+and across requests a call already in flight is joined instead of started
+again. Query types the dashboard opens with are read through the shared cache
+(finance.warmup), like their single-query endpoints.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .mindsdb_util import mindsdb_util
+from .projection import parse_fields, select_list
+from .query_guard import clamp_limit
+from .throttling import mindsdb_scheduler
+from .warmup import cache_key, cached_call
+
+
+class BatchError(ValueError):
+    """Raised when a batch or one of its query specs is invalid"""
+
+
+def _bool(value) -> bool:
+    if isinstance(value, str):
+        return value.lower() == 'true'
+    return bool(value)
+
+
+def _stats(params):
+    return 'get_knowledge_base_stats', {}
+
+
+def _connection(params):
+    return 'test_connection', {}
+
+
+def _wealthy_clients(params):
+    return 'find_wealthy_clients', {
+        'min_age': int(params.get('min_age', 40)),
+        'min_income': float(params.get('min_income', 70000)),
+    }
+
+
+def _travel_expenses(params):
+    return 'find_travel_expenses', {
+        'min_amount': float(params.get('min_amount', 500)),
+        'use_chip': _bool(params.get('use_chip', True)),
+    }
+
+
+def _online_shopping(params):
+    return 'find_online_shopping', {'state': str(params.get('state', 'California'))}
+
+
+def _suspicious_patterns(params):
+    client_id = params.get('client_id')
+    return 'analyze_suspicious_patterns', {'client_id': int(client_id) if client_id is not None else None}
+
+
+def _custom_search(params):
+    search_term = params.get('search_term')
+    if not search_term:
+        raise BatchError('search_term is required')
+    filters = params.get('filters') or None
+    if filters is not None and not isinstance(filters, dict):
+        raise BatchError('filters must be an object')
+    kb_type = str(params.get('kb_type', 'transaction'))
+    fields = parse_fields(params.get('fields'))
+    select_list(kb_type, fields)  # ProjectionError is a ValueError
+    return 'custom_semantic_search', {
+        'search_term': str(search_term),
+        'kb_type': kb_type,
+        'filters': filters,
+        'limit': clamp_limit(int(params.get('limit', 10))),
+        'offset': max(0, int(params.get('offset', 0))),
+        'fields': fields,
+    }
+
+
+# type -> (params parser returning (method, kwargs), read through the cache,
+# query class for finance.throttling)
+QUERY_TYPES: Dict[str, Tuple[Callable[[Dict[str, Any]], Tuple[str, Dict[str, Any]]], bool, str]] = {
+    'stats': (_stats, True, 'stats'),
+    'connection': (_connection, False, 'stats'),
+    'wealthy_clients': (_wealthy_clients, True, 'search'),
+    'travel_expenses': (_travel_expenses, True, 'search'),
+    'online_shopping': (_online_shopping, True, 'search'),
+    'suspicious_patterns': (_suspicious_patterns, False, 'search'),
+    'custom_search': (_custom_search, False, 'semantic'),
+}
+
+
+def parse_specs(specs: Any) -> List[Dict[str, Any]]:
+    """
+    Validate query specs and resolve them to MindsDBUtil calls
+
+    Raises:
+        BatchError: if the batch is empty, too large, or a spec is invalid
+    """
+    if not isinstance(specs, list) or not specs:
+        raise BatchError('queries must be a non-empty list')
+    max_queries = getattr(settings, 'FINANCE_BATCH_MAX_QUERIES', 10)
+    if len(specs) > max_queries:
+        raise BatchError(f'at most {max_queries} queries per batch')
+
+    parsed = []
+    names = set()
+    for position, spec in enumerate(specs):
+        if not isinstance(spec, dict):
+            raise BatchError(f'query {position} must be an object')
+        query_type = spec.get('type')
+        name = str(spec.get('name') or query_type)
+        if query_type not in QUERY_TYPES:
+            raise BatchError(f'{name}: unknown type {query_type!r}; expected one of {", ".join(QUERY_TYPES)}')
+        if name in names:
+            raise BatchError(f'duplicate query name {name!r}')
+        names.add(name)
+        params = spec.get('params') or {}
+        if not isinstance(params, dict):
+            raise BatchError(f'{name}: params must be an object')
+        parser, cached, query_class = QUERY_TYPES[query_type]
+        try:
+            method, kwargs = parser(params)
+        except (TypeError, ValueError) as e:
+            raise BatchError(f'{name}: {e}')
+        parsed.append({
+            'name': name, 'type': query_type, 'method': method, 'kwargs': kwargs, 'cached': cached,
+            'class': query_class,
+        })
+    return parsed
+
+
+class BatchRunner:
+    """Runs MindsDBUtil calls on a shared pool, joining identical calls in flight"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = None
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='mindsdb-batch')
+        return self._executor
+
+    def submit(self, method: str, kwargs: Dict[str, Any], cached: bool, query_class: str = 'search',
+               identity: str = 'batch') -> Future:
+        """Start a call, or return the future of the identical call already running"""
+        key = cache_key(method, kwargs)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self.executor.submit(self._call, method, kwargs, cached, query_class, identity)
+            self._inflight[key] = future
+        # Outside the lock: a call that already finished runs the callback here
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future
+
+    def _forget(self, key: str, future: Future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _call(self, method: str, kwargs: Dict[str, Any], cached: bool, query_class: str,
+              identity: str) -> Tuple[Any, Any]:
+        try:
+            if not getattr(settings, 'FINANCE_THROTTLE_ENABLED', True):
+                return self._run_call(method, kwargs, cached)
+            # Each query takes its own MindsDB slot, like a single-query request
+            with mindsdb_scheduler.slot(query_class, identity):
+                return self._run_call(method, kwargs, cached)
+        finally:
+            close_old_connections()
+
+    def _run_call(self, method: str, kwargs: Dict[str, Any], cached: bool) -> Tuple[Any, Any]:
+        if cached:
+            return cached_call(method, **kwargs)
+        return getattr(mindsdb_util, method)(**kwargs), None
+
+    def run(self, queries: List[Dict[str, Any]], identity: str = 'batch') -> Iterator[Dict[str, Any]]:
+        """
+        Run parsed queries concurrently, scheduled as `identity` (see finance.throttling)
+
+        Yields:
+            One result dict per query, in the order they finish; queries still
+            running after FINANCE_BATCH_TIMEOUT seconds are reported as failed
+        """
+        timeout = getattr(settings, 'FINANCE_BATCH_TIMEOUT', 60)
+        started = time.monotonic()
+        finished = queue.Queue()
+        for query in queries:
+            future = self.submit(query['method'], query['kwargs'], query['cached'], query['class'], identity)
+            future.add_done_callback(lambda f, query=query: finished.put((query, f)))
+
+        pending = {query['name']: query for query in queries}
+        while pending:
+            try:
+                query, future = finished.get(timeout=max(0.0, timeout - (time.monotonic() - started)))
+            except queue.Empty:
+                break
+            del pending[query['name']]
+            yield self._result(query, future, time.monotonic() - started)
+
+        # The calls themselves carry on in the background and still fill the cache
+        for query in pending.values():
+            yield self._describe(query, time.monotonic() - started, error=f'timed out after {timeout} seconds')
+
+    def _describe(self, query: Dict[str, Any], elapsed: float, **fields) -> Dict[str, Any]:
+        result = {
+            'name': query['name'],
+            'type': query['type'],
+            'params': query['kwargs'],
+            'elapsed_seconds': round(elapsed, 3),
+        }
+        if 'error' in fields:
+            result['success'] = False
+        result.update(fields)
+        return result
+
+    def _result(self, query: Dict[str, Any], future: Future, elapsed: float) -> Dict[str, Any]:
+        try:
+            results, cache_info = future.result()
+        except Exception as e:
+            return self._describe(query, elapsed, error=str(e))
+        result = self._describe(query, elapsed, success=True, results=results)
+        if isinstance(results, list):
+            result['count'] = len(results)
+        if cache_info is not None:
+            result['cache'] = cache_info
+        return result
+
+
+batch_runner = BatchRunner(max_workers=getattr(settings, 'FINANCE_BATCH_WORKERS', 8))
@@ -0,0 +1,99 @@
+"""
+Content-hash keyed embedding cache for knowledge base ingestion.
+
+transaction_kb content is "<merchant_city>, <merchant_state>", which has only a
+few thousand distinct values across millions of transactions. Instead of
+letting MindsDB embed every row, KB syncs driven from Django embed each
+distinct string once through the MINDSDB_EMBEDDING_MODEL model, keep the
+vector in the embedding_cache table (and a bounded in-process map), and write
+rows straight into the KB's vector table with the cached vectors.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+from django.conf import settings
+
+from .mindsdb_util import mindsdb_util
+from .models import EmbeddingCache
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    """Two-level (memory, then database) cache in front of the embedding model"""
+
+    def __init__(self, model_name: str, memory_size: int, batch_size: int):
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.batch_size = batch_size
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'embedded': 0}
+        self._lock = threading.Lock()
+
+    def _remember(self, digest: str, vector: np.ndarray):
+        with self._lock:
+            self._memory[digest] = vector
+            self._memory.move_to_end(digest)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get_many(self, contents: List[str]) -> List[np.ndarray]:
+        """
+        Return one float32 vector per input string, in input order
+
+        Duplicate strings are resolved once; only strings missing from both
+        cache levels are sent to the embedding model.
+        """
+        digests = {content: content_hash(content) for content in dict.fromkeys(contents)}
+        vectors: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            for digest in digests.values():
+                if digest in self._memory:
+                    vectors[digest] = self._memory[digest]
+                    self._memory.move_to_end(digest)
+        self.stats['memory_hits'] += len(vectors)
+
+        missing = [d for d in digests.values() if d not in vectors]
+        if missing:
+            cached = EmbeddingCache.objects.filter(
+                model_name=self.model_name, content_hash__in=missing
+            ).values_list('content_hash', 'vector')
+            for digest, blob in cached:
+                vectors[digest] = np.frombuffer(bytes(blob), dtype=np.float32)
+                self._remember(digest, vectors[digest])
+                self.stats['db_hits'] += 1
+
+        to_embed = [content for content, digest in digests.items() if digest not in vectors]
+        for start in range(0, len(to_embed), self.batch_size):
+            batch = to_embed[start:start + self.batch_size]
+            embedded = mindsdb_util.embed_texts(batch, model_name=self.model_name)
+            entries = []
+            for content, values in zip(batch, embedded):
+                vector = np.asarray(values, dtype=np.float32)
+                digest = digests[content]
+                vectors[digest] = vector
+                self._remember(digest, vector)
+                entries.append(EmbeddingCache(
+                    model_name=self.model_name,
+                    content_hash=digest,
+                    content=content,
+                    dimensions=vector.shape[0],
+                    vector=vector.tobytes(),
+                ))
+            EmbeddingCache.objects.bulk_create(entries, ignore_conflicts=True)
+            self.stats['embedded'] += len(batch)
+
+        return [vectors[digests[content]] for content in contents]
+
+
+embedding_store = EmbeddingStore(
+    model_name=getattr(settings, 'MINDSDB_EMBEDDING_MODEL', 'kb_embedding_model'),
+    memory_size=getattr(settings, 'FINANCE_EMBEDDING_MEMORY_CACHE', 50000),
+    batch_size=getattr(settings, 'FINANCE_EMBEDDING_BATCH_SIZE', 256),
+)
@@ -0,0 +1,207 @@
+"""
+In-memory spatial index over client home locations.
+
+Client coordinates are loaded once into NumPy arrays, sorted by a fixed-size
+lat/lon grid cell so every cell is a contiguous slice. Radius queries only
+compute distances for the cells overlapping the search circle, and k-nearest
+queries widen the radius until enough clients are inside it.
+
+Merchant locations are approximated by ZIP code centroids loaded from
+FINANCE_ZIP_CENTROIDS_PATH (e.g. the Census ZCTA gazetteer file), since the
+transactions table has no coordinates of its own.
+"""
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .models import Client
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in km between coordinate arrays given in degrees"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def normalize_zip(value) -> Optional[str]:
+    """Normalize '2138', '02138' and '2138.0' to '02138'"""
+    if value in (None, ''):
+        return None
+    try:
+        return f"{int(float(value)):05d}"
+    except (TypeError, ValueError):
+        return None
+
+
+class ClientSpatialIndex:
+    """Grid-bucketed client coordinates supporting radius and k-NN queries"""
+
+    def __init__(self, ids, lats, lons, cell_degrees: float = 0.5):
+        self.cell_degrees = cell_degrees
+        ids = np.asarray(ids, dtype=np.int64)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+
+        cells = self._cell_keys(lats, lons)
+        order = np.argsort(cells, kind='stable')
+        self.ids = ids[order]
+        self.lats = lats[order]
+        self.lons = lons[order]
+        keys, starts, counts = np.unique(cells[order], return_index=True, return_counts=True)
+        self.cells: Dict[int, Tuple[int, int]] = {
+            int(k): (int(s), int(s + c)) for k, s, c in zip(keys, starts, counts)
+        }
+        # Sorted copy of ids for O(log n) coordinate lookups by client id
+        self._id_order = np.argsort(self.ids)
+        self._sorted_ids = self.ids[self._id_order]
+
+    @classmethod
+    def from_database(cls, cell_degrees: float = 0.5) -> 'ClientSpatialIndex':
+        rows = Client.objects.order_by().values_list('id', 'latitude', 'longitude')
+        data = np.array([(i, float(lat), float(lon)) for i, lat, lon in rows.iterator(chunk_size=10000)],
+                        dtype=np.float64).reshape(-1, 3)
+        return cls(data[:, 0], data[:, 1], data[:, 2], cell_degrees)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell_keys(self, lats, lons):
+        rows = np.floor((np.asarray(lats) + 90) / self.cell_degrees).astype(np.int64)
+        cols = np.floor((np.asarray(lons) + 180) / self.cell_degrees).astype(np.int64)
+        return rows * 100000 + cols
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        dlat = radius_km / KM_PER_DEGREE
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        dlon = min(radius_km / (KM_PER_DEGREE * cos_lat), 180)
+        row_lo, row_hi = (int(math.floor((v + 90) / self.cell_degrees)) for v in (lat - dlat, lat + dlat))
+        col_lo, col_hi = (int(math.floor((v + 180) / self.cell_degrees)) for v in (lon - dlon, lon + dlon))
+        max_col = int(360 / self.cell_degrees)
+
+        keys = {
+            row * 100000 + col % max_col
+            for row in range(row_lo, row_hi + 1)
+            for col in range(col_lo, col_hi + 1)
+        }
+        slices = [np.arange(*self.cells[key]) for key in keys if key in self.cells]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def within_radius(self, lat: float, lon: float, radius_km: float, limit: Optional[int] = None) -> List[Dict]:
+        """Clients within radius_km of (lat, lon), nearest first"""
+        candidates = self._candidates(lat, lon, radius_km)
+        if len(candidates) == 0:
+            return []
+        distances = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+        inside = distances <= radius_km
+        return self._results(candidates[inside], distances[inside], limit)
+
+    def nearest(self, lat: float, lon: float, k: int) -> List[Dict]:
+        """The k clients closest to (lat, lon)"""
+        k = min(k, len(self))
+        radius = 25.0
+        max_radius = math.pi * EARTH_RADIUS_KM
+        while True:
+            candidates = self._candidates(lat, lon, radius)
+            distances = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+            # Once k clients lie inside the radius, nothing outside it can be closer
+            if (distances <= radius).sum() >= k or radius >= max_radius:
+                return self._results(candidates, distances, k)
+            radius *= 2
+
+    def _results(self, positions: np.ndarray, distances: np.ndarray, limit: Optional[int]) -> List[Dict]:
+        if limit is not None and len(positions) > limit:
+            top = np.argpartition(distances, limit - 1)[:limit]
+            positions, distances = positions[top], distances[top]
+        order = np.argsort(distances)
+        return [
+            {
+                'client_id': int(self.ids[p]),
+                'latitude': float(self.lats[p]),
+                'longitude': float(self.lons[p]),
+                'distance_km': round(float(d), 3),
+            }
+            for p, d in zip(positions[order], distances[order])
+        ]
+
+    def coordinates(self, client_ids) -> Tuple[np.ndarray, np.ndarray]:
+        """Home coordinates for an array of client ids (NaN for unknown ids)"""
+        client_ids = np.asarray(client_ids, dtype=np.int64)
+        lats = np.full(len(client_ids), np.nan)
+        lons = np.full(len(client_ids), np.nan)
+        if len(self) == 0:
+            return lats, lons
+        pos = np.clip(np.searchsorted(self._sorted_ids, client_ids), 0, len(self) - 1)
+        found = self._sorted_ids[pos] == client_ids
+        rows = self._id_order[pos[found]]
+        lats[found] = self.lats[rows]
+        lons[found] = self.lons[rows]
+        return lats, lons
+
+
+class ZipCentroids:
+    """ZIP code -> (lat, lon) lookup loaded from a gazetteer-style file"""
+
+    def __init__(self, path: Optional[str]):
+        self.table: Dict[str, Tuple[float, float]] = {}
+        if path:
+            self._load(path)
+
+    def _load(self, path: str):
+        frame = pd.read_csv(path, sep=None, engine='python', dtype=str)
+        frame.columns = [c.strip().lower() for c in frame.columns]
+        zip_col = next(c for c in ('zip', 'geoid', 'zcta5') if c in frame.columns)
+        lat_col = next(c for c in ('lat', 'latitude', 'intptlat') if c in frame.columns)
+        lon_col = next(c for c in ('lon', 'lng', 'longitude', 'intptlong') if c in frame.columns)
+        for z, lat, lon in zip(frame[zip_col], frame[lat_col], frame[lon_col]):
+            key = normalize_zip(z)
+            if key:
+                self.table[key] = (float(lat), float(lon))
+
+    def lookup(self, zips) -> Tuple[np.ndarray, np.ndarray]:
+        """Centroid arrays for a sequence of ZIP codes (NaN where unknown)"""
+        coords = [self.table.get(normalize_zip(z), (np.nan, np.nan)) for z in zips]
+        arr = np.array(coords, dtype=np.float64).reshape(-1, 2)
+        return arr[:, 0], arr[:, 1]
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'built_at': 0.0, 'zips': None}
+
+
+def get_client_index() -> ClientSpatialIndex:
+    """Process-wide client index, rebuilt every FINANCE_GEO_INDEX_TTL seconds"""
+    ttl = getattr(settings, 'FINANCE_GEO_INDEX_TTL', 600)
+    with _lock:
+        if _state['index'] is None or time.monotonic() - _state['built_at'] > ttl:
+            _state['index'] = ClientSpatialIndex.from_database(
+                getattr(settings, 'FINANCE_GEO_CELL_DEGREES', 0.5)
+            )
+            _state['built_at'] = time.monotonic()
+        return _state['index']
+
+
+def get_zip_centroids() -> ZipCentroids:
+    with _lock:
+        if _state['zips'] is None:
+            _state['zips'] = ZipCentroids(getattr(settings, 'FINANCE_ZIP_CENTROIDS_PATH', None))
+        return _state['zips']
+
+
+def distances_from_home(client_ids, zips) -> np.ndarray:
+    """
+    Vectorized distance between each transaction's merchant ZIP centroid and
+    its client's home, in km (NaN when either location is unknown)
+    """
+    home_lats, home_lons = get_client_index().coordinates(client_ids)
+    merchant_lats, merchant_lons = get_zip_centroids().lookup(zips)
+    return haversine_km(home_lats, home_lons, merchant_lats, merchant_lons)
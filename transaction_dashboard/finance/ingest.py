@@ -0,0 +1,330 @@
+"""
+Micro-batched transaction ingestion.
+
+Requests hand validated Transaction instances to a process-wide buffer and
+return immediately. A single background thread drains the buffer whenever it
+reaches FINANCE_INGEST_BATCH_SIZE rows or FINANCE_INGEST_FLUSH_INTERVAL
+seconds have passed, and for each micro-batch:
+
+1. writes it with one bulk_create,
+2. scores it for anomalies against the profiles as they were before the batch,
+3. checks it against the velocity rules (finance.velocity),
+4. folds it into the client/card spend profiles and the leaderboards,
+5. publishes the alerts to the live dashboard feed and pushes the batch to
+   transaction_kb so MindsDB sees it without waiting for the job.
+
+Steps 1-4 run in one database transaction, so the derived tables never
+disagree with transactions. A batch whose transaction fails is requeued
+FINANCE_INGEST_MAX_ATTEMPTS times and then appended to the
+FINANCE_INGEST_DEAD_LETTER file (JSON lines in the ingest API's format), so
+accepted transactions are never dropped silently.
+"""
+import atexit
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction as db_transaction
+
+from .kb import sync_rows, transaction_kb_row
+from .live import live_feed
+from .mindsdb_util import mindsdb_util
+from .merchants import merchant_cache, merchant_key
+from .models import Card, Client, ClientProfile, Merchant, Transaction
+from .leaderboards import update_leaderboards
+from .profiles import update_profiles
+from .routers import pin_to_primary
+from .velocity import check_velocity
+
+
+TRANSACTION_FIELDS = (
+    'date', 'client_id', 'card_id', 'amount', 'use_chip', 'merchant_id',
+    'merchant_city', 'merchant_state', 'zip', 'mcc', 'errors',
+)
+# Incoming merchant fields -> Merchant dimension fields
+MERCHANT_FIELDS = {
+    'merchant_id': 'code',
+    'merchant_city': 'city',
+    'merchant_state': 'state',
+    'zip': 'zip',
+    'mcc': 'mcc',
+}
+
+
+class BufferFull(Exception):
+    """Raised when the ingest buffer cannot take another batch"""
+
+
+def build_transactions(items: List[Dict[str, Any]]):
+    """
+    Validate raw transaction dicts against the Transaction model
+
+    Field-level validation runs per row; client and card existence is checked
+    with one query each for the whole batch, and the merchant fields are
+    resolved to Merchant rows in one pass, creating any not seen before.
+
+    Returns:
+        Tuple of (transactions, errors) where errors maps row index to messages
+    """
+    transactions = []
+    errors = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = ['Each transaction must be a JSON object']
+            continue
+        unknown = set(item) - set(TRANSACTION_FIELDS)
+        if unknown:
+            errors[index] = [f"Unknown fields: {', '.join(sorted(unknown))}"]
+            continue
+        item = dict(item)
+        merchant_fields = {MERCHANT_FIELDS[f]: item.pop(f, None) for f in MERCHANT_FIELDS}
+        merchant = Merchant(**{k: v for k, v in merchant_fields.items() if v is not None})
+        transaction = Transaction(**item)
+        try:
+            transaction.client_id = int(item.get('client_id'))
+            transaction.card_id = int(item.get('card_id'))
+        except (TypeError, ValueError):
+            errors[index] = ['client_id and card_id must be integers']
+            continue
+        try:
+            merchant.clean_fields(exclude=['id'])
+            transaction.clean_fields(exclude=['client', 'card', 'merchant'])
+        except ValidationError as e:
+            reverse = {v: k for k, v in MERCHANT_FIELDS.items()}
+            errors[index] = [
+                f'{reverse.get(field, field)}: {msg}' for field, msgs in e.message_dict.items() for msg in msgs
+            ]
+            continue
+        key = merchant_key(merchant.code, merchant.city, merchant.state, merchant.zip, merchant.mcc)
+        transactions.append((index, transaction, key))
+
+    client_ids = {t.client_id for _, t, _ in transactions}
+    card_ids = {t.card_id for _, t, _ in transactions}
+    known_clients = set(Client.objects.filter(id__in=client_ids).values_list('id', flat=True))
+    card_owners = dict(Card.objects.filter(id__in=card_ids).values_list('id', 'client_id'))
+
+    valid = []
+    for index, transaction, key in transactions:
+        if transaction.client_id not in known_clients:
+            errors[index] = [f'client_id: client {transaction.client_id} does not exist']
+        elif card_owners.get(transaction.card_id) != transaction.client_id:
+            errors[index] = [f'card_id: card {transaction.card_id} does not belong to client {transaction.client_id}']
+        else:
+            valid.append((transaction, key))
+
+    merchants = merchant_cache.resolve_many(key for _, key in valid)
+    for transaction, key in valid:
+        transaction.merchant = merchants[key]
+    return [transaction for transaction, _ in valid], errors
+
+
+def score_transactions(transactions: List[Transaction]) -> List[Dict[str, Any]]:
+    """
+    Score a micro-batch for anomalies
+
+    With FINANCE_ANOMALY_BACKEND = 'mindsdb' the batch is joined against the
+    MINDSDB_ANOMALY_MODEL model; otherwise each amount is compared with the
+    client's spend profile (z-score against the stored mean and stddev).
+
+    Returns:
+        List of alerts for transactions at or above FINANCE_ANOMALY_THRESHOLD
+    """
+    threshold = getattr(settings, 'FINANCE_ANOMALY_THRESHOLD', 3.0)
+    backend = getattr(settings, 'FINANCE_ANOMALY_BACKEND', 'local')
+
+    if backend == 'mindsdb':
+        model = getattr(settings, 'MINDSDB_ANOMALY_MODEL', 'anomaly_detection_model')
+        source = getattr(settings, 'MINDSDB_PG_DATABASE', 'django_db')
+        ids = ', '.join(str(t.id) for t in transactions)
+        rows = mindsdb_util.execute_query(f"""
+        SELECT
+            t.id AS transaction_id,
+            m.anomaly_score
+        FROM {source}.transactions_flat AS t
+        JOIN {model} AS m
+        WHERE t.id IN ({ids});
+        """)
+        return [
+            {'transaction_id': row['transaction_id'], 'score': float(row['anomaly_score']), 'backend': backend}
+            for row in rows
+            if row.get('anomaly_score') is not None and float(row['anomaly_score']) >= threshold
+        ]
+
+    profiles = ClientProfile.objects.in_bulk({t.client_id for t in transactions})
+    alerts = []
+    for transaction in transactions:
+        profile = profiles.get(transaction.client_id)
+        if profile is None or profile.txn_count < 2 or not profile.amount_stddev:
+            continue
+        score = (float(transaction.amount) - profile.amount_mean) / profile.amount_stddev
+        if score >= threshold:
+            alerts.append({
+                'transaction_id': transaction.id,
+                'client_id': transaction.client_id,
+                'amount': float(transaction.amount),
+                'score': round(score, 2),
+                'backend': 'local',
+            })
+    return alerts
+
+
+class IngestBuffer:
+    """
+    Bounded in-memory buffer drained by a single background flusher thread
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_buffered: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.pending = deque()
+        self.recent_alerts = deque(maxlen=500)
+        self.stats = {'received': 0, 'written': 0, 'batches': 0, 'failed': 0, 'requeued': 0, 'dead_lettered': 0}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, transactions: List[Transaction]) -> int:
+        """
+        Queue transactions for the next micro-batch
+
+        Raises:
+            BufferFull: if accepting the batch would exceed max_buffered
+        """
+        with self._cond:
+            if len(self.pending) + len(transactions) > self.max_buffered:
+                raise BufferFull(f'Ingest buffer full ({len(self.pending)} transactions pending)')
+            self.pending.extend(transactions)
+            self.stats['received'] += len(transactions)
+            self._ensure_thread()
+            if len(self.pending) >= self.batch_size:
+                self._cond.notify()
+            return len(self.pending)
+
+    def depth(self) -> int:
+        return len(self.pending)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='finance-ingest', daemon=True)
+            self._thread.start()
+
+    def _take_batch(self) -> List[Transaction]:
+        with self._cond:
+            count = min(len(self.pending), self.batch_size)
+            return [self.pending.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self.pending) < self.batch_size:
+                    self._cond.wait(timeout=self.flush_interval)
+            batch = self._take_batch()
+            if batch:
+                self.flush_batch(batch)
+
+    def flush(self):
+        """Synchronously drain everything that is buffered"""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self.flush_batch(batch)
+
+    def flush_batch(self, batch: List[Transaction]):
+        # Score against the profiles this thread has been updating, not a lagging copy
+        pin_to_primary()
+        close_old_connections()
+        local_scoring = getattr(settings, 'FINANCE_ANOMALY_BACKEND', 'local') != 'mindsdb'
+        alerts = []
+        try:
+            with db_transaction.atomic():
+                written = Transaction.objects.bulk_create(batch, batch_size=self.batch_size)
+                if local_scoring:
+                    alerts += self._score(written)
+                alerts += check_velocity(written)
+                update_profiles(written)
+                update_leaderboards(written)
+        except Exception as e:
+            self.stats['failed'] += len(batch)
+            print(f"Error writing ingest batch of {len(batch)} transactions: {e}")
+            self._retry(batch, e)
+            close_old_connections()
+            return
+        self.stats['written'] += len(written)
+        self.stats['batches'] += 1
+
+        # MindsDB reads the committed rows
+        if not local_scoring:
+            alerts = self._score(written) + alerts
+        self.recent_alerts.extend(alerts)
+        if alerts:
+            live_feed.publish('alerts', alerts)
+
+        try:
+            sync_rows('transaction_kb', [transaction_kb_row(t) for t in written])
+        except Exception as e:
+            print(f"Error pushing ingest batch to transaction_kb: {e}")
+        finally:
+            close_old_connections()
+
+    def _score(self, transactions: List[Transaction]) -> List[Dict[str, Any]]:
+        # A savepoint, so a failed scoring query does not abort the batch
+        try:
+            with db_transaction.atomic():
+                return score_transactions(transactions)
+        except Exception as e:
+            print(f"Error scoring ingest batch: {e}")
+            return []
+
+    def _retry(self, batch: List[Transaction], error: Exception):
+        """Put a failed batch back at the head of the buffer, or dead-letter it"""
+        attempts = getattr(batch[0], '_ingest_attempts', 0) + 1
+        for transaction in batch:
+            # bulk_create assigned ids that the rollback discarded
+            transaction.pk = None
+            transaction._state.adding = True
+            transaction._ingest_attempts = attempts
+        if attempts >= getattr(settings, 'FINANCE_INGEST_MAX_ATTEMPTS', 3):
+            self._dead_letter(batch, error)
+            return
+        # Back off before the flusher picks the batch up again
+        time.sleep(self.flush_interval * attempts)
+        with self._cond:
+            self.pending.extendleft(reversed(batch))
+        self.stats['requeued'] += len(batch)
+
+    def _dead_letter(self, batch: List[Transaction], error: Exception):
+        path = getattr(settings, 'FINANCE_INGEST_DEAD_LETTER', settings.BASE_DIR / 'ingest_dead_letter.jsonl')
+        with open(path, 'a') as f:
+            for t in batch:
+                f.write(json.dumps({
+                    'transaction': {
+                        'date': t.date,
+                        'client_id': t.client_id,
+                        'card_id': t.card_id,
+                        'amount': t.amount,
+                        'use_chip': t.use_chip,
+                        'errors': t.errors,
+                        'merchant_id': t.merchant.code,
+                        'merchant_city': t.merchant.city,
+                        'merchant_state': t.merchant.state or None,
+                        'zip': t.merchant.zip or None,
+                        'mcc': t.merchant.mcc,
+                    },
+                    'error': str(error),
+                }, cls=DjangoJSONEncoder) + '\n')
+        self.stats['dead_lettered'] += len(batch)
+        print(f"Dead-lettered {len(batch)} transactions to {path}")
+
+
+ingest_buffer = IngestBuffer(
+    batch_size=getattr(settings, 'FINANCE_INGEST_BATCH_SIZE', 5000),
+    flush_interval=getattr(settings, 'FINANCE_INGEST_FLUSH_INTERVAL', 1.0),
+    max_buffered=getattr(settings, 'FINANCE_INGEST_MAX_BUFFERED', 100000),
+)
+atexit.register(ingest_buffer.flush)
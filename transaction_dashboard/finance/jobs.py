@@ -0,0 +1,140 @@
+"""
+Background execution of MindsDB queries.
+
+Jobs are persisted in the query_job table and executed by a process-local
+thread pool; their result rows go to query_job_row so they can be paged
+through after the fact. A running query cannot be interrupted inside
+mindsdb_sdk, so timeouts and cancellation are enforced on the job record: the
+job is marked finished immediately and whatever the worker returns later is
+discarded.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .mindsdb_util import mindsdb_util
+from .models import QueryJob, QueryJobRow
+from .routers import pin_to_primary
+
+
+class JobLimitExceeded(Exception):
+    """Raised when an owner already has the maximum number of active jobs"""
+
+
+class QueryJobRunner:
+    """Submits QueryJobs to a bounded worker pool and tracks their futures"""
+
+    def __init__(self, max_workers: int, max_per_owner: int, timeout: int):
+        self.max_workers = max_workers
+        self.max_per_owner = max_per_owner
+        self.timeout = timeout
+        self._executor = None
+        self._futures: Dict[str, object] = {}
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='mindsdb-job')
+        return self._executor
+
+    def submit(self, query: str, owner: str) -> QueryJob:
+        """
+        Create a job for the query and queue it on the worker pool
+
+        Raises:
+            JobLimitExceeded: if the owner already has max_per_owner active jobs
+        """
+        self.expire_stale()
+        with db_transaction.atomic():
+            # Row locks cannot stop two requests that both see no active jobs;
+            # a per-owner advisory lock serializes the check and the insert
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [owner])
+            active = QueryJob.objects.filter(owner=owner, status__in=QueryJob.ACTIVE_STATUSES).count()
+            if active >= self.max_per_owner:
+                raise JobLimitExceeded(
+                    f'{owner} already has {self.max_per_owner} active jobs; wait for one to finish or cancel it'
+                )
+            job = QueryJob.objects.create(owner=owner, query=query)
+        job_id = str(job.id)
+        future = self.executor.submit(self._run, job_id)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._futures.pop(job_id, None))
+        return job
+
+    def cancel(self, job: QueryJob) -> QueryJob:
+        """Cancel a pending or running job; finished jobs are left untouched"""
+        future = self._futures.get(str(job.id))
+        if future is not None:
+            future.cancel()
+        QueryJob.objects.filter(pk=job.pk, status__in=QueryJob.ACTIVE_STATUSES).update(
+            status='cancelled', finished_at=timezone.now()
+        )
+        job.refresh_from_db()
+        return job
+
+    def expire_stale(self) -> int:
+        """
+        Mark jobs that have been running (or, after a restart, waiting) longer
+        than the timeout as timed out
+        """
+        deadline = timezone.now() - timedelta(seconds=self.timeout)
+        return QueryJob.objects.filter(
+            Q(status='running', started_at__lt=deadline) | Q(status='pending', created_at__lt=deadline)
+        ).update(
+            status='timeout',
+            error=f'Query exceeded the {self.timeout}s job timeout',
+            finished_at=timezone.now(),
+        )
+
+    def _run(self, job_id: str):
+        # The job row was just created; a replica may not have it yet
+        pin_to_primary()
+        close_old_connections()
+        try:
+            started = QueryJob.objects.filter(pk=job_id, status='pending').update(
+                status='running', started_at=timezone.now()
+            )
+            if not started:
+                return
+            job = QueryJob.objects.get(pk=job_id)
+
+            try:
+                results = mindsdb_util.execute_query(job.query)
+            except Exception as e:
+                QueryJob.objects.filter(pk=job_id, status='running').update(
+                    status='failed', error=str(e), finished_at=timezone.now()
+                )
+                return
+
+            with db_transaction.atomic():
+                finished = QueryJob.objects.filter(pk=job_id, status='running').update(
+                    status='succeeded',
+                    row_count=len(results),
+                    columns=list(results[0].keys()) if results else [],
+                    finished_at=timezone.now(),
+                )
+                if finished:
+                    QueryJobRow.objects.bulk_create(
+                        [QueryJobRow(job_id=job_id, position=i, data=row) for i, row in enumerate(results)],
+                        batch_size=1000,
+                    )
+        except Exception as e:
+            print(f"Error running query job {job_id}: {e}")
+            QueryJob.objects.filter(pk=job_id, status='running').update(
+                status='failed', error=str(e), finished_at=timezone.now()
+            )
+        finally:
+            close_old_connections()
+
+
+job_runner = QueryJobRunner(
+    max_workers=getattr(settings, 'MINDSDB_JOB_WORKERS', 4),
+    max_per_owner=getattr(settings, 'MINDSDB_JOB_MAX_PER_USER', 2),
+    timeout=getattr(settings, 'MINDSDB_JOB_TIMEOUT', 300),
+)
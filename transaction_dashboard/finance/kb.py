@@ -0,0 +1,122 @@
+"""
+Row builders for the MindsDB knowledge bases.
+
+These mirror the INSERT ... SELECT statements in docs/gui.sql so that rows
+pushed from Django look the same as rows loaded by MindsDB itself.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.db.models import QuerySet
+
+from .embeddings import embedding_store
+from .mindsdb_util import mindsdb_util
+from .models import Client, ClientProfile, Transaction
+
+
+def client_kb_row(client: Client, profile: Optional[ClientProfile] = None) -> Dict[str, Any]:
+    """
+    Build a client_kb row, enriched with the client's spend profile when available
+
+    The profile features are read from the precomputed ClientProfile row, so
+    per-client analytics can filter on them without aggregating transactions.
+    """
+    metadata = {
+        'id': client.id,
+        'per_capita_income': float(client.per_capita_income),
+        'current_age': client.current_age,
+        'gender': client.gender,
+        'birth_year': client.birth_year,
+    }
+    if profile is not None:
+        metadata.update({f'spend_{k}': v for k, v in profile.to_dict().items()})
+    return {'content': client.address, 'metadata': metadata}
+
+
+def transaction_kb_row(transaction: Transaction) -> Dict[str, Any]:
+    """Build a transaction_kb row"""
+    return {
+        # Online merchants have no state; never embed "ONLINE, None"
+        'content': ', '.join(part for part in (transaction.merchant_city, transaction.merchant_state) if part),
+        'metadata': {
+            'id': transaction.id,
+            'amount': float(transaction.amount),
+            'use_chip': transaction.use_chip,
+            'date': transaction.date.isoformat(),
+            'client_id': transaction.client_id,
+        },
+    }
+
+
+def client_kb_row_with_profile(client: Client) -> Dict[str, Any]:
+    """client_kb row for a client fetched with select_related('profile')"""
+    try:
+        profile = client.profile
+    except ClientProfile.DoesNotExist:
+        profile = None
+    return client_kb_row(client, profile)
+
+
+def kb_source(kb: str, since_id: int = 0) -> Tuple[str, QuerySet, Callable[[Any], Dict[str, Any]]]:
+    """
+    Knowledge base name, source queryset (in id order) and row builder for
+    'transaction' or 'client'
+    """
+    if kb == 'transaction':
+        queryset = Transaction.objects.filter(id__gt=since_id).select_related('merchant').order_by('id')
+        return 'transaction_kb', queryset, transaction_kb_row
+    if kb == 'client':
+        queryset = Client.objects.filter(id__gt=since_id).select_related('profile').order_by('id')
+        return 'client_kb', queryset, client_kb_row_with_profile
+    raise ValueError(f"Unknown knowledge base '{kb}'")
+
+
+def kb_targets(kb_name: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    (knowledge base, vector table) pairs that writes to kb_name go to: the
+    KB it resolves to and, while a rebuild is running, the KB being built
+    """
+    alias = mindsdb_util.kb_alias(kb_name)
+    targets = [(mindsdb_util.resolve_kb(kb_name), mindsdb_util.resolve_vector_table(kb_name))]
+    if alias.get('building_target'):
+        targets.append((alias['building_target'], alias['building_vector_table'] or None))
+    return targets
+
+
+def write_rows(kb_name: str, vector_table: Optional[str], rows: List[Dict[str, Any]]) -> int:
+    """
+    Write rows to one knowledge base, keyed by their source id
+
+    With a vector table, content is embedded through the content-hash cache
+    and rows are written there with their vectors; otherwise MindsDB embeds
+    each row on INSERT.
+
+    Returns:
+        Number of rows written
+    """
+    if not rows:
+        return 0
+    rows = [{'id': row['metadata']['id'], **row} for row in rows]
+    if not vector_table:
+        return mindsdb_util.insert_into_knowledge_base(kb_name, rows)
+
+    vectors = embedding_store.get_many([row['content'] for row in rows])
+    return mindsdb_util.insert_embeddings(vector_table, rows, vectors)
+
+
+def sync_rows(kb_name: str, rows: List[Dict[str, Any]]) -> int:
+    """
+    Write rows to a knowledge base by name
+
+    The rows go to the KB the name resolves to (see MindsDBUtil.resolve_kb)
+    and to the next version while one is being built. Its vector table comes
+    from the alias or MINDSDB_KB_VECTOR_TABLES.
+
+    Returns:
+        Number of rows written
+    """
+    if not rows:
+        return 0
+    written = 0
+    for target, vector_table in kb_targets(kb_name):
+        written = write_rows(target, vector_table, rows)
+    return written
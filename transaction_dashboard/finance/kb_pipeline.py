@@ -0,0 +1,254 @@
+"""
+Parallel, resumable knowledge base loading.
+
+A full KB load is split into three stages connected by bounded
+multiprocessing queues, so a slow stage backs up the ones before it instead
+of buffering the whole table in memory:
+
+    reader (this process)     server-side cursor over Transaction/Client,
+                              cut into batches of batch_size source rows
+    transformers (N procs)    build content + metadata rows (finance.kb)
+    writers (M procs)         write each batch to the KB with sync_rows
+
+Every batch a writer finishes is checkpointed as a KBIngestBatch. Resuming a
+run skips the id ranges that are already checkpointed, so an interrupted load
+picks up where it stopped and failed batches are retried. A batch that fails
+to transform or write is reported back and counted; if a worker process
+dies, the remaining workers are stopped and the run is marked failed rather
+than left waiting on a queue nobody serves.
+
+Worker processes are forked, so the DB connections of this process are
+closed first and each writer reopens its own MindsDB connection.
+"""
+import bisect
+import multiprocessing
+import os
+import queue
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.db import close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+
+from .kb import kb_source, sync_rows, write_rows
+from .mindsdb_util import mindsdb_util
+from .models import KBIngestBatch, KBIngestRun
+
+
+def _transform_worker(kb: str, source_queue, row_queue, result_queue):
+    _, _, to_row = kb_source(kb)
+    while True:
+        batch = source_queue.get()
+        if batch is None:
+            return
+        started = time.monotonic()
+        try:
+            rows = [to_row(obj) for obj in batch]
+        except Exception as e:
+            result_queue.put((batch[0].id, batch[-1].id, 0, time.monotonic() - started, str(e)))
+            continue
+        row_queue.put((batch[0].id, batch[-1].id, rows))
+
+
+def _writer_worker(kb_name: str, target: Optional[Tuple[str, Optional[str]]], row_queue, result_queue):
+    mindsdb_util.connect()
+    try:
+        while True:
+            item = row_queue.get()
+            if item is None:
+                return
+            first_id, last_id, rows = item
+            started = time.monotonic()
+            try:
+                written = write_rows(*target, rows) if target else sync_rows(kb_name, rows)
+                result_queue.put((first_id, last_id, written, time.monotonic() - started, None))
+            except Exception as e:
+                result_queue.put((first_id, last_id, 0, time.monotonic() - started, str(e)))
+    finally:
+        close_old_connections()
+
+
+class _StageDied(Exception):
+    """A worker process exited before it was told to stop"""
+
+
+class _Covered:
+    """Id ranges already checkpointed for a run"""
+
+    def __init__(self, ranges: List[Tuple[int, int]]):
+        self.ranges = sorted(ranges)
+        self.starts = [first for first, _ in self.ranges]
+
+    def __contains__(self, obj_id: int) -> bool:
+        i = bisect.bisect_right(self.starts, obj_id) - 1
+        return i >= 0 and self.ranges[i][1] >= obj_id
+
+
+class KBPipeline:
+    """Reader -> transformers -> writers pipeline for one knowledge base load"""
+
+    def __init__(self, kb: str, batch_size: int = 1000, writers: int = 4,
+                 transformers: Optional[int] = None, queue_size: Optional[int] = None,
+                 progress: Optional[Callable[[Dict], None]] = None, progress_interval: float = 5.0,
+                 target: Optional[Tuple[str, Optional[str]]] = None):
+        """
+        Args:
+            target: (knowledge base, vector table) to load instead of the
+                KBs the name writes to, e.g. a version being rebuilt
+        """
+        self.kb = kb
+        self.target = target
+        self.batch_size = batch_size
+        self.writers = max(1, writers)
+        self.transformers = max(1, transformers or (os.cpu_count() or 2) - 1)
+        # Enough in flight to keep every writer busy, few enough to bound memory
+        self.queue_size = queue_size or 2 * self.writers
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.stats = {'batches': 0, 'rows': 0, 'failed_batches': 0, 'skipped': 0}
+
+    def run(self, since_id: int = 0, resume: Optional[KBIngestRun] = None) -> KBIngestRun:
+        """
+        Load the KB from rows with an id above since_id, or continue an earlier run
+
+        Returns:
+            The KBIngestRun, with status 'succeeded' or 'failed'
+        """
+        kb_name, _, _ = kb_source(self.kb)
+        if self.target:
+            kb_name = self.target[0]
+        if resume is not None:
+            run = resume
+            KBIngestRun.objects.filter(pk=run.pk).update(status='running', failed_batches=0, finished_at=None)
+        else:
+            run = KBIngestRun.objects.create(kb_name=kb_name, since_id=since_id, batch_size=self.batch_size)
+        covered = _Covered(list(run.batches.values_list('first_id', 'last_id')))
+
+        context = multiprocessing.get_context('fork')
+        source_queue = context.Queue(self.queue_size)
+        row_queue = context.Queue(self.queue_size)
+        result_queue = context.Queue()
+
+        connections.close_all()
+        transformers = [
+            context.Process(target=_transform_worker, args=(self.kb, source_queue, row_queue, result_queue),
+                            daemon=True)
+            for _ in range(self.transformers)
+        ]
+        writers = [
+            context.Process(target=_writer_worker, args=(kb_name, self.target, row_queue, result_queue), daemon=True)
+            for _ in range(self.writers)
+        ]
+        self._processes = transformers + writers
+        for process in self._processes:
+            process.start()
+
+        self._started = time.monotonic()
+        self._last_report = self._started
+        try:
+            _, queryset, _ = kb_source(self.kb, run.since_id)
+            batch = []
+            for obj in queryset.iterator(chunk_size=self.batch_size):
+                if obj.id in covered:
+                    self.stats['skipped'] += 1
+                    continue
+                batch.append(obj)
+                if len(batch) >= self.batch_size:
+                    self._put(source_queue, batch, run, result_queue)
+                    batch = []
+            if batch:
+                self._put(source_queue, batch, run, result_queue)
+
+            for _ in transformers:
+                self._put(source_queue, None, run, result_queue)
+            self._wait(transformers, run, result_queue)
+            for _ in writers:
+                self._put(row_queue, None, run, result_queue)
+            self._wait(writers, run, result_queue)
+        except _StageDied as e:
+            # The other stage would block forever on a queue nobody serves
+            print(f"Stopping {kb_name} load: {e}")
+            self._terminate()
+        except BaseException:
+            self._terminate()
+            raise
+        self._drain(run, result_queue)
+
+        # A worker that died took its in-flight batches with it
+        crashed = any(p.exitcode for p in self._processes)
+        run.status = 'failed' if self.stats['failed_batches'] or crashed else 'succeeded'
+        run.finished_at = timezone.now()
+        run.failed_batches = self.stats['failed_batches']
+        run.save(update_fields=['status', 'finished_at', 'failed_batches'])
+        run.refresh_from_db()
+        self._report(run, force=True)
+        return run
+
+    def _put(self, stage_queue, batch, run, result_queue):
+        # Blocks while the next stage is behind (backpressure), recording
+        # finished batches in the meantime
+        while True:
+            self._drain(run, result_queue)
+            self._check_alive()
+            try:
+                stage_queue.put(batch, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _wait(self, processes, run, result_queue):
+        while any(p.is_alive() for p in processes):
+            self._drain(run, result_queue, timeout=0.5)
+            self._check_alive()
+        for process in processes:
+            process.join()
+
+    def _check_alive(self):
+        dead = [p for p in self._processes if p.exitcode]
+        if dead:
+            raise _StageDied(', '.join(f'worker {p.pid} exited with {p.exitcode}' for p in dead))
+
+    def _terminate(self):
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            process.join()
+
+    def _drain(self, run, result_queue, timeout: Optional[float] = None):
+        while True:
+            try:
+                first_id, last_id, written, seconds, error = result_queue.get(timeout=timeout) \
+                    if timeout else result_queue.get_nowait()
+            except queue.Empty:
+                break
+            timeout = None
+            if error:
+                self.stats['failed_batches'] += 1
+                print(f"Error loading {run.kb_name} batch {first_id}-{last_id}: {error}")
+                continue
+            KBIngestBatch.objects.create(
+                run=run, first_id=first_id, last_id=last_id, rows=written, seconds=seconds
+            )
+            KBIngestRun.objects.filter(pk=run.pk).update(rows_written=F('rows_written') + written)
+            self.stats['batches'] += 1
+            self.stats['rows'] += written
+        self._report(run)
+
+    def _report(self, run, force: bool = False):
+        now = time.monotonic()
+        if self.progress is None or (not force and now - self._last_report < self.progress_interval):
+            return
+        self._last_report = now
+        elapsed = max(now - self._started, 1e-9)
+        self.progress({
+            'run_id': run.id,
+            'kb_name': run.kb_name,
+            'batches': self.stats['batches'],
+            'rows': self.stats['rows'],
+            'failed_batches': self.stats['failed_batches'],
+            'skipped': self.stats['skipped'],
+            'elapsed_seconds': round(elapsed, 1),
+            'rows_per_second': round(self.stats['rows'] / elapsed, 1),
+        })
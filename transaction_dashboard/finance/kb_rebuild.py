@@ -0,0 +1,316 @@
+"""
+Blue/green knowledge base rebuilds.
+
+Queries never name a versioned knowledge base: MindsDBUtil.resolve_kb looks
+the name up in KnowledgeBaseAlias, e.g. transaction_kb -> transaction_kb_v7.
+A name without an alias row resolves to itself. rebuild_kb() builds the
+next version next to the live one:
+
+1. CREATE KNOWLEDGE_BASE transaction_kb_v8 and record it as the alias's
+   building target. From then on sync_rows writes new rows to both KBs.
+2. Load every source row into the new KB. Rows are keyed by their source
+   id, so a row written by both the load and ingestion is stored once.
+3. Load rows that arrived in the meantime, until the new KB holds as many
+   rows as the live one and answers a probe search.
+4. Point the alias at the new KB in one database transaction.
+
+Searches read the live KB until the swap, so they keep working while the
+new version fills. The previous KB is kept for rollback_kb() unless the
+rebuild drops it. A rebuild that was interrupted continues into the same
+new KB when run again.
+"""
+import re
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .kb import kb_source, write_rows
+from .kb_pipeline import KBPipeline
+from .mindsdb_util import mindsdb_util
+from .models import KnowledgeBaseAlias
+from .warmup import mark_kb_synced
+
+
+class RebuildError(ValueError):
+    """Raised when a rebuild cannot start, reach parity or swap"""
+
+
+def _alias_ttl() -> float:
+    return getattr(settings, 'FINANCE_KB_ALIAS_TTL', 30)
+
+
+def get_alias(kb_name: str) -> KnowledgeBaseAlias:
+    """The KB's alias row, created pointing at the unversioned KB on first use"""
+    alias, _ = KnowledgeBaseAlias.objects.get_or_create(
+        name=kb_name,
+        defaults={
+            'target': kb_name,
+            'vector_table': getattr(settings, 'MINDSDB_KB_VECTOR_TABLES', {}).get(kb_name, ''),
+        },
+    )
+    return alias
+
+
+def versioned(name: str, version: int) -> str:
+    """transaction_kb, 8 -> transaction_kb_v8; vector_db.t_embeddings_v7, 8 -> vector_db.t_embeddings_v8"""
+    return re.sub(r'(_v\d+)?$', f'_v{version}', name, count=1)
+
+
+def kb_count(kb_name: str) -> int:
+    rows = mindsdb_util.execute_query(f"SELECT COUNT(*) as count FROM {kb_name};")
+    return int(rows[0]['count']) if rows else 0
+
+
+def start_rebuild(kb: str, model: Optional[str] = None, vector_table: Optional[str] = None,
+                  log: Callable[[str], None] = print) -> KnowledgeBaseAlias:
+    """
+    Create the next version of a knowledge base and have writes go to it too
+
+    Continues an unfinished rebuild instead of starting another.
+
+    Args:
+        kb: 'transaction' or 'client'
+        model: Embedding model for the new KB (default: FINANCE_KB_MODEL)
+        vector_table: Vector table for the new KB (default: the live one's
+            with the new version number; none when the live KB has none)
+    """
+    kb_name, _, _ = kb_source(kb)
+    get_alias(kb_name)
+    with db_transaction.atomic():
+        alias = KnowledgeBaseAlias.objects.select_for_update().get(name=kb_name)
+        if alias.building_target:
+            log(f'Continuing the rebuild of {kb_name} into {alias.building_target}')
+            return alias
+        version = alias.version + 1
+        target = versioned(kb_name, version)
+        if vector_table is None and alias.vector_table:
+            vector_table = versioned(alias.vector_table, version)
+        model = model or getattr(settings, 'FINANCE_KB_MODEL', 'sentence_transformers')
+        if vector_table:
+            storage = f"storage = {vector_table}"
+        else:
+            storage = f"embeddings_table = '{versioned(f'{kb}_embeddings', version)}'"
+        mindsdb_util.execute_query(f"CREATE KNOWLEDGE_BASE {target} USING model = '{model}', {storage};")
+        alias.building_target = target
+        alias.building_vector_table = vector_table or ''
+        alias.save(update_fields=['building_target', 'building_vector_table'])
+    mindsdb_util.forget_kb_alias(kb_name)
+    log(f'Created {target}; writes to {kb_name} now also go to it')
+    return alias
+
+
+def fill(kb: str, alias: KnowledgeBaseAlias, since_id: int = 0, batch_size: int = 5000,
+         writers: int = 0, log: Callable[[str], None] = print) -> int:
+    """
+    Load source rows with an id above since_id into the KB being built
+
+    Args:
+        writers: Load through KBPipeline with this many writer processes
+            (0: in this process)
+
+    Returns:
+        The last id loaded (since_id when there was nothing to load)
+    """
+    target = (alias.building_target, alias.building_vector_table or None)
+    _, queryset, to_row = kb_source(kb, since_id)
+    last_id = queryset.values_list('id', flat=True).last() or since_id
+    if writers:
+        pipeline = KBPipeline(
+            kb, batch_size=batch_size, writers=writers, target=target,
+            progress=lambda p: log(f"  {p['rows']} rows, {p['rows_per_second']} rows/s"),
+        )
+        run = pipeline.run(since_id=since_id)
+        if run.status != 'succeeded':
+            raise RebuildError(f'{run.failed_batches} batches failed loading {target[0]}; run the rebuild again')
+        return last_id
+
+    total = 0
+    batch = []
+    for obj in queryset.filter(id__lte=last_id).iterator(chunk_size=batch_size):
+        batch.append(to_row(obj))
+        if len(batch) >= batch_size:
+            total += write_rows(*target, batch)
+            batch = []
+            log(f'  {total} rows written to {target[0]} (last id {obj.id})')
+    total += write_rows(*target, batch)
+    return last_id
+
+
+def parity(alias: KnowledgeBaseAlias, tolerance: float = 0.0) -> Tuple[bool, int, int]:
+    """
+    Whether the KB being built holds as many rows as the live one, less a
+    fraction `tolerance` of them
+
+    Returns:
+        (reached, rows in the new KB, rows in the live KB)
+    """
+    built = kb_count(alias.building_target)
+    live = kb_count(alias.target)
+    return built >= live * (1 - tolerance), built, live
+
+
+def probe(kb: str, alias: KnowledgeBaseAlias) -> bool:
+    """Whether the KB being built finds the first source row's content"""
+    _, queryset, to_row = kb_source(kb)
+    first = queryset.first()
+    if first is None:
+        return True
+    content = str(to_row(first)['content']).replace("'", "''")
+    return bool(mindsdb_util.execute_query(
+        f"SELECT id FROM {alias.building_target} WHERE MATCH('{content}') LIMIT 1;"
+    ))
+
+
+def swap(kb_name: str, expected: str) -> KnowledgeBaseAlias:
+    """
+    Point kb_name at the KB being built, in one database transaction
+
+    Raises:
+        RebuildError: if the alias is no longer building `expected`
+    """
+    with db_transaction.atomic():
+        alias = KnowledgeBaseAlias.objects.select_for_update().get(name=kb_name)
+        if alias.building_target != expected:
+            raise RebuildError(f'{kb_name} is no longer being rebuilt into {expected}')
+        alias.previous_target, alias.previous_vector_table = alias.target, alias.vector_table
+        alias.target, alias.vector_table = alias.building_target, alias.building_vector_table
+        alias.building_target = alias.building_vector_table = ''
+        alias.version = int(alias.target.rsplit('_v', 1)[1])
+        alias.swapped_at = timezone.now()
+        alias.save()
+    mindsdb_util.forget_kb_alias(kb_name)
+    mark_kb_synced()
+    return alias
+
+
+def rollback_kb(kb: str) -> KnowledgeBaseAlias:
+    """
+    Point the KB back at the version it had before the last swap
+
+    Rows ingested since the swap are not in that version; load them with
+    sync_kb --since-id.
+    """
+    kb_name, _, _ = kb_source(kb)
+    with db_transaction.atomic():
+        alias = KnowledgeBaseAlias.objects.select_for_update().get(name=kb_name)
+        if not alias.previous_target:
+            raise RebuildError(f'{kb_name} has no previous version to roll back to')
+        if alias.building_target:
+            raise RebuildError(f'{kb_name} is being rebuilt into {alias.building_target}; abort that first')
+        alias.target, alias.previous_target = alias.previous_target, alias.target
+        alias.vector_table, alias.previous_vector_table = alias.previous_vector_table, alias.vector_table
+        alias.swapped_at = timezone.now()
+        alias.save()
+    mindsdb_util.forget_kb_alias(kb_name)
+    mark_kb_synced()
+    return alias
+
+
+def abort_rebuild(kb: str, drop: bool = True) -> Optional[str]:
+    """
+    Stop writing to the KB being built and, with drop, delete it
+
+    Returns:
+        The abandoned KB, or None when no rebuild was running
+    """
+    kb_name, _, _ = kb_source(kb)
+    with db_transaction.atomic():
+        alias = KnowledgeBaseAlias.objects.select_for_update().filter(name=kb_name).first()
+        if alias is None or not alias.building_target:
+            return None
+        target = alias.building_target
+        alias.building_target = alias.building_vector_table = ''
+        alias.save(update_fields=['building_target', 'building_vector_table'])
+    mindsdb_util.forget_kb_alias(kb_name)
+    if drop:
+        # Processes with a cached alias may still write to it until the TTL passes
+        time.sleep(_alias_ttl())
+        mindsdb_util.execute_query(f"DROP KNOWLEDGE_BASE {target};")
+    return target
+
+
+def finish_rebuild(kb: str, tolerance: float = 0.0, drop_old: bool = False,
+                   log: Callable[[str], None] = print) -> Dict:
+    """
+    Swap in the KB being built if it is at parity and answers a probe search
+
+    Args:
+        drop_old: Drop the previous KB after the swap
+
+    Raises:
+        RebuildError: if no rebuild is running or the new KB is not ready
+    """
+    kb_name, _, _ = kb_source(kb)
+    alias = KnowledgeBaseAlias.objects.filter(name=kb_name).first()
+    if alias is None or not alias.building_target:
+        raise RebuildError(f'{kb_name} is not being rebuilt')
+    target = alias.building_target
+    reached, built, live = parity(alias, tolerance)
+    if not reached:
+        raise RebuildError(
+            f'{target} has {built} rows and {alias.target} {live}; '
+            f'left it building, run the rebuild again to continue or abort it'
+        )
+    if not probe(kb, alias):
+        raise RebuildError(f'{target} returned nothing for a probe search; left it building')
+
+    alias = swap(kb_name, target)
+    log(f'{kb_name} now resolves to {target}')
+    if drop_old and alias.previous_target:
+        # Readers with a cached alias may still query the old KB until the TTL passes
+        time.sleep(_alias_ttl())
+        mindsdb_util.execute_query(f"DROP KNOWLEDGE_BASE {alias.previous_target};")
+        KnowledgeBaseAlias.objects.filter(pk=alias.pk).update(previous_target='', previous_vector_table='')
+        log(f'Dropped {alias.previous_target}')
+    return {'kb': kb_name, 'target': target, 'rows': built, 'live_rows': live, 'swapped': True}
+
+
+def rebuild_kb(kb: str, model: Optional[str] = None, vector_table: Optional[str] = None,
+               batch_size: int = 5000, writers: int = 0, tolerance: float = 0.0, max_rounds: int = 5,
+               swap_when_ready: bool = True, drop_old: bool = False,
+               log: Callable[[str], None] = print) -> Dict:
+    """
+    Build the next version of a knowledge base and swap it in at parity
+
+    Args:
+        kb: 'transaction' or 'client'
+        tolerance: Fraction of the live KB's rows the new one may lack at the swap
+        max_rounds: Catch-up passes over newly arrived rows before giving up
+        swap_when_ready: Swap at parity; otherwise leave the new KB building
+            for finish_rebuild
+        drop_old: Drop the previous KB after the swap
+
+    Returns:
+        Summary with the KB name, new target, row counts and whether it swapped
+
+    Raises:
+        RebuildError: if the new KB does not reach parity
+    """
+    kb_name, _, _ = kb_source(kb)
+    alias = start_rebuild(kb, model=model, vector_table=vector_table, log=log)
+    target = alias.building_target
+
+    # Wait until every process has seen the new alias and writes to both
+    # KBs, so rows committed after the load reads the table are not missed
+    time.sleep(_alias_ttl())
+    log(f'Loading {target}...')
+    last_id = fill(kb, alias, batch_size=batch_size, writers=writers, log=log)
+
+    # Rows that arrived while the load ran
+    for _ in range(max_rounds):
+        reached, built, live = parity(alias, tolerance)
+        log(f'  {target}: {built} rows, {alias.target}: {live} rows')
+        if reached:
+            break
+        caught_up = fill(kb, alias, since_id=last_id, batch_size=batch_size, log=log)
+        if caught_up == last_id:
+            break
+        last_id = caught_up
+
+    if not swap_when_ready:
+        reached, built, live = parity(alias, tolerance)
+        return {'kb': kb_name, 'target': target, 'rows': built, 'live_rows': live, 'swapped': False}
+    return finish_rebuild(kb, tolerance=tolerance, drop_old=drop_old, log=log)
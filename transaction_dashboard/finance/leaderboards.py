@@ -0,0 +1,358 @@
+"""
+Top-N leaderboards kept up to date at ingest time.
+
+Three boards are served for each period in FINANCE_LEADERBOARD_PERIODS (day,
+week or month in settings.TIME_ZONE, or all time):
+
+    transactions   the largest transactions
+    merchants      merchants by spend, optionally within one state
+    clients        clients by spend
+
+Merchant and client spend is rolled up per period in SpendRollup. Each ingest
+batch is summed in Python and folded in with one INSERT ... ON CONFLICT DO
+UPDATE. TopTransaction is a bounded heap. A batch only inserts transactions
+that beat the period's current FINANCE_LEADERBOARD_SIZE-th amount, then trims
+the period back to that size. Reading a board is a short scan of an index
+that is already in rank order, however many transactions the period holds.
+
+Updated or deleted transactions are not folded back out. check_leaderboards
+compares the stored boards with a full recompute, and rebuild_leaderboards
+repairs them.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, router, transaction as db_transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import Merchant, SpendRollup, TopTransaction, Transaction
+
+
+BOARDS = ('transactions', 'merchants', 'clients')
+ALL_TIME = date(1970, 1, 1)
+
+
+class LeaderboardError(ValueError):
+    """Raised for an unknown board or a period that is not maintained"""
+
+
+def get_periods() -> List[str]:
+    return list(getattr(settings, 'FINANCE_LEADERBOARD_PERIODS', ['week', 'month', 'all']))
+
+
+def get_size() -> int:
+    return getattr(settings, 'FINANCE_LEADERBOARD_SIZE', 100)
+
+
+def period_start(period: str, moment) -> date:
+    """First day of the period containing moment (a datetime or date)"""
+    if period == 'all':
+        return ALL_TIME
+    if isinstance(moment, datetime):
+        moment = timezone.localtime(moment).date() if timezone.is_aware(moment) else moment.date()
+    if period == 'week':
+        return moment - timedelta(days=moment.weekday())
+    if period == 'month':
+        return moment.replace(day=1)
+    return moment
+
+
+def period_bounds(period: str, start: date) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Aware datetimes delimiting a period, or (None, None) for all time"""
+    if period == 'all':
+        return None, None
+    if period == 'week':
+        end = start + timedelta(weeks=1)
+    elif period == 'month':
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    else:
+        end = start + timedelta(days=1)
+    to_datetime = lambda d: timezone.make_aware(datetime.combine(d, datetime.min.time()))
+    return to_datetime(start), to_datetime(end)
+
+
+def _upsert_rollups(cursor, rows: List[Tuple]):
+    # Sorted so concurrent batches lock conflicting rows in the same order
+    rows.sort(key=lambda row: row[:4])
+    table = SpendRollup._meta.db_table
+    for i in range(0, len(rows), 1000):
+        page = rows[i:i + 1000]
+        values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(page))
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (period, period_start, dimension, entity_id, state, amount_total, txn_count)
+            VALUES {values}
+            ON CONFLICT (period, period_start, dimension, entity_id) DO UPDATE
+            SET amount_total = {table}.amount_total + EXCLUDED.amount_total,
+                txn_count = {table}.txn_count + EXCLUDED.txn_count
+            """,
+            [value for row in page for value in row],
+        )
+
+
+def _push_top_transactions(cursor, candidates: Dict[Tuple[str, date], List[Transaction]]):
+    size = get_size()
+    table = TopTransaction._meta.db_table
+    keys = tuple(sorted(candidates))
+    cursor.execute(
+        f"SELECT period, period_start, COUNT(*), MIN(amount) FROM {table} "
+        f"WHERE (period, period_start) IN %s GROUP BY 1, 2",
+        [keys],
+    )
+    floors = {(period, start): (count, lowest) for period, start, count, lowest in cursor.fetchall()}
+
+    entries = []
+    overflowing = set()
+    for key, transactions in candidates.items():
+        count, lowest = floors.get(key, (0, None))
+        ranked = sorted(((Decimal(t.amount), t.id) for t in transactions), key=lambda c: (-c[0], c[1]))
+        admitted = [
+            # A full period only admits amounts above its current floor
+            TopTransaction(period=key[0], period_start=key[1], transaction_id=t_id, amount=amount)
+            for amount, t_id in ranked[:size]
+            if count < size or amount > lowest
+        ]
+        entries.extend(admitted)
+        if count + len(admitted) > size:
+            overflowing.add(key)
+    if not entries:
+        return
+    TopTransaction.objects.bulk_create(entries, ignore_conflicts=True)
+    if not overflowing:
+        return
+    cursor.execute(
+        f"""
+        DELETE FROM {table} WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY period, period_start ORDER BY amount DESC, transaction_id
+                ) AS rank
+                FROM {table}
+                WHERE (period, period_start) IN %s
+            ) ranked
+            WHERE rank > %s
+        )
+        """,
+        [tuple(sorted(overflowing)), size],
+    )
+
+
+def update_leaderboards(transactions: Iterable[Transaction]) -> None:
+    """Fold newly stored transactions into the rollups and top-transaction heaps"""
+    transactions = [t for t in transactions if t.id is not None]
+    if not transactions:
+        return
+    periods = get_periods()
+    states = dict(
+        Merchant.objects.filter(id__in={t.merchant_id for t in transactions}).values_list('id', 'state')
+    )
+
+    sums = defaultdict(lambda: [Decimal('0'), 0])
+    candidates = defaultdict(list)
+    for t in transactions:
+        amount = Decimal(t.amount)
+        for period in periods:
+            start = period_start(period, t.date)
+            for key in ((period, start, 'merchant', t.merchant_id, states.get(t.merchant_id, '')),
+                        (period, start, 'client', t.client_id, '')):
+                sums[key][0] += amount
+                sums[key][1] += 1
+            candidates[(period, start)].append(t)
+
+    with db_transaction.atomic():
+        with connections[router.db_for_write(SpendRollup)].cursor() as cursor:
+            _upsert_rollups(cursor, [key + (total, count) for key, (total, count) in sums.items()])
+            _push_top_transactions(cursor, candidates)
+
+
+def _resolve(period: str, on) -> date:
+    if period not in get_periods():
+        raise LeaderboardError(f'period must be one of {", ".join(get_periods())}')
+    return period_start(period, on or timezone.now())
+
+
+def leaderboard(board: str, period: str = 'week', on=None, state: Optional[str] = None,
+                limit: int = 10) -> Dict[str, Any]:
+    """
+    Read one leaderboard
+
+    Args:
+        board: 'transactions', 'merchants' or 'clients'
+        period: One of FINANCE_LEADERBOARD_PERIODS
+        on: Any date or datetime in the period (defaults to now)
+        state: Merchant state, for the merchants board
+        limit: Entries to return, at most FINANCE_LEADERBOARD_SIZE
+
+    Raises:
+        LeaderboardError: for an unknown board or period
+    """
+    if board not in BOARDS:
+        raise LeaderboardError(f'board must be one of {", ".join(BOARDS)}')
+    start = _resolve(period, on)
+    limit = max(1, min(limit, get_size()))
+    result = {'board': board, 'period': period, 'period_start': start, 'state': state}
+
+    if board == 'transactions':
+        top = (
+            TopTransaction.objects.filter(period=period, period_start=start)
+            .select_related('transaction__merchant')
+            .order_by('-amount', 'transaction_id')[:limit]
+        )
+        result['entries'] = [
+            {
+                'rank': rank,
+                'transaction_id': entry.transaction_id,
+                'date': entry.transaction.date.isoformat(),
+                'client_id': entry.transaction.client_id,
+                'amount': float(entry.amount),
+                'merchant_id': entry.transaction.merchant.code,
+                'merchant_city': entry.transaction.merchant_city,
+                'merchant_state': entry.transaction.merchant_state,
+            }
+            for rank, entry in enumerate(top, 1)
+        ]
+        return result
+
+    rollups = SpendRollup.objects.filter(period=period, period_start=start, dimension=board[:-1])
+    if board == 'merchants' and state:
+        rollups = rollups.filter(state=state)
+    rollups = list(rollups.order_by('-amount_total', 'entity_id')[:limit])
+    entries = [
+        {
+            'rank': rank,
+            f'{board[:-1]}_id': rollup.entity_id,
+            'total': float(rollup.amount_total),
+            'transactions': rollup.txn_count,
+        }
+        for rank, rollup in enumerate(rollups, 1)
+    ]
+    if board == 'merchants':
+        merchants = Merchant.objects.in_bulk([r.entity_id for r in rollups])
+        for entry in entries:
+            merchant = merchants.get(entry['merchant_id'])
+            if merchant is not None:
+                entry.update({'code': merchant.code, 'city': merchant.city, 'state': merchant.state or None})
+    result['entries'] = entries
+    return result
+
+
+def _bucket_sql(period: str) -> str:
+    if period == 'all':
+        return "DATE '1970-01-01'"
+    return 'date_trunc(%(period)s, t.date AT TIME ZONE %(tz)s)::date'
+
+
+def rebuild_leaderboards(periods: Optional[List[str]] = None, start: Optional[date] = None) -> Dict[str, int]:
+    """
+    Recompute leaderboards from the transactions table
+
+    Run it with ingest paused. Batches folded in while a rebuild runs can be
+    counted twice.
+
+    Args:
+        periods: Periods to rebuild (all maintained periods by default)
+        start: Rebuild only the period starting on this date
+
+    Returns:
+        Rollup and top-transaction rows written per period
+    """
+    size = get_size()
+    rollup_table = SpendRollup._meta.db_table
+    top_table = TopTransaction._meta.db_table
+    counts = {}
+    for period in periods or get_periods():
+        bucket = _bucket_sql(period)
+        params = {'period': period, 'tz': settings.TIME_ZONE, 'size': size}
+        where = ''
+        scope = {'period': period}
+        if start is not None and period != 'all':
+            scope['period_start'] = period_start(period, start)
+            params['from'], params['to'] = period_bounds(period, scope['period_start'])
+            where = 'WHERE t.date >= %(from)s AND t.date < %(to)s'
+
+        with db_transaction.atomic():
+            SpendRollup.objects.filter(**scope).delete()
+            TopTransaction.objects.filter(**scope).delete()
+            with connections[router.db_for_write(SpendRollup)].cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {rollup_table} (period, period_start, dimension, entity_id, state, amount_total, txn_count)
+                    SELECT %(period)s, {bucket}, 'merchant', t.merchant_id, m.state, SUM(t.amount), COUNT(*)
+                    FROM {Transaction._meta.db_table} t
+                    JOIN {Merchant._meta.db_table} m ON m.id = t.merchant_id
+                    {where}
+                    GROUP BY 2, 4, 5
+                    UNION ALL
+                    SELECT %(period)s, {bucket}, 'client', t.client_id, '', SUM(t.amount), COUNT(*)
+                    FROM {Transaction._meta.db_table} t
+                    {where}
+                    GROUP BY 2, 4
+                    """,
+                    params,
+                )
+                rollups = cursor.rowcount
+                cursor.execute(
+                    f"""
+                    INSERT INTO {top_table} (period, period_start, transaction_id, amount)
+                    SELECT %(period)s, bucket, id, amount FROM (
+                        SELECT t.id, t.amount, {bucket} AS bucket,
+                               row_number() OVER (PARTITION BY {bucket} ORDER BY t.amount DESC, t.id) AS rank
+                        FROM {Transaction._meta.db_table} t
+                        {where}
+                    ) ranked
+                    WHERE rank <= %(size)s
+                    """,
+                    params,
+                )
+                counts[period] = rollups + cursor.rowcount
+    return counts
+
+
+def _recompute(board: str, period: str, start: date, state: Optional[str], limit: int) -> List[Tuple]:
+    transactions = Transaction.objects.order_by()
+    low, high = period_bounds(period, start)
+    if low is not None:
+        transactions = transactions.filter(date__gte=low, date__lt=high)
+    if board == 'transactions':
+        return [
+            (t_id, float(amount))
+            for t_id, amount in transactions.order_by('-amount', 'id').values_list('id', 'amount')[:limit]
+        ]
+    field = 'merchant_id' if board == 'merchants' else 'client_id'
+    if board == 'merchants' and state:
+        transactions = transactions.filter(merchant__state=state)
+    rows = (
+        transactions.values(field)
+        .annotate(total=Sum('amount'), n=Count('id'))
+        .order_by('-total', field)[:limit]
+    )
+    return [(row[field], float(row['total'])) for row in rows]
+
+
+def check_leaderboard(board: str, period: str, on=None, state: Optional[str] = None,
+                      limit: int = 10) -> Dict[str, Any]:
+    """
+    Compare a stored leaderboard with a full recompute from transactions
+
+    Returns:
+        Dict with consistent, the period start and both rankings as
+        (id, amount) pairs
+    """
+    limit = max(1, min(limit, get_size()))
+    stored = leaderboard(board, period, on, state, limit)
+    key = 'transaction_id' if board == 'transactions' else f'{board[:-1]}_id'
+    value = 'amount' if board == 'transactions' else 'total'
+    stored_ranking = [(entry[key], entry[value]) for entry in stored['entries']]
+    expected = _recompute(board, period, stored['period_start'], state, limit)
+    return {
+        'board': board,
+        'period': period,
+        'period_start': stored['period_start'],
+        'consistent': stored_ranking == expected,
+        'stored': stored_ranking,
+        'expected': expected,
+    }
@@ -0,0 +1,176 @@
+"""
+Live dashboard feed pushed to browsers as Server-Sent Events.
+
+One poller thread per process watches PostgreSQL for transactions with an id
+above the last one it has seen and re-counts the knowledge bases every
+FINANCE_LIVE_KB_INTERVAL seconds; anomaly alerts are published directly by the
+ingest buffer. Every event is fanned out to the asyncio queue of each
+connected stream, so the database sees the same few queries however many
+dashboards are open. The thread only runs while someone is subscribed.
+
+Recent events are kept in a small ring buffer so a browser reconnecting with
+Last-Event-ID gets what it missed instead of a gap.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+from .mindsdb_util import mindsdb_util
+from .models import Transaction
+
+
+class Subscriber:
+    """Bounded event queue owned by one streaming response"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_queue: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def deliver(self, event: Dict[str, Any]):
+        # Runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+
+class LiveFeed:
+    """Shared poller fanning dashboard events out to SSE subscribers"""
+
+    def __init__(self, poll_interval: float, kb_interval: float, replay_size: int, max_queue: int):
+        self.poll_interval = poll_interval
+        self.kb_interval = kb_interval
+        self.max_queue = max_queue
+        self.replay = deque(maxlen=replay_size)
+        self.last_transaction_id: Optional[int] = None
+        self.last_kb_event: Optional[Dict[str, Any]] = None
+        self._subscribers: List[Subscriber] = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscriber:
+        """
+        Register a stream on the running event loop
+
+        With last_event_id, buffered events after it are queued straight away;
+        otherwise the stream starts with the latest knowledge base counts.
+        """
+        subscriber = Subscriber(asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self.replay:
+                    if event['id'] > last_event_id:
+                        subscriber.deliver(event)
+            elif self.last_kb_event is not None:
+                subscriber.deliver(self.last_kb_event)
+            self._subscribers.append(subscriber)
+            self._ensure_thread()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, data: Any) -> Dict[str, Any]:
+        """Send an event to every subscriber; safe to call from any thread"""
+        with self._lock:
+            event = {'id': self._next_id, 'event': event_type, 'data': data}
+            self._next_id += 1
+            self.replay.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+            except RuntimeError:
+                # The stream's loop has closed; it unsubscribes on its way out
+                pass
+        return event
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='finance-live', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        since_kb = self.kb_interval
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # The next subscriber starts again from the current tip
+                    self._thread = None
+                    self.last_transaction_id = None
+                    return
+            try:
+                self.poll_transactions()
+                if since_kb >= self.kb_interval:
+                    self.poll_kb_counts()
+                    since_kb = 0
+            except Exception as e:
+                print(f"Error polling live feed: {e}")
+            finally:
+                close_old_connections()
+            time.sleep(self.poll_interval)
+            since_kb += self.poll_interval
+
+    def poll_transactions(self):
+        """Publish transactions created since the previous poll"""
+        if self.last_transaction_id is None:
+            # Start from the current tip; the page already rendered older rows
+            latest = Transaction.objects.order_by('-id').values_list('id', flat=True).first()
+            self.last_transaction_id = latest or 0
+            return
+        batch_size = getattr(settings, 'FINANCE_LIVE_MAX_BATCH', 100)
+        transactions = list(
+            Transaction.objects.filter(id__gt=self.last_transaction_id)
+            .select_related('card', 'merchant')
+            .order_by('id')[:batch_size]
+        )
+        if not transactions:
+            return
+        self.last_transaction_id = transactions[-1].id
+        self.publish('transactions', [
+            {
+                'id': t.id,
+                'date': t.date.isoformat(),
+                'client_id': t.client_id,
+                'card': f"{t.card.card_brand} {t.card.card_type}",
+                'amount': float(t.amount),
+                'merchant_id': t.merchant.code,
+                'merchant_city': t.merchant_city,
+                'merchant_state': t.merchant_state,
+            }
+            for t in transactions
+        ])
+
+    def poll_kb_counts(self):
+        """Publish knowledge base row counts when they change"""
+        counts = mindsdb_util.get_knowledge_base_stats()
+        if self.last_kb_event is None or counts != self.last_kb_event['data']:
+            self.last_kb_event = self.publish('kb_counts', counts)
+
+
+def format_event(event: Dict[str, Any]) -> str:
+    """Serialize an event in text/event-stream framing"""
+    data = json.dumps(event['data'], cls=DjangoJSONEncoder)
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+
+live_feed = LiveFeed(
+    poll_interval=getattr(settings, 'FINANCE_LIVE_POLL_INTERVAL', 2.0),
+    kb_interval=getattr(settings, 'FINANCE_LIVE_KB_INTERVAL', 30.0),
+    replay_size=getattr(settings, 'FINANCE_LIVE_REPLAY_SIZE', 200),
+    max_queue=getattr(settings, 'FINANCE_LIVE_MAX_QUEUE', 100),
+)
@@ -0,0 +1,264 @@
+"""
+Columnar transaction loading for Python-side analytics.
+
+Instead of instantiating a Transaction (with Decimal amounts and aware
+datetimes) per row, the loader asks PostgreSQL for plain integers and
+strings over a server-side cursor and packs each chunk into typed NumPy
+arrays:
+
+    id, client_id, card_id, mcc    int64 / int32
+    date                           datetime64[s] (UTC)
+    amount_cents                   int64
+    use_chip, merchant_state,
+    merchant_city                  int32 codes into per-loader vocabularies (-1 for NULL)
+
+Fully loaded result sets can be written to FINANCE_ARRAY_CACHE_DIR as .npy
+files and reopened memory-mapped, and are reused in-process for
+FINANCE_ARRAY_CACHE_TTL seconds. Both caches are keyed by the query and the
+table's data version (newest id, PostgreSQL's count of deleted rows and the
+archive manifest's updated_at), so inserts, deletes and archiving runs all
+start a new snapshot without counting the table.
+The directory keeps the FINANCE_ARRAY_CACHE_ENTRIES most recently used
+snapshots.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Max, QuerySet, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import NullIf
+
+from .archive import read_manifest
+from .models import Transaction
+
+
+NUMERIC_COLUMNS = {
+    'id': np.int64,
+    'date': 'datetime64[s]',
+    'client_id': np.int64,
+    'card_id': np.int64,
+    'amount_cents': np.int64,
+    'mcc': np.int32,
+}
+CATEGORICAL_COLUMNS = ('use_chip', 'merchant_state', 'merchant_city')
+
+
+class Vocabulary:
+    """Stable string -> int32 code mapping shared by all chunks of one load (NULL is -1)"""
+
+    def __init__(self, values: Optional[List[str]] = None):
+        self.values: List[str] = list(values or [])
+        self._codes: Dict[str, int] = {v: i for i, v in enumerate(self.values)}
+
+    def encode(self, column) -> np.ndarray:
+        codes = np.empty(len(column), dtype=np.int32)
+        for i, value in enumerate(column):
+            if value is None:
+                codes[i] = -1
+                continue
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self.values)
+                self.values.append(value)
+            codes[i] = code
+        return codes
+
+
+class TransactionArrays:
+    """A set of transactions held as parallel typed arrays"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], vocabularies: Dict[str, Vocabulary]):
+        self.columns = columns
+        self.vocabularies = vocabularies
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    @property
+    def amounts(self) -> np.ndarray:
+        """Amounts in dollars as float64"""
+        return self.columns['amount_cents'] / 100.0
+
+    def decode(self, name: str) -> np.ndarray:
+        """Categorical column as an object array of strings"""
+        # The trailing None is what code -1 indexes
+        values = np.array(self.vocabularies[name].values + [None], dtype=object)
+        return values[self.columns[name]]
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame view with pandas categoricals for the coded columns"""
+        data = {name: self.columns[name] for name in NUMERIC_COLUMNS}
+        for name in CATEGORICAL_COLUMNS:
+            data[name] = pd.Categorical.from_codes(
+                self.columns[name],
+                categories=pd.Index(self.vocabularies[name].values, dtype=object),
+            )
+        return pd.DataFrame(data)
+
+    @classmethod
+    def concatenate(cls, chunks: List['TransactionArrays'], vocabularies: Dict[str, Vocabulary]):
+        names = list(NUMERIC_COLUMNS) + list(CATEGORICAL_COLUMNS)
+        if not chunks:
+            return cls({n: np.empty(0, dtype=NUMERIC_COLUMNS.get(n, np.int32)) for n in names}, vocabularies)
+        return cls({n: np.concatenate([c.columns[n] for c in chunks]) for n in names}, vocabularies)
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self.columns.items():
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+        with open(os.path.join(directory, 'vocabularies.json'), 'w') as f:
+            json.dump({name: vocab.values for name, vocab in self.vocabularies.items()}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'TransactionArrays':
+        with open(os.path.join(directory, 'vocabularies.json')) as f:
+            vocabularies = {name: Vocabulary(values) for name, values in json.load(f).items()}
+        columns = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r' if mmap else None)
+            for name in list(NUMERIC_COLUMNS) + list(CATEGORICAL_COLUMNS)
+        }
+        return cls(columns, vocabularies)
+
+
+def _column_query(queryset: QuerySet):
+    table = Transaction._meta.db_table
+    return (
+        queryset.order_by('id')
+        .annotate(
+            _epoch=RawSQL(f'EXTRACT(EPOCH FROM "{table}"."date")::bigint', ()),
+            _cents=RawSQL(f'ROUND("{table}"."amount" * 100)::bigint', ()),
+            _mcc=F('merchant__mcc'),
+            _state=NullIf('merchant__state', Value('')),
+            _city=F('merchant__city'),
+        )
+        .values_list('id', '_epoch', 'client_id', 'card_id', '_cents', '_mcc', 'use_chip', '_state', '_city')
+    )
+
+
+def iter_transaction_chunks(queryset: Optional[QuerySet] = None, chunk_size: int = 100000,
+                            vocabularies: Optional[Dict[str, Vocabulary]] = None) -> Iterator[TransactionArrays]:
+    """
+    Stream transactions as TransactionArrays of up to chunk_size rows
+
+    Args:
+        queryset: Transaction queryset to load (all transactions by default)
+        chunk_size: Rows fetched from the server-side cursor per chunk
+        vocabularies: Shared vocabularies, so codes stay consistent across chunks
+    """
+    queryset = Transaction.objects.all() if queryset is None else queryset
+    vocabularies = vocabularies if vocabularies is not None else {n: Vocabulary() for n in CATEGORICAL_COLUMNS}
+    sql, params = _column_query(queryset).query.sql_with_params()
+
+    connection = connections[queryset.db]
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            ids, epochs, clients, cards, cents, mcc, *categorical = zip(*rows)
+            columns = {
+                'id': np.array(ids, dtype=np.int64),
+                'date': np.array(epochs, dtype=np.int64).astype('datetime64[s]'),
+                'client_id': np.array(clients, dtype=np.int64),
+                'card_id': np.array(cards, dtype=np.int64),
+                'amount_cents': np.array(cents, dtype=np.int64),
+                'mcc': np.array(mcc, dtype=np.int32),
+            }
+            for name, values in zip(CATEGORICAL_COLUMNS, categorical):
+                columns[name] = vocabularies[name].encode(values)
+            yield TransactionArrays(columns, vocabularies)
+
+
+_memory_cache: Dict[str, tuple] = {}
+_lock = threading.Lock()
+
+
+def _deleted_rows(alias: str) -> Optional[int]:
+    # PostgreSQL's cumulative delete counter for the table: one catalog row,
+    # unlike COUNT(*), which scans the table
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT n_tup_del FROM pg_stat_user_tables WHERE relid = %s::regclass', [Transaction._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _cache_key(queryset: QuerySet) -> str:
+    sql, params = _column_query(queryset).query.sql_with_params()
+    # MAX(id) (an index lookup) moves on inserts, the delete counter on
+    # deletes and the manifest timestamp on every archiving run
+    last_id = Transaction.objects.using(queryset.db).aggregate(m=Max('id'))['m']
+    deleted = _deleted_rows(queryset.db)
+    archived_at = read_manifest().get('updated_at')
+    return hashlib.sha1(f'{sql}|{params}|{last_id}|{deleted}|{archived_at}'.encode()).hexdigest()
+
+
+def _prune_disk_cache(cache_dir: str, entries: int):
+    # Oldest first by last use; open memory maps survive the unlink
+    snapshots = sorted(
+        (entry for entry in os.scandir(cache_dir) if entry.is_dir()),
+        key=lambda entry: entry.stat().st_mtime, reverse=True,
+    )
+    for entry in snapshots[entries:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def load_transactions(queryset: Optional[QuerySet] = None, chunk_size: int = 100000,
+                      use_cache: bool = True) -> TransactionArrays:
+    """
+    Load transactions into a single TransactionArrays
+
+    With use_cache, the result is reused in-process for FINANCE_ARRAY_CACHE_TTL
+    seconds and, when FINANCE_ARRAY_CACHE_DIR is set, persisted as .npy files
+    that later loads open memory-mapped instead of querying PostgreSQL.
+    """
+    queryset = Transaction.objects.all() if queryset is None else queryset
+    if not use_cache:
+        vocabularies = {n: Vocabulary() for n in CATEGORICAL_COLUMNS}
+        return TransactionArrays.concatenate(
+            list(iter_transaction_chunks(queryset, chunk_size, vocabularies)), vocabularies
+        )
+
+    key = _cache_key(queryset)
+    ttl = getattr(settings, 'FINANCE_ARRAY_CACHE_TTL', 300)
+    with _lock:
+        cached = _memory_cache.get(key)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+
+    cache_dir = getattr(settings, 'FINANCE_ARRAY_CACHE_DIR', None)
+    directory = os.path.join(cache_dir, key) if cache_dir else None
+    entries = getattr(settings, 'FINANCE_ARRAY_CACHE_ENTRIES', 8)
+    if directory and os.path.exists(os.path.join(directory, 'vocabularies.json')):
+        arrays = TransactionArrays.load(directory)
+        os.utime(directory)
+    else:
+        arrays = load_transactions(queryset, chunk_size, use_cache=False)
+        if directory:
+            arrays.save(directory)
+            arrays = TransactionArrays.load(directory)
+            _prune_disk_cache(cache_dir, entries)
+
+    with _lock:
+        _memory_cache[key] = (time.monotonic(), arrays)
+        while len(_memory_cache) > entries:
+            oldest = min(_memory_cache, key=lambda k: _memory_cache[k][0])
+            del _memory_cache[oldest]
+    return arrays
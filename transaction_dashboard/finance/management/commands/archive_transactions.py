@@ -0,0 +1,33 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from finance.archive import ArchiveError, archive_dir, archive_transactions
+
+
+class Command(BaseCommand):
+    help = 'Move transactions older than a cutoff into monthly Parquet files (FINANCE_ARCHIVE_DIR)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=parse_date, required=True,
+                            help='Archive transactions dated before this day (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int,
+                            help='Rows moved per database transaction (default: FINANCE_ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the transactions that would be archived')
+
+    def handle(self, *args, **options):
+        before = timezone.make_aware(datetime.combine(options['before'], time.min))
+        self.stdout.write(f'Archiving transactions before {before:%Y-%m-%d} to {archive_dir()}...')
+        try:
+            counts = archive_transactions(
+                before, batch_size=options['batch_size'], dry_run=options['dry_run'], log=self.stdout.write
+            )
+        except ArchiveError as e:
+            raise CommandError(str(e))
+        for month, rows in sorted(counts.items()):
+            self.stdout.write(f'  {month}: {rows} transactions')
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {sum(counts.values())} transactions'))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils.dateparse import parse_date
+
+from finance.leaderboards import BOARDS, check_leaderboard, get_periods, rebuild_leaderboards
+from finance.models import Transaction
+
+
+class Command(BaseCommand):
+    help = 'Compare the stored leaderboards with a full recompute from the transactions table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', action='append', choices=['day', 'week', 'month', 'all'],
+                            help='Period to check (repeatable; default: all of FINANCE_LEADERBOARD_PERIODS)')
+        parser.add_argument('--date', type=parse_date,
+                            help='Check the periods containing this date (default: the latest transaction)')
+        parser.add_argument('--limit', type=int, default=10, help='Ranks to compare per board')
+        parser.add_argument('--state', help='Also check the merchants board within this state')
+        parser.add_argument('--repair', action='store_true',
+                            help='Rebuild periods that do not match')
+
+    def handle(self, *args, **options):
+        on = options['date'] or Transaction.objects.aggregate(latest=Max('date'))['latest']
+        if on is None:
+            self.stdout.write('No transactions to check')
+            return
+
+        mismatched = set()
+        for period in options['period'] or get_periods():
+            checks = [(board, None) for board in BOARDS]
+            if options['state']:
+                checks.append(('merchants', options['state']))
+            for board, state in checks:
+                result = check_leaderboard(board, period, on, state=state, limit=options['limit'])
+                label = f"{period} {result['period_start']} {board}" + (f' ({state})' if state else '')
+                if result['consistent']:
+                    self.stdout.write(f'  {label}: ok')
+                    continue
+                mismatched.add((period, result['period_start']))
+                self.stdout.write(self.style.ERROR(f'  {label}: mismatch'))
+                self.stdout.write(f"    stored:   {result['stored']}")
+                self.stdout.write(f"    expected: {result['expected']}")
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('Leaderboards are consistent'))
+            return
+        if not options['repair']:
+            self.stdout.write(self.style.WARNING(f'{len(mismatched)} period(s) differ; rerun with --repair'))
+            return
+        for period, start in sorted(mismatched):
+            rebuild_leaderboards([period], start=start)
+            self.stdout.write(f'  rebuilt {period} {start}')
+        self.stdout.write(self.style.SUCCESS(f'Repaired {len(mismatched)} period(s)'))
@@ -3,6 +3,7 @@ from django.utils import timezone
 from datetime import date, timedelta
 import random
 from decimal import Decimal
+from finance.merchants import merchant_cache
 from finance.models import Client, Card, Transaction
 
 
@@ -95,10 +96,12 @@ class Command(BaseCommand):
                     card=card,
                     amount=Decimal(str(random.uniform(10, 500))),
                     use_chip=random.choice([True, False]),
-                    merchant_id=random.choice(merchants),
-                    merchant_city=merchant_city,
-                    merchant_state=merchant_state,
-                    zip=str(random.randint(10000, 99999))
+                    merchant=merchant_cache.resolve(
+                        code=random.choice(merchants),
+                        city=merchant_city,
+                        state=merchant_state,
+                        zip=str(random.randint(10000, 99999)),
+                    )
                 )
                 transactions.append(transaction)
         
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.snapshots import SnapshotError, import_snapshot, read_snapshot_manifest, snapshot_dir
+from finance.warmup import mark_kb_synced
+
+
+class Command(BaseCommand):
+    help = 'Load a knowledge base snapshot back into its vector table without re-embedding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kb', choices=['transaction', 'client'], default='transaction',
+                            help='Knowledge base to restore (default: transaction)')
+        parser.add_argument('--input', help='Snapshot directory (default: FINANCE_KB_SNAPSHOT_DIR/<kb name>)')
+        parser.add_argument('--vector-table',
+                            help="Table to write to (default: the KB's MINDSDB_KB_VECTOR_TABLES entry)")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows per INSERT statement (default: 500)')
+        parser.add_argument('--allow-model-mismatch', action='store_true',
+                            help='Import even if the snapshot was embedded with another MINDSDB_EMBEDDING_MODEL')
+
+    def handle(self, *args, **options):
+        kb_name = f"{options['kb']}_kb"
+        source = options['input'] or snapshot_dir(kb_name)
+        self.stdout.write(f'Importing {source} into {kb_name}...')
+        try:
+            if read_snapshot_manifest(source)['kb'] != kb_name and not options['vector_table']:
+                raise SnapshotError(f'{source} is not a {kb_name} snapshot; pass --vector-table to load it anyway')
+            manifest = import_snapshot(
+                source,
+                vector_table=options['vector_table'],
+                batch_size=options['batch_size'],
+                allow_model_mismatch=options['allow_model_mismatch'],
+                log=self.stdout.write,
+            )
+        except SnapshotError as e:
+            raise CommandError(str(e))
+        mark_kb_synced()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Restored {manifest['rows']} rows from a snapshot taken at {manifest['created_at']}; "
+                f"run sync_kb --kb {options['kb']} --since-id {manifest['max_id']} for newer rows"
+            )
+        )
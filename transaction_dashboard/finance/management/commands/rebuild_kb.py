@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.kb_rebuild import RebuildError, abort_rebuild, finish_rebuild, rebuild_kb, rollback_kb
+
+
+class Command(BaseCommand):
+    help = 'Build the next version of a knowledge base alongside the live one and swap to it at parity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kb', choices=['transaction', 'client'], default='transaction',
+                            help='Knowledge base to rebuild (default: transaction)')
+        parser.add_argument('--model', help='Embedding model of the new KB (default: FINANCE_KB_MODEL)')
+        parser.add_argument('--vector-table',
+                            help="Vector table of the new KB (default: the live KB's, with the new version number)")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of rows per batch (default: 5000)')
+        parser.add_argument('--writers', type=int, default=0,
+                            help='Load through the multi-process pipeline with this many writers (default: 0, '
+                                 'load in this process)')
+        parser.add_argument('--tolerance', type=float, default=0.0,
+                            help="Fraction of the live KB's rows the new one may lack at the swap (default: 0)")
+        parser.add_argument('--no-swap', action='store_true',
+                            help='Load the new KB but leave it building; swap later with --swap')
+        parser.add_argument('--swap', action='store_true',
+                            help='Swap in the KB being built if it has reached parity, without loading')
+        parser.add_argument('--drop-old', action='store_true',
+                            help='Drop the previous KB after the swap (it is kept for --rollback otherwise)')
+        parser.add_argument('--rollback', action='store_true',
+                            help='Point the KB back at the version it had before the last swap')
+        parser.add_argument('--abort', action='store_true',
+                            help='Stop an unfinished rebuild and drop the KB it was building')
+
+    def handle(self, *args, **options):
+        try:
+            if options['rollback']:
+                alias = rollback_kb(options['kb'])
+                self.stdout.write(self.style.SUCCESS(
+                    f'{alias.name} resolves to {alias.target} again; load rows ingested since the swap '
+                    f'with sync_kb --kb {options["kb"]} --since-id <last id>'
+                ))
+                return
+            if options['abort']:
+                target = abort_rebuild(options['kb'])
+                if target is None:
+                    raise CommandError(f"No rebuild of the {options['kb']} knowledge base is running")
+                self.stdout.write(self.style.SUCCESS(f'Dropped {target}'))
+                return
+
+            if options['swap']:
+                summary = finish_rebuild(
+                    options['kb'], tolerance=options['tolerance'], drop_old=options['drop_old'],
+                    log=self.stdout.write,
+                )
+            else:
+                summary = rebuild_kb(
+                    options['kb'],
+                    model=options['model'],
+                    vector_table=options['vector_table'],
+                    batch_size=options['batch_size'],
+                    writers=options['writers'],
+                    tolerance=options['tolerance'],
+                    swap_when_ready=not options['no_swap'],
+                    drop_old=options['drop_old'],
+                    log=self.stdout.write,
+                )
+        except RebuildError as e:
+            raise CommandError(str(e))
+
+        if summary['swapped']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{summary['kb']} now resolves to {summary['target']} ({summary['rows']} rows)"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Loaded {summary['rows']} rows into {summary['target']} ({summary['live_rows']} live); "
+                f"swap it in with rebuild_kb --kb {options['kb']} --swap"
+            ))
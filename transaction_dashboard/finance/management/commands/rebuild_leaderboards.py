@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from finance.leaderboards import get_periods, rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = 'Recompute the top-N leaderboards from the transactions table (pause ingest while it runs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', action='append', choices=['day', 'week', 'month', 'all'],
+                            help='Period to rebuild (repeatable; default: all of FINANCE_LEADERBOARD_PERIODS)')
+        parser.add_argument('--date', type=parse_date,
+                            help='Only rebuild the period containing this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        periods = options['period'] or get_periods()
+        self.stdout.write(f"Rebuilding leaderboards for {', '.join(periods)}...")
+        counts = rebuild_leaderboards(periods, start=options['date'])
+        for period, rows in counts.items():
+            self.stdout.write(f'  {period}: {rows} rows')
+        self.stdout.write(self.style.SUCCESS('Leaderboards rebuilt'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from finance.profiles import rebuild_profiles
+
+
+class Command(BaseCommand):
+    help = 'Recompute client and card spend profiles from the transactions table'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding spend profiles...')
+        counts = rebuild_profiles()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {counts['client_profiles']} client profiles and "
+                f"{counts['card_profiles']} card profiles"
+            )
+        )
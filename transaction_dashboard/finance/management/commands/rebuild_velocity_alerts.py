@@ -0,0 +1,34 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from finance.velocity import get_rules, rebuild_alerts
+
+
+class Command(BaseCommand):
+    help = 'Recompute velocity alerts from the transactions table in one vectorized pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rule', action='append',
+                            help='Rule to rebuild (repeatable; default: all of FINANCE_VELOCITY_RULES)')
+        parser.add_argument('--since', type=parse_date,
+                            help='Only rebuild alerts for transactions on or after this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        rules = get_rules()
+        if options['rule']:
+            unknown = set(options['rule']) - {rule.name for rule in rules}
+            if unknown:
+                raise CommandError(f"Unknown rule(s): {', '.join(sorted(unknown))}")
+            rules = [rule for rule in rules if rule.name in options['rule']]
+
+        since = None
+        if options['since']:
+            since = timezone.make_aware(datetime.combine(options['since'], time.min))
+        self.stdout.write(f"Rebuilding velocity alerts for {', '.join(rule.name for rule in rules)}...")
+        counts = rebuild_alerts(rules, since=since)
+        for name, alerts in counts.items():
+            self.stdout.write(f'  {name}: {alerts} alerts')
+        self.stdout.write(self.style.SUCCESS('Velocity alerts rebuilt'))
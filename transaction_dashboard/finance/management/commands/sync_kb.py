@@ -0,0 +1,118 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.embeddings import embedding_store
+from finance.kb import kb_source, sync_rows
+from finance.kb_pipeline import KBPipeline
+from finance.models import KBIngestRun
+from finance.warmup import mark_kb_synced
+
+
+class Command(BaseCommand):
+    help = 'Load clients or transactions into their MindsDB knowledge base, reusing cached embeddings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kb',
+            choices=['transaction', 'client'],
+            default='transaction',
+            help='Knowledge base to load (default: transaction)'
+        )
+        parser.add_argument(
+            '--since-id',
+            type=int,
+            default=0,
+            help='Only load rows with an id greater than this (default: 0)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of rows per batch (default: 5000)'
+        )
+        parser.add_argument(
+            '--parallel',
+            action='store_true',
+            help='Load through the multi-process pipeline, checkpointing every batch'
+        )
+        parser.add_argument(
+            '--writers',
+            type=int,
+            default=4,
+            help='Parallel writer processes for --parallel (default: 4)'
+        )
+        parser.add_argument(
+            '--transformers',
+            type=int,
+            default=None,
+            help='Transform processes for --parallel (default: CPU count - 1)'
+        )
+        parser.add_argument(
+            '--resume',
+            type=int,
+            nargs='?',
+            const=-1,
+            default=None,
+            help='Continue a --parallel run, skipping checkpointed batches (default: the latest unfinished run)'
+        )
+
+    def handle(self, *args, **options):
+        if options['parallel'] or options['resume'] is not None:
+            return self._handle_parallel(options)
+
+        batch_size = options['batch_size']
+        kb_name, queryset, to_row = kb_source(options['kb'], options['since_id'])
+        self.stdout.write(f'Syncing {kb_name} from id {options["since_id"]}...')
+
+        total = 0
+        batch = []
+        for obj in queryset.iterator(chunk_size=batch_size):
+            batch.append(to_row(obj))
+            if len(batch) >= batch_size:
+                total += sync_rows(kb_name, batch)
+                batch = []
+                self.stdout.write(f'  {total} rows written (last id {obj.id})')
+        total += sync_rows(kb_name, batch)
+        mark_kb_synced()
+
+        stats = embedding_store.stats
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {total} rows to {kb_name}: {stats['embedded']} strings embedded, "
+                f"{stats['memory_hits'] + stats['db_hits']} served from the embedding cache"
+            )
+        )
+
+    def _handle_parallel(self, options):
+        kb_name, _, _ = kb_source(options['kb'])
+        resume = None
+        if options['resume'] is not None:
+            runs = KBIngestRun.objects.filter(kb_name=kb_name).exclude(status='succeeded')
+            if options['resume'] != -1:
+                runs = runs.filter(pk=options['resume'])
+            resume = runs.first()
+            if resume is None:
+                raise CommandError(f'No unfinished {kb_name} run to resume')
+            self.stdout.write(f'Resuming {kb_name} run {resume.id} ({resume.rows_written} rows already written)...')
+        else:
+            self.stdout.write(f'Loading {kb_name} from id {options["since_id"]} in parallel...')
+
+        pipeline = KBPipeline(
+            options['kb'],
+            batch_size=options['batch_size'],
+            writers=options['writers'],
+            transformers=options['transformers'],
+            progress=lambda p: self.stdout.write(
+                f"  {p['rows']} rows in {p['batches']} batches, {p['rows_per_second']} rows/s"
+                + (f", {p['failed_batches']} failed" if p['failed_batches'] else '')
+            ),
+        )
+        run = pipeline.run(since_id=options['since_id'], resume=resume)
+        mark_kb_synced()
+
+        if run.status == 'succeeded':
+            self.stdout.write(self.style.SUCCESS(f'Run {run.id}: wrote {run.rows_written} rows to {kb_name}'))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'Run {run.id} finished with {run.failed_batches} failed batches; '
+                f'rerun with --resume {run.id} to retry them'
+            ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from finance.warmup import warm_all
+
+
+class Command(BaseCommand):
+    help = "Run the MindsDB dashboard's default queries and store the results in the cache"
+
+    def handle(self, *args, **options):
+        self.stdout.write('Warming dashboard queries...')
+        timings = warm_all()
+        for method, seconds in timings.items():
+            if seconds is None:
+                self.stdout.write(self.style.ERROR(f'  {method}: failed'))
+            else:
+                self.stdout.write(f'  {method}: {seconds}s')
+        self.stdout.write(self.style.SUCCESS('Dashboard cache warmed'))
@@ -0,0 +1,81 @@
+"""
+Lookup of merchant dimension rows by natural key.
+
+Ingestion sees merchants as (code, city, state, zip, mcc) tuples. The cache
+maps those tuples to Merchant ids for the lifetime of the process, so only
+merchants that have never been seen before cost a round trip; new ones are
+inserted in bulk with ON CONFLICT DO NOTHING, which keeps concurrent writers
+from creating duplicates.
+"""
+import threading
+from typing import Dict, Iterable, Tuple
+
+from .models import Merchant
+
+
+MerchantKey = Tuple[str, str, str, str, int]
+
+
+def merchant_key(code, city, state=None, zip=None, mcc=None) -> MerchantKey:
+    """Normalize raw merchant fields into the dimension's natural key"""
+    return (
+        str(code or ''),
+        str(city or ''),
+        str(state or ''),
+        str(zip or ''),
+        int(mcc) if mcc not in (None, '') else 1000,
+    )
+
+
+class MerchantCache:
+    """Process-wide natural key -> Merchant mapping"""
+
+    def __init__(self, max_size: int = 200000):
+        self.max_size = max_size
+        self._by_key: Dict[MerchantKey, Merchant] = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._by_key.clear()
+
+    def resolve(self, code, city, state=None, zip=None, mcc=None) -> Merchant:
+        """Merchant for one set of raw fields, creating it if needed"""
+        key = merchant_key(code, city, state, zip, mcc)
+        return self.resolve_many([key])[key]
+
+    def resolve_many(self, keys: Iterable[MerchantKey]) -> Dict[MerchantKey, Merchant]:
+        """Merchants for a batch of natural keys, creating the missing ones"""
+        keys = set(keys)
+        with self._lock:
+            found = {k: self._by_key[k] for k in keys if k in self._by_key}
+        missing = keys - set(found)
+        if missing:
+            Merchant.objects.bulk_create(
+                [Merchant(code=k[0], city=k[1], state=k[2], zip=k[3], mcc=k[4]) for k in missing],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            found.update(self._fetch(missing))
+            with self._lock:
+                if len(self._by_key) + len(missing) > self.max_size:
+                    self._by_key.clear()
+                self._by_key.update({k: found[k] for k in missing})
+        return found
+
+    def _fetch(self, keys) -> Dict[MerchantKey, Merchant]:
+        # bulk_create(ignore_conflicts=True) does not return ids, so read them
+        # back, narrowing by code first to use merchants_code_idx
+        merchants = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            wanted = set(batch)
+            for merchant in Merchant.objects.filter(code__in={k[0] for k in batch}):
+                key = (merchant.code, merchant.city, merchant.state, merchant.zip, merchant.mcc)
+                if key in wanted:
+                    merchants[key] = merchant
+        return merchants
+
+
+merchant_cache = MerchantCache()
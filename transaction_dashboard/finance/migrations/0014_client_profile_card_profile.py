@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0013_alter_transaction_merchant_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardProfile',
+            fields=[
+                ('txn_count', models.BigIntegerField(default=0)),
+                ('amount_mean', models.FloatField(default=0)),
+                ('amount_m2', models.FloatField(default=0)),
+                ('amount_total', models.FloatField(default=0)),
+                ('chip_count', models.BigIntegerField(default=0)),
+                ('state_mask', models.BigIntegerField(default=0)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('card', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profile', serialize=False, to='finance.card')),
+            ],
+            options={
+                'db_table': 'card_profile',
+            },
+        ),
+        migrations.CreateModel(
+            name='ClientProfile',
+            fields=[
+                ('txn_count', models.BigIntegerField(default=0)),
+                ('amount_mean', models.FloatField(default=0)),
+                ('amount_m2', models.FloatField(default=0)),
+                ('amount_total', models.FloatField(default=0)),
+                ('chip_count', models.BigIntegerField(default=0)),
+                ('state_mask', models.BigIntegerField(default=0)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profile', serialize=False, to='finance.client')),
+            ],
+            options={
+                'db_table': 'client_profile',
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:02
+
+import django.core.serializers.json
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0014_client_profile_card_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('owner', models.CharField(db_index=True, max_length=150)),
+                ('query', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('cancelled', 'Cancelled'), ('timeout', 'Timed Out')], db_index=True, default='pending', max_length=10)),
+                ('error', models.TextField(blank=True, default='')),
+                ('row_count', models.IntegerField(default=0)),
+                ('columns', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'query_job',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='QueryJobRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='finance.queryjob')),
+            ],
+            options={
+                'db_table': 'query_job_row',
+                'ordering': ['job', 'position'],
+                'constraints': [models.UniqueConstraint(fields=('job', 'position'), name='query_job_row_position')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0015_query_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['current_age', 'per_capita_income'], name='client_age_income_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['amount'], name='transactions_amount_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0016_prefilter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=100)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('content', models.TextField()),
+                ('dimensions', models.IntegerField()),
+                ('vector', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'embedding_cache',
+                'constraints': [models.UniqueConstraint(fields=('model_name', 'content_hash'), name='embedding_cache_model_hash')],
+            },
+        ),
+    ]
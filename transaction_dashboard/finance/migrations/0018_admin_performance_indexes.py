@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:07
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0017_embedding_cache'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-date', 'id'], name='transactions_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['merchant_id'], name='transactions_merchant_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['merchant_state'], name='transactions_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['merchant_city'], name='transactions_city_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:20
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0018_admin_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Merchant',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('code', models.CharField(max_length=50)),
+                ('city', models.CharField(max_length=100)),
+                ('state', models.CharField(blank=True, default='', max_length=100)),
+                ('zip', models.CharField(blank=True, default='', max_length=10)),
+                ('mcc', models.IntegerField(default=1000)),
+            ],
+            options={
+                'db_table': 'merchants',
+                'ordering': ['id'],
+                'indexes': [
+                    models.Index(fields=['code'], name='merchants_code_idx'),
+                    models.Index(fields=['state'], name='merchants_state_idx'),
+                    django.contrib.postgres.indexes.GinIndex(fields=['city'], name='merchants_city_trgm', opclasses=['gin_trgm_ops']),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('code', 'city', 'state', 'zip', 'mcc'), name='merchants_natural_key'),
+                ],
+            },
+        ),
+        # The Kaggle merchant id is kept as merchant_code until the backfill
+        # below has run, freeing the merchant_id column name for the foreign key
+        migrations.RenameField(
+            model_name='transaction',
+            old_name='merchant_id',
+            new_name='merchant_code',
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='merchant',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='finance.merchant'),
+        ),
+        migrations.RunSQL(
+            sql="""
+            INSERT INTO merchants (code, city, state, zip, mcc)
+            SELECT DISTINCT merchant_code, merchant_city, COALESCE(merchant_state, ''), COALESCE(zip, ''), mcc
+            FROM transactions
+            ON CONFLICT DO NOTHING;
+
+            UPDATE transactions AS t
+            SET merchant_id = m.id
+            FROM merchants AS m
+            WHERE m.code = t.merchant_code
+              AND m.city = t.merchant_city
+              AND m.state = COALESCE(t.merchant_state, '')
+              AND m.zip = COALESCE(t.zip, '')
+              AND m.mcc = t.mcc;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Original transactions column layout, for MindsDB (django_db.transactions_flat)
+# and ad-hoc SQL that predates the merchant dimension
+FLAT_VIEW_SQL = """
+CREATE VIEW transactions_flat AS
+SELECT
+    t.id,
+    t.date,
+    t.client_id,
+    t.card_id,
+    t.amount,
+    t.use_chip,
+    m.code AS merchant_id,
+    m.city AS merchant_city,
+    NULLIF(m.state, '') AS merchant_state,
+    NULLIF(m.zip, '') AS zip,
+    m.mcc,
+    t.errors
+FROM transactions AS t
+JOIN merchants AS m ON m.id = t.merchant_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0019_merchant_dimension'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transactions_merchant_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transactions_state_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transactions_city_trgm',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='merchant_code',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='merchant_city',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='merchant_state',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='zip',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='mcc',
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='merchant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='finance.merchant'),
+        ),
+        migrations.RunSQL(
+            sql=FLAT_VIEW_SQL,
+            reverse_sql='DROP VIEW IF EXISTS transactions_flat;',
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0020_drop_transaction_merchant_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KBIngestRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kb_name', models.CharField(max_length=100)),
+                ('since_id', models.BigIntegerField(default=0)),
+                ('batch_size', models.IntegerField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='running', max_length=10)),
+                ('rows_written', models.BigIntegerField(default=0)),
+                ('failed_batches', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'kb_ingest_run',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='KBIngestBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.BigIntegerField()),
+                ('last_id', models.BigIntegerField()),
+                ('rows', models.IntegerField()),
+                ('seconds', models.FloatField()),
+                ('written_at', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='finance.kbingestrun')),
+            ],
+            options={
+                'db_table': 'kb_ingest_batch',
+                'ordering': ['run', 'first_id'],
+                'constraints': [models.UniqueConstraint(fields=('run', 'first_id'), name='kb_ingest_batch_first_id')],
+            },
+        ),
+    ]
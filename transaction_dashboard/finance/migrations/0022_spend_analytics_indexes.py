@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:29
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Built without locking transactions against writes
+    atomic = False
+
+    dependencies = [
+        ('finance', '0021_kb_ingest_checkpoints'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['date'], include=('amount', 'merchant', 'card', 'use_chip'), name='transactions_date_cov'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['client', 'date'], include=('amount', 'merchant', 'card', 'use_chip'), name='transactions_client_date_cov'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0022_spend_analytics_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month'), ('all', 'All Time')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('dimension', models.CharField(choices=[('merchant', 'Merchant'), ('client', 'Client')], max_length=8)),
+                ('entity_id', models.BigIntegerField()),
+                ('state', models.CharField(blank=True, default='', max_length=100)),
+                ('amount_total', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('txn_count', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'spend_rollup',
+                'indexes': [models.Index(fields=['period', 'period_start', 'dimension', '-amount_total'], name='spend_rollup_top_idx'), models.Index(fields=['period', 'period_start', 'dimension', 'state', '-amount_total'], name='spend_rollup_state_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start', 'dimension', 'entity_id'), name='spend_rollup_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TopTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month'), ('all', 'All Time')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='finance.transaction')),
+            ],
+            options={
+                'db_table': 'top_transaction',
+                'indexes': [models.Index(fields=['period', 'period_start', '-amount'], name='top_transaction_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start', 'transaction'), name='top_transaction_key')],
+            },
+        ),
+    ]
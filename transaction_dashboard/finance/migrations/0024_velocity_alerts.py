@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0023_leaderboards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VelocityAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule', models.CharField(max_length=50)),
+                ('date', models.DateTimeField()),
+                ('value', models.FloatField()),
+                ('threshold', models.FloatField()),
+                ('window_seconds', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='finance.card')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='finance.client')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='velocity_alerts', to='finance.transaction')),
+            ],
+            options={
+                'db_table': 'velocity_alert',
+                'ordering': ['-date', 'id'],
+                'indexes': [models.Index(fields=['-date'], name='velocity_alert_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('rule', 'transaction'), name='velocity_alert_rule_transaction')],
+            },
+        ),
+    ]
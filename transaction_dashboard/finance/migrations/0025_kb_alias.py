@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0024_velocity_alerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeBaseAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('target', models.CharField(max_length=100)),
+                ('vector_table', models.CharField(blank=True, max_length=200)),
+                ('version', models.IntegerField(default=1)),
+                ('building_target', models.CharField(blank=True, max_length=100)),
+                ('building_vector_table', models.CharField(blank=True, max_length=200)),
+                ('previous_target', models.CharField(blank=True, max_length=100)),
+                ('previous_vector_table', models.CharField(blank=True, max_length=200)),
+                ('swapped_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'kb_alias',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0025_kb_alias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='merchant',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # 'simple' keeps place names and street words as they are (no stemming
+        # or stop words); weights rank city over state over ZIP/merchant id
+        migrations.RunSQL(
+            sql="""
+            CREATE FUNCTION merchants_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector :=
+                    setweight(to_tsvector('simple', coalesce(NEW.city, '')), 'A') ||
+                    setweight(to_tsvector('simple', coalesce(NEW.state, '')), 'B') ||
+                    setweight(to_tsvector('simple', coalesce(NEW.zip, '') || ' ' || coalesce(NEW.code, '')), 'C');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER merchants_search_vector_trigger
+            BEFORE INSERT OR UPDATE OF code, city, state, zip ON merchants
+            FOR EACH ROW EXECUTE FUNCTION merchants_search_vector_update();
+
+            CREATE FUNCTION client_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := setweight(to_tsvector('simple', coalesce(NEW.address, '')), 'A');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER client_search_vector_trigger
+            BEFORE INSERT OR UPDATE OF address ON client
+            FOR EACH ROW EXECUTE FUNCTION client_search_vector_update();
+
+            -- Fill existing rows through the triggers, before the indexes are built
+            UPDATE merchants SET city = city;
+            UPDATE client SET address = address;
+            """,
+            reverse_sql="""
+            DROP TRIGGER IF EXISTS merchants_search_vector_trigger ON merchants;
+            DROP FUNCTION IF EXISTS merchants_search_vector_update();
+            DROP TRIGGER IF EXISTS client_search_vector_trigger ON client;
+            DROP FUNCTION IF EXISTS client_search_vector_update();
+            """,
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='client_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['address'], name='client_address_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='merchant',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='merchants_search_idx'),
+        ),
+    ]
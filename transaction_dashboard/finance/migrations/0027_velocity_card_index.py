@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-20 09:12
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Built without locking transactions against writes
+    atomic = False
+
+    dependencies = [
+        ('finance', '0026_search_vectors'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['card', 'date'], include=('amount', 'merchant', 'client'), name='transactions_card_date_cov'),
+        ),
+    ]
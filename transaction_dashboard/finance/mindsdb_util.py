@@ -1,9 +1,16 @@
+import json
 import os
 from typing import List, Dict, Any, Optional
 from django.conf import settings
-from django.db import models
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, models
 import mindsdb_sdk
-from .models import Transaction, Client, Card
+import pandas as pd
+from .models import CHIP_VALUES, Transaction, Client, Card, KnowledgeBaseAlias
+from .planner import plan_search
+from .projection import select_list
+from .query_guard import clamp_limit
 
 
 class MindsDBUtil:
@@ -13,6 +20,15 @@ class MindsDBUtil:
     
     def __init__(self):
         """Initialize the MindsDB connection using mindsdb_sdk"""
+        self.connect()
+    
+    def connect(self):
+        """
+        (Re)open the MindsDB connection
+
+        Forked worker processes call this so they do not share the parent's
+        HTTP session.
+        """
         try:
             # Get MindsDB connection parameters from environment or settings
             host = getattr(settings, 'MINDSDB_HOST', 'localhost')
@@ -42,6 +58,44 @@ class MindsDBUtil:
             self.connection = None
             self.server = None
     
+    def kb_alias(self, name: str) -> Dict[str, str]:
+        """
+        The alias row for a knowledge base name, {} when it has none
+
+        Cached for FINANCE_KB_ALIAS_TTL seconds; forget_kb_alias drops the
+        cached copy after a swap.
+        """
+        key = f'finance:kb_alias:{name}'
+        alias = cache.get(key)
+        if alias is None:
+            try:
+                alias = KnowledgeBaseAlias.objects.filter(name=name).values(
+                    'target', 'vector_table', 'building_target', 'building_vector_table'
+                ).first() or {}
+            except DatabaseError as e:
+                print(f"Error reading knowledge base alias for {name}: {e}")
+                return {}
+            cache.set(key, alias, getattr(settings, 'FINANCE_KB_ALIAS_TTL', 30))
+        return alias
+    
+    def forget_kb_alias(self, name: str):
+        cache.delete(f'finance:kb_alias:{name}')
+    
+    def resolve_kb(self, name: str) -> str:
+        """
+        The knowledge base that queries of `name` read, e.g. transaction_kb -> transaction_kb_v7
+
+        Names without an alias row resolve to themselves.
+        """
+        return self.kb_alias(name).get('target') or name
+    
+    def resolve_vector_table(self, name: str) -> Optional[str]:
+        """Vector table of the knowledge base `name` resolves to (None when it has none)"""
+        alias = self.kb_alias(name)
+        if alias:
+            return alias['vector_table'] or None
+        return getattr(settings, 'MINDSDB_KB_VECTOR_TABLES', {}).get(name)
+    
     def execute_query(self, query: str) -> List[Dict[str, Any]]:
         """
         Execute a MindsDB SQL query and return results
@@ -72,13 +126,25 @@ class MindsDBUtil:
             print(f"Error executing query: {e}")
             raise
     
-    def find_wealthy_clients(self, min_age: int = 40, min_income: float = 70000) -> List[Dict[str, Any]]:
+    def find_wealthy_clients(self, min_age: int = 40, min_income: float = 70000,
+                             limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Find clients in wealthy areas with age and income filtering
         
         Note: This assumes your client_kb has columns: id, address, current_age, per_capita_income, gender
         You may need to adjust based on your actual KB schema
-        """
+        
+        Selective age/income filters are resolved against the indexed client
+        table first and the KB is searched by id only (see finance.planner).
+        """
+        plan = plan_search(Client.objects.filter(current_age__gt=min_age, per_capita_income__gt=min_income))
+        if plan.prefiltered:
+            if not plan.ids:
+                return []
+            where_clause = plan.id_condition('c.id')
+        else:
+            where_clause = f"c.current_age > {min_age} AND c.per_capita_income > {min_income}"
+        
         query = f"""
         SELECT
             c.id AS client_id,
@@ -87,21 +153,38 @@ class MindsDBUtil:
             c.per_capita_income,
             c.gender
         FROM
-            client_kb AS c
+            {self.resolve_kb('client_kb')} AS c
         WHERE
-            c.current_age > {min_age} AND                    
-            c.per_capita_income > {min_income};
+            {where_clause}
+        LIMIT {clamp_limit(limit)};
         """
         return self.execute_query(query)
     
-    def find_travel_expenses(self, min_amount: float = 500, use_chip: bool = True) -> List[Dict[str, Any]]:
+    def find_travel_expenses(self, min_amount: float = 500, use_chip: bool = True,
+                             limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Find transactions related to travel with amount and chip usage filtering
         
         Note: This assumes your transaction_kb has appropriate columns
-        """
-        # Use proper boolean value for MindsDB
-        chip_value = 'true' if use_chip else 'false'
+        
+        Selective amount filters are resolved against the indexed transactions
+        table first and the KB is searched by id only (see finance.planner).
+        """
+        candidates = Transaction.objects.filter(amount__gt=min_amount)
+        if use_chip:
+            candidates = candidates.filter(use_chip__in=CHIP_VALUES)
+        else:
+            candidates = candidates.exclude(use_chip__in=CHIP_VALUES)
+        plan = plan_search(candidates)
+        if plan.prefiltered:
+            if not plan.ids:
+                return []
+            where_clause = plan.id_condition('t.id')
+        else:
+            # Use proper boolean value for MindsDB
+            chip_value = 'true' if use_chip else 'false'
+            where_clause = f"t.amount > {min_amount} AND t.use_chip = {chip_value}"
+        
         query = f"""
         SELECT
             t.id AS transaction_id,
@@ -112,14 +195,14 @@ class MindsDBUtil:
             t.use_chip,
             t.client_id
         FROM
-            transaction_kb AS t
+            {self.resolve_kb('transaction_kb')} AS t
         WHERE
-            t.amount > {min_amount} AND                   
-            t.use_chip = {chip_value};
+            {where_clause}
+        LIMIT {clamp_limit(limit)};
         """
         return self.execute_query(query)
     
-    def find_online_shopping(self, state: str = 'California') -> List[Dict[str, Any]]:
+    def find_online_shopping(self, state: str = 'California', limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Find transactions for online shopping in a specific state
         """
@@ -131,45 +214,50 @@ class MindsDBUtil:
             t.merchant_state,
             t.client_id
         FROM
-            transaction_kb AS t
+            {self.resolve_kb('transaction_kb')} AS t
         WHERE
-            t.merchant_state = '{state}';
+            t.merchant_state = '{state}'
+        LIMIT {clamp_limit(limit)};
         """
         return self.execute_query(query)
     
-    def semantic_search_transactions(self, search_term: str, limit: int = 10) -> List[Dict[str, Any]]:
+    def semantic_search_transactions(self, search_term: str, limit: int = 10,
+                                fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
         Perform semantic search on transaction knowledge base
         
         Args:
             search_term: Natural language search term (e.g., "suspicious activity", "travel expenses")
             limit: Maximum number of results to return
+            fields: Columns to return (see finance.projection; default: what the dashboard shows)
         """
         query = f"""
         SELECT 
-            *
-        FROM transaction_kb 
+            {select_list('transaction', fields)}
+        FROM {self.resolve_kb('transaction_kb')} 
         WHERE 
             MATCH('{search_term}')
-        LIMIT {limit};
+        LIMIT {clamp_limit(limit)};
         """
         return self.execute_query(query)
     
-    def semantic_search_clients(self, search_term: str, limit: int = 10) -> List[Dict[str, Any]]:
+    def semantic_search_clients(self, search_term: str, limit: int = 10,
+                                fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
         Perform semantic search on client knowledge base
         
         Args:
             search_term: Natural language search term (e.g., "wealthy suburban areas")
             limit: Maximum number of results to return
+            fields: Columns to return (see finance.projection; default: what the dashboard shows)
         """
         query = f"""
         SELECT 
-            *
-        FROM client_kb 
+            {select_list('client', fields)}
+        FROM {self.resolve_kb('client_kb')} 
         WHERE 
             MATCH('{search_term}')
-        LIMIT {limit};
+        LIMIT {clamp_limit(limit)};
         """
         return self.execute_query(query)
     
@@ -208,7 +296,7 @@ class MindsDBUtil:
             t.client_id,
             p.risk_score,
             p.risk_reason
-        FROM transaction_kb t
+        FROM {self.resolve_kb('transaction_kb')} t
         JOIN pattern_analysis_model p ON t.id = p.transaction_id
         {where_clause}
         ORDER BY p.risk_score DESC;
@@ -220,8 +308,8 @@ class MindsDBUtil:
         Get statistics about the knowledge bases
         """
         try:
-            client_count = self.execute_query("SELECT COUNT(*) as count FROM client_kb;")
-            transaction_count = self.execute_query("SELECT COUNT(*) as count FROM transaction_kb;")
+            client_count = self.execute_query(f"SELECT COUNT(*) as count FROM {self.resolve_kb('client_kb')};")
+            transaction_count = self.execute_query(f"SELECT COUNT(*) as count FROM {self.resolve_kb('transaction_kb')};")
             
             return {
                 'client_kb_count': client_count[0]['count'] if client_count else 0,
@@ -235,7 +323,9 @@ class MindsDBUtil:
                              search_term: str, 
                              kb_type: str = 'transaction',
                              filters: Dict[str, Any] = None,
-                             limit: int = 10) -> List[Dict[str, Any]]:
+                             limit: int = 10,
+                             offset: int = 0,
+                             fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
         Perform custom semantic search on knowledge bases with optional filters
         
@@ -243,15 +333,29 @@ class MindsDBUtil:
             search_term: Natural language search term
             kb_type: 'transaction' or 'client'
             filters: Dictionary of filters to apply
-            limit: Maximum number of results
+            limit: Maximum number of results (capped at MINDSDB_MAX_ROWS)
+            offset: Number of results to skip, for paging
+            fields: Columns to return (see finance.projection; default: what the dashboard shows)
             
         Returns:
             List of matching results
         """
-        kb_name = f"{kb_type}_kb"
+        kb_name = self.resolve_kb(f"{kb_type}_kb")
+        
+        # Build the base semantic search query, selecting only the requested fields
+        query = f"SELECT {select_list(kb_type, fields)} FROM {kb_name} WHERE MATCH('{search_term}')"
         
-        # Build the base semantic search query
-        query = f"SELECT * FROM {kb_name} WHERE MATCH('{search_term}')"
+        # Filters on real model columns may be resolved in PostgreSQL first
+        model = {'transaction': Transaction, 'client': Client}.get(kb_type)
+        if filters and model is not None:
+            candidates = self._prefilter_queryset(model, filters)
+            if candidates is not None:
+                plan = plan_search(candidates)
+                if plan.prefiltered:
+                    if not plan.ids:
+                        return []
+                    query += f" AND {plan.id_condition('id')}"
+                    filters = None
         
         # Add filters if provided
         if filters:
@@ -269,9 +373,140 @@ class MindsDBUtil:
             if filter_conditions:
                 query += " AND " + " AND ".join(filter_conditions)
         
-        query += f" LIMIT {limit};"
+        query += f" LIMIT {clamp_limit(limit)} OFFSET {max(0, int(offset))};"
         return self.execute_query(query)
     
+    @staticmethod
+    def _prefilter_queryset(model, filters: Dict[str, Any]) -> Optional[models.QuerySet]:
+        """
+        Queryset equivalent to the metadata filters, or None when PostgreSQL
+        cannot evaluate them the way MindsDB would
+
+        Every key must be a concrete column and every value must convert to
+        that column's type; otherwise the filters stay a metadata WHERE
+        clause. use_chip is stored as its label, so a boolean maps to
+        CHIP_VALUES.
+        """
+        columns = {f.attname: f for f in model._meta.concrete_fields}
+        conditions = models.Q()
+        for key, value in filters.items():
+            field = columns.get(key)
+            if field is None:
+                return None
+            if key == 'use_chip' and isinstance(value, bool):
+                chip = models.Q(use_chip__in=CHIP_VALUES)
+                conditions &= chip if value else ~chip
+                continue
+            if isinstance(value, bool) and not isinstance(field, models.BooleanField):
+                return None
+            try:
+                value = field.get_prep_value(field.to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                return None
+            conditions &= models.Q(**{key: value})
+        return model.objects.filter(conditions)
+
+    def insert_into_knowledge_base(self, kb_name: str, rows: List[Dict[str, Any]], batch_size: int = 1000) -> int:
+        """
+        Insert rows into a knowledge base
+
+        Args:
+            kb_name: Knowledge base to insert into (e.g. 'transaction_kb')
+            rows: Dictionaries with 'content' and 'metadata' keys, and optionally
+                'id' (a row inserted again with the same id replaces the first)
+            batch_size: Number of rows per INSERT statement
+
+        Returns:
+            Number of rows sent
+        """
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            with_ids = all('id' in row for row in batch)
+            values = ",\n".join(
+                "({}'{}', '{}')".format(
+                    f"'{row['id']}', " if with_ids else '',
+                    str(row['content']).replace("'", "''"),
+                    json.dumps(row['metadata'], default=str).replace("'", "''"),
+                )
+                for row in batch
+            )
+            columns = 'id, content, metadata' if with_ids else 'content, metadata'
+            self.execute_query(f"INSERT INTO {kb_name} ({columns}) VALUES {values};")
+        return len(rows)
+    
+    def embed_texts(self, texts: List[str], model_name: str) -> List[List[float]]:
+        """
+        Compute embeddings for a batch of strings with a MindsDB embedding model
+
+        Args:
+            texts: Strings to embed
+            model_name: MindsDB model returning an embedding per 'content' value
+
+        Returns:
+            One vector per input string, in input order
+        """
+        if not self.connection:
+            raise Exception("MindsDB connection not available")
+        
+        column = getattr(settings, 'MINDSDB_EMBEDDING_COLUMN', 'embeddings')
+        predictions = self.connection.models.get(model_name).predict(pd.DataFrame({'content': texts}))
+        vectors = []
+        for value in predictions[column]:
+            vectors.append(json.loads(value) if isinstance(value, str) else list(value))
+        return vectors
+    
+    def insert_embeddings(self, table: str, rows: List[Dict[str, Any]], vectors: List[Any],
+                          batch_size: int = 500) -> int:
+        """
+        Insert rows with precomputed vectors into a knowledge base's vector table
+
+        Args:
+            table: Fully qualified vector table (e.g. 'vector_db.transaction_embeddings')
+            rows: Dictionaries with 'id', 'content' and 'metadata' keys
+            vectors: One embedding per row
+            batch_size: Number of rows per INSERT statement
+
+        Returns:
+            Number of rows sent
+        """
+        for start in range(0, len(rows), batch_size):
+            values = ",\n".join(
+                "('{}', '{}', '{}', '{}')".format(
+                    row['id'],
+                    str(row['content']).replace("'", "''"),
+                    json.dumps([round(float(x), 6) for x in vector]),
+                    json.dumps(row['metadata'], default=str).replace("'", "''"),
+                )
+                for row, vector in zip(rows[start:start + batch_size], vectors[start:start + batch_size])
+            )
+            self.execute_query(f"INSERT INTO {table} (id, content, embeddings, metadata) VALUES {values};")
+        return len(rows)
+
+    def read_vector_table(self, table: str, after_id: Optional[int] = None, limit: int = 5000) -> List[Dict[str, Any]]:
+        """
+        Read rows with their vectors from a knowledge base's vector table, in id order
+
+        Args:
+            table: Fully qualified vector table (e.g. 'vector_db.transaction_embeddings')
+            after_id: Only rows with a larger id (for paging)
+            limit: Maximum number of rows
+
+        Returns:
+            Dictionaries with 'id', 'content', 'embeddings' (a list of floats)
+            and 'metadata' (a dict)
+        """
+        where = f"WHERE CAST(id AS INTEGER) > {int(after_id)}" if after_id is not None else ""
+        rows = self.execute_query(
+            f"SELECT id, content, embeddings, metadata FROM {table} {where} "
+            f"ORDER BY CAST(id AS INTEGER) LIMIT {int(limit)};"
+        )
+        for row in rows:
+            if isinstance(row['embeddings'], str):
+                row['embeddings'] = json.loads(row['embeddings'])
+            if isinstance(row['metadata'], str):
+                row['metadata'] = json.loads(row['metadata'])
+        return rows
+
     def test_connection(self) -> bool:
         """
         Test if MindsDB connection is working
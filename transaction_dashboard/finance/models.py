@@ -1,3 +1,8 @@
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 # Create your models here.
@@ -17,10 +22,17 @@ class Client(models.Model):
     total_debt = models.DecimalField(max_digits=12, decimal_places=2)
     credit_score = models.IntegerField(default=0)
     num_credit_cards = models.IntegerField(default=0)
+    # Maintained by a database trigger from address (see finance.search)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         db_table = 'client'
         ordering = ['id']
+        indexes = [
+            models.Index(fields=['current_age', 'per_capita_income'], name='client_age_income_idx'),
+            GinIndex(fields=['search_vector'], name='client_search_idx'),
+            GinIndex(fields=['address'], opclasses=['gin_trgm_ops'], name='client_address_trgm'),
+        ]
     
     def __str__(self):
         return f"Client {self.id}"
@@ -63,8 +75,43 @@ class Card(models.Model):
         return f"Card {self.id} - {self.card_brand} {self.card_type}"
 
 
+class Merchant(models.Model):
+    """
+    Merchant dimension: one row per distinct merchant/location/category.
+
+    Transactions reference it through a small integer key instead of repeating
+    the merchant id, city, state, ZIP and MCC on every row. Missing state and
+    ZIP are stored as '' so the natural key can be enforced as unique.
+    """
+    id = models.AutoField(primary_key=True)
+    code = models.CharField(max_length=50)
+    city = models.CharField(max_length=100)
+    state = models.CharField(max_length=100, blank=True, default='')
+    zip = models.CharField(max_length=10, blank=True, default='')
+    mcc = models.IntegerField(default=1000)
+    # Maintained by a database trigger from city, state, ZIP and code (see finance.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        db_table = 'merchants'
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['code', 'city', 'state', 'zip', 'mcc'], name='merchants_natural_key'),
+        ]
+        indexes = [
+            models.Index(fields=['code'], name='merchants_code_idx'),
+            models.Index(fields=['state'], name='merchants_state_idx'),
+            GinIndex(fields=['city'], opclasses=['gin_trgm_ops'], name='merchants_city_trgm'),
+            GinIndex(fields=['search_vector'], name='merchants_search_idx'),
+        ]
+
+    def __str__(self):
+        location = f"{self.city}, {self.state}" if self.state else self.city
+        return f"Merchant {self.code} - {location}"
+
+
 class Transaction(models.Model):
-    """Transaction model linked to clients and cards"""
+    """Transaction model linked to clients, cards and merchants"""
 
     CHIP_CHOICES = [
         ('chip', 'Chip Transaction'),
@@ -74,18 +121,401 @@ class Transaction(models.Model):
     date = models.DateTimeField()
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='transactions')
     card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='transactions')
+    merchant = models.ForeignKey(Merchant, on_delete=models.PROTECT, related_name='transactions')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     use_chip = models.CharField(default="Chip Transaction", choices=CHIP_CHOICES)
-    merchant_id = models.CharField(max_length=50)
-    merchant_city = models.CharField(max_length=100)
-    merchant_state = models.CharField(max_length=100, null=True, blank=True)
-    zip = models.CharField(max_length=10, null=True, blank=True)
-    mcc = models.IntegerField(default=1000)
     errors = models.CharField(max_length=200, null=True, blank=True)
 
     class Meta:
         db_table = 'transactions'
         ordering = ['-date', 'id']
+        indexes = [
+            models.Index(fields=['amount'], name='transactions_amount_idx'),
+            models.Index(fields=['-date', 'id'], name='transactions_date_id_idx'),
+            # Covering indexes for the spend analytics (finance.analytics)
+            models.Index(
+                fields=['date'], include=['amount', 'merchant', 'card', 'use_chip'],
+                name='transactions_date_cov',
+            ),
+            models.Index(
+                fields=['client', 'date'], include=['amount', 'merchant', 'card', 'use_chip'],
+                name='transactions_client_date_cov',
+            ),
+            # Velocity windows reloaded per ingest batch (finance.velocity)
+            models.Index(
+                fields=['card', 'date'], include=['amount', 'merchant', 'client'],
+                name='transactions_card_date_cov',
+            ),
+        ]
     
     def __str__(self):
         return f"Transaction {self.id} - ${self.amount} on {self.date}"
+
+    # Denormalized merchant fields, read through the merchant dimension.
+    # Use select_related('merchant') when iterating over many transactions.
+
+    @property
+    def merchant_code(self):
+        return self.merchant.code
+
+    @property
+    def merchant_city(self):
+        return self.merchant.city
+
+    @property
+    def merchant_state(self):
+        return self.merchant.state or None
+
+    @property
+    def zip(self):
+        return self.merchant.zip or None
+
+    @property
+    def mcc(self):
+        return self.merchant.mcc
+
+
+# Two-letter codes that get their own bit in SpendProfile.state_mask. Anything
+# else with a state (the Kaggle data uses country names for foreign merchants)
+# shares FOREIGN_STATE_BIT; online transactions have no state and set no bit.
+US_STATE_CODES = [
+    'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'HI', 'ID',
+    'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO',
+    'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA',
+    'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY',
+]
+FOREIGN_STATE_BIT = 62
+CHIP_VALUES = ('chip', 'Chip Transaction')
+
+
+def state_bit(state):
+    """Return the state_mask bit for a merchant state, or 0 if it has none"""
+    if not state:
+        return 0
+    code = state.strip().upper()
+    if code in US_STATE_CODES:
+        return 1 << US_STATE_CODES.index(code)
+    return 1 << FOREIGN_STATE_BIT
+
+
+class SpendProfile(models.Model):
+    """
+    Fixed-width spend aggregates kept up to date as transactions arrive.
+
+    Mean and variance are maintained with Welford's algorithm (amount_m2 is the
+    running sum of squared deviations) so batches can be merged without
+    rescanning the transactions table.
+    """
+    txn_count = models.BigIntegerField(default=0)
+    amount_mean = models.FloatField(default=0)
+    amount_m2 = models.FloatField(default=0)
+    amount_total = models.FloatField(default=0)
+    chip_count = models.BigIntegerField(default=0)
+    state_mask = models.BigIntegerField(default=0)
+    last_seen = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def amount_stddev(self):
+        if self.txn_count < 2:
+            return 0.0
+        return (self.amount_m2 / (self.txn_count - 1)) ** 0.5
+
+    @property
+    def chip_ratio(self):
+        return self.chip_count / self.txn_count if self.txn_count else 0.0
+
+    @property
+    def distinct_states(self):
+        return bin(self.state_mask).count('1')
+
+    def merge(self, count, mean, m2, total, chip_count, state_mask, last_seen):
+        """Fold the aggregates of a batch of transactions into this profile"""
+        if not count:
+            return
+        combined = self.txn_count + count
+        delta = mean - self.amount_mean
+        self.amount_m2 += m2 + delta * delta * self.txn_count * count / combined
+        self.amount_mean += delta * count / combined
+        self.txn_count = combined
+        self.amount_total += total
+        self.chip_count += chip_count
+        self.state_mask |= state_mask
+        if last_seen and (self.last_seen is None or last_seen > self.last_seen):
+            self.last_seen = last_seen
+
+    def to_dict(self):
+        return {
+            'txn_count': self.txn_count,
+            'amount_mean': round(self.amount_mean, 2),
+            'amount_stddev': round(self.amount_stddev, 2),
+            'amount_total': round(self.amount_total, 2),
+            'chip_ratio': round(self.chip_ratio, 4),
+            'distinct_states': self.distinct_states,
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
+        }
+
+
+class ClientProfile(SpendProfile):
+    """Per-client spend features"""
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, primary_key=True, related_name='profile')
+
+    class Meta:
+        db_table = 'client_profile'
+
+    def __str__(self):
+        return f"Profile for Client {self.client_id}"
+
+
+class CardProfile(SpendProfile):
+    """Per-card spend features"""
+    card = models.OneToOneField(Card, on_delete=models.CASCADE, primary_key=True, related_name='profile')
+
+    class Meta:
+        db_table = 'card_profile'
+
+    def __str__(self):
+        return f"Profile for Card {self.card_id}"
+
+
+class QueryJob(models.Model):
+    """A MindsDB query executed in the background worker pool"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+        ('timeout', 'Timed Out'),
+    ]
+    ACTIVE_STATUSES = ('pending', 'running')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.CharField(max_length=150, db_index=True)
+    query = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    error = models.TextField(blank=True, default='')
+    row_count = models.IntegerField(default=0)
+    columns = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'query_job'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Query job {self.id} ({self.status})"
+
+    def to_dict(self):
+        return {
+            'job_id': str(self.id),
+            'status': self.status,
+            'error': self.error or None,
+            'row_count': self.row_count,
+            'columns': self.columns,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class QueryJobRow(models.Model):
+    """One result row of a finished QueryJob, stored for paginated retrieval"""
+    job = models.ForeignKey(QueryJob, on_delete=models.CASCADE, related_name='rows')
+    position = models.IntegerField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        db_table = 'query_job_row'
+        ordering = ['job', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'position'], name='query_job_row_position'),
+        ]
+
+
+class KBIngestRun(models.Model):
+    """One parallel load of a knowledge base (see finance.kb_pipeline)"""
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    kb_name = models.CharField(max_length=100)
+    since_id = models.BigIntegerField(default=0)
+    batch_size = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    rows_written = models.BigIntegerField(default=0)
+    failed_batches = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'kb_ingest_run'
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.kb_name} load {self.id} ({self.status})"
+
+
+class KBIngestBatch(models.Model):
+    """Checkpoint for one batch of source rows written to the knowledge base"""
+    run = models.ForeignKey(KBIngestRun, on_delete=models.CASCADE, related_name='batches')
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    rows = models.IntegerField()
+    seconds = models.FloatField()
+    written_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'kb_ingest_batch'
+        ordering = ['run', 'first_id']
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'first_id'], name='kb_ingest_batch_first_id'),
+        ]
+
+
+class EmbeddingCache(models.Model):
+    """
+    Embedding vector for a piece of KB content, keyed by a hash of the content.
+
+    Vectors are stored as raw float32 bytes so each distinct string is embedded
+    once and reused across rows and across knowledge base syncs.
+    """
+    model_name = models.CharField(max_length=100)
+    content_hash = models.CharField(max_length=64)
+    content = models.TextField()
+    dimensions = models.IntegerField()
+    vector = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'embedding_cache'
+        constraints = [
+            models.UniqueConstraint(fields=['model_name', 'content_hash'], name='embedding_cache_model_hash'),
+        ]
+
+    def __str__(self):
+        return f"Embedding {self.content_hash[:12]} ({self.model_name})"
+
+
+LEADERBOARD_PERIODS = [
+    ('day', 'Day'),
+    ('week', 'Week'),
+    ('month', 'Month'),
+    ('all', 'All Time'),
+]
+
+
+class SpendRollup(models.Model):
+    """
+    Spend per merchant or client per leaderboard period (see finance.leaderboards).
+
+    Rows are incremented as transactions are ingested, so a top-N read is a
+    short scan of the (period, period_start, dimension, amount_total) index.
+    Merchant rows carry the merchant's state for per-state rankings.
+    """
+    DIMENSION_CHOICES = [
+        ('merchant', 'Merchant'),
+        ('client', 'Client'),
+    ]
+
+    period = models.CharField(max_length=5, choices=LEADERBOARD_PERIODS)
+    period_start = models.DateField()
+    dimension = models.CharField(max_length=8, choices=DIMENSION_CHOICES)
+    entity_id = models.BigIntegerField()
+    state = models.CharField(max_length=100, blank=True, default='')
+    amount_total = models.DecimalField(max_digits=16, decimal_places=2)
+    txn_count = models.BigIntegerField()
+
+    class Meta:
+        db_table = 'spend_rollup'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'dimension', 'entity_id'], name='spend_rollup_key'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['period', 'period_start', 'dimension', '-amount_total'], name='spend_rollup_top_idx'
+            ),
+            models.Index(
+                fields=['period', 'period_start', 'dimension', 'state', '-amount_total'],
+                name='spend_rollup_state_top_idx',
+            ),
+        ]
+
+
+class TopTransaction(models.Model):
+    """The FINANCE_LEADERBOARD_SIZE largest transactions of each leaderboard period"""
+    period = models.CharField(max_length=5, choices=LEADERBOARD_PERIODS)
+    period_start = models.DateField()
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='+')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        db_table = 'top_transaction'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'transaction'], name='top_transaction_key'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start', '-amount'], name='top_transaction_top_idx'),
+        ]
+
+
+class VelocityAlert(models.Model):
+    """A transaction that tripped a velocity rule (see finance.velocity)"""
+    rule = models.CharField(max_length=50)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='velocity_alerts')
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='+')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='+')
+    date = models.DateTimeField()
+    value = models.FloatField()
+    threshold = models.FloatField()
+    window_seconds = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'velocity_alert'
+        ordering = ['-date', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['rule', 'transaction'], name='velocity_alert_rule_transaction'),
+        ]
+        indexes = [
+            models.Index(fields=['-date'], name='velocity_alert_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.rule} on Transaction {self.transaction_id}"
+
+
+class KnowledgeBaseAlias(models.Model):
+    """
+    The versioned knowledge base a KB name resolves to (see finance.kb_rebuild)
+
+    While a rebuild is running, building_target is the next version, which
+    receives every write alongside target until it is swapped in.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    target = models.CharField(max_length=100)
+    vector_table = models.CharField(max_length=200, blank=True)
+    version = models.IntegerField(default=1)
+    building_target = models.CharField(max_length=100, blank=True)
+    building_vector_table = models.CharField(max_length=200, blank=True)
+    previous_target = models.CharField(max_length=100, blank=True)
+    previous_vector_table = models.CharField(max_length=200, blank=True)
+    swapped_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'kb_alias'
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} -> {self.target}"
@@ -0,0 +1,82 @@
+"""
+Hybrid planning for knowledge base searches with structured predicates.
+
+The knowledge bases only know client/transaction attributes as metadata JSON,
+so a filter like current_age > 40 is evaluated by MindsDB row by row. When the
+same predicate is selective, it is far cheaper to resolve it against the
+indexed columns in PostgreSQL first and hand MindsDB a short id list.
+
+The planner asks PostgreSQL for its row estimate of the filtered queryset
+(EXPLAIN, no execution) and picks the order:
+
+* 'prefilter' - few candidates: fetch their ids locally and search only those
+* 'pushdown'  - many candidates: send the predicate to MindsDB as before
+"""
+import json
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import QuerySet
+
+
+class SearchPlan:
+    """Chosen strategy for one KB search"""
+
+    def __init__(self, strategy: str, estimated_rows: Optional[int], ids: Optional[List[int]] = None):
+        self.strategy = strategy
+        self.estimated_rows = estimated_rows
+        self.ids = ids
+
+    @property
+    def prefiltered(self) -> bool:
+        return self.strategy == 'prefilter'
+
+    def id_condition(self, column: str) -> str:
+        """SQL condition restricting column to the prefiltered ids"""
+        return f"{column} IN ({', '.join(str(i) for i in self.ids)})"
+
+    def to_dict(self):
+        return {
+            'strategy': self.strategy,
+            'estimated_rows': self.estimated_rows,
+            'candidate_ids': len(self.ids) if self.ids is not None else None,
+        }
+
+
+def estimate_rows(queryset: QuerySet) -> Optional[int]:
+    """Return PostgreSQL's planner estimate for the queryset, without running it"""
+    sql, params = queryset.values('pk').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def plan_search(queryset: QuerySet) -> SearchPlan:
+    """
+    Decide whether to resolve the queryset's predicates in PostgreSQL first
+
+    Args:
+        queryset: Client or Transaction queryset carrying the structured filters
+
+    Returns:
+        A SearchPlan; for 'prefilter' plans, ids holds the matching primary keys
+    """
+    max_ids = getattr(settings, 'FINANCE_PREFILTER_MAX_IDS', 2000)
+    try:
+        estimated = estimate_rows(queryset)
+    except Exception as e:
+        print(f"Could not estimate selectivity, pushing filters to MindsDB: {e}")
+        return SearchPlan('pushdown', None)
+
+    if estimated > max_ids:
+        return SearchPlan('pushdown', estimated)
+
+    # The estimate can be off; fetch one id past the cap to detect that
+    ids = list(queryset.order_by().values_list('pk', flat=True)[:max_ids + 1])
+    if len(ids) > max_ids:
+        return SearchPlan('pushdown', estimated)
+    return SearchPlan('prefilter', estimated, ids)
@@ -0,0 +1,121 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from django.db import transaction as db_transaction
+from django.db.models import Avg, Count, Max, Q, Sum, Variance
+from django.utils import timezone
+
+from .models import CHIP_VALUES, CardProfile, ClientProfile, Transaction, state_bit
+
+
+def _summarize(transactions: Iterable[Transaction], key: str) -> Dict[int, Tuple]:
+    """
+    Reduce a batch of transactions to per-entity aggregates
+
+    Args:
+        transactions: Transactions to summarize
+        key: Foreign key attribute to group by ('client_id' or 'card_id')
+
+    Returns:
+        Mapping of entity id to (count, mean, m2, total, chip_count, state_mask, last_seen)
+    """
+    groups = defaultdict(list)
+    for txn in transactions:
+        groups[getattr(txn, key)].append(txn)
+
+    summary = {}
+    for entity_id, txns in groups.items():
+        amounts = [float(t.amount) for t in txns]
+        count = len(amounts)
+        total = sum(amounts)
+        mean = total / count
+        m2 = sum((a - mean) ** 2 for a in amounts)
+        chip_count = sum(1 for t in txns if t.use_chip in CHIP_VALUES)
+        state_mask = 0
+        for t in txns:
+            state_mask |= state_bit(t.merchant_state)
+        last_seen = max(t.date for t in txns)
+        summary[entity_id] = (count, mean, m2, total, chip_count, state_mask, last_seen)
+    return summary
+
+
+def _apply(model, key: str, summary: Dict[int, Tuple]) -> None:
+    if not summary:
+        return
+    pk_name = model._meta.pk.name
+    model.objects.bulk_create(
+        [model(**{key: entity_id}) for entity_id in summary],
+        ignore_conflicts=True,
+    )
+    profiles = list(
+        model.objects.select_for_update().filter(**{f'{pk_name}__in': list(summary)})
+    )
+    now = timezone.now()
+    for profile in profiles:
+        profile.merge(*summary[getattr(profile, key)])
+        profile.updated_at = now
+    model.objects.bulk_update(
+        profiles,
+        ['txn_count', 'amount_mean', 'amount_m2', 'amount_total',
+         'chip_count', 'state_mask', 'last_seen', 'updated_at'],
+    )
+
+
+def update_profiles(transactions: List[Transaction]) -> None:
+    """
+    Incrementally fold newly stored transactions into client and card profiles
+
+    Only the rows touched by the batch are read and written, so the cost is
+    proportional to the batch rather than to the transaction history.
+    """
+    if not transactions:
+        return
+    with db_transaction.atomic():
+        _apply(ClientProfile, 'client_id', _summarize(transactions, 'client_id'))
+        _apply(CardProfile, 'card_id', _summarize(transactions, 'card_id'))
+
+
+def _rebuild(model, key: str, group_field: str) -> int:
+    rows = (
+        Transaction.objects.order_by()
+        .values(group_field)
+        .annotate(
+            n=Count('id'),
+            mean=Avg('amount'),
+            var=Variance('amount', sample=False),
+            total=Sum('amount'),
+            chips=Count('id', filter=Q(use_chip__in=CHIP_VALUES)),
+            last=Max('date'),
+        )
+    )
+    masks = defaultdict(int)
+    for entity_id, state in (
+        Transaction.objects.order_by().values_list(group_field, 'merchant__state').distinct()
+    ):
+        masks[entity_id] |= state_bit(state)
+
+    profiles = [
+        model(**{
+            key: row[group_field],
+            'txn_count': row['n'],
+            'amount_mean': float(row['mean'] or 0),
+            'amount_m2': float(row['var'] or 0) * row['n'],
+            'amount_total': float(row['total'] or 0),
+            'chip_count': row['chips'],
+            'state_mask': masks[row[group_field]],
+            'last_seen': row['last'],
+        })
+        for row in rows.iterator(chunk_size=5000)
+    ]
+    with db_transaction.atomic():
+        model.objects.all().delete()
+        model.objects.bulk_create(profiles, batch_size=5000)
+    return len(profiles)
+
+
+def rebuild_profiles() -> Dict[str, int]:
+    """Recompute every profile from the transactions table in one aggregation pass"""
+    return {
+        'client_profiles': _rebuild(ClientProfile, 'client_id', 'client'),
+        'card_profiles': _rebuild(CardProfile, 'card_id', 'card'),
+    }
@@ -0,0 +1,222 @@
+"""
+Opt-in request profiling for finance views.
+
+For staff users, a request is profiled when it carries the X-Finance-Profile
+header or falls in the FINANCE_PROFILING_SAMPLE_RATE sample. The view runs
+under cProfile (or pyinstrument, when installed and selected with
+FINANCE_PROFILING_ENGINE) and the capture is summarized as:
+
+* total wall time,
+* time and query count in the ORM (a DB execute wrapper),
+* time inside MindsDBUtil.execute_query,
+* time building the response (json.dumps and template rendering),
+* the top functions by cumulative time.
+
+The categories can overlap, e.g. a queryset evaluated while a template renders
+counts as both ORM and serialization time.
+
+The last FINANCE_PROFILING_KEEP captures are kept in the cache, so any worker
+can list them at /api/profiling/ and download the raw profile (a .prof
+file for snakeviz/pstats, or pyinstrument's HTML).
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+
+INDEX_KEY = 'finance:profiling:index'
+# (filename suffix, function name) pairs whose cumulative time is attributed
+# to each category of the breakdown
+CATEGORY_FUNCTIONS = {
+    'mindsdb': [('finance/mindsdb_util.py', 'execute_query')],
+    'serialization': [
+        ('json/__init__.py', 'dumps'),
+        ('django/template/backends/django.py', 'render'),
+    ],
+}
+_index_lock = threading.Lock()
+
+
+def _entry_key(profile_id: str) -> str:
+    return f'finance:profiling:{profile_id}'
+
+
+class QueryTimer:
+    """DB execute wrapper accumulating ORM time and query count"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def should_profile(request) -> bool:
+    if not getattr(settings, 'FINANCE_PROFILING_ENABLED', True):
+        return False
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_staff:
+        return False
+    if request.headers.get('X-Finance-Profile'):
+        return True
+    return random.random() < getattr(settings, 'FINANCE_PROFILING_SAMPLE_RATE', 0.0)
+
+
+def is_finance_view(request) -> bool:
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    return match.func.__module__.startswith('finance.') and not (match.url_name or '').startswith('api_profiling')
+
+
+def _category_times(stats: pstats.Stats) -> Dict[str, float]:
+    totals = {category: 0.0 for category in CATEGORY_FUNCTIONS}
+    for (filename, _, name), (_, _, _, cumtime, _) in stats.stats.items():
+        filename = filename.replace('\\', '/')
+        for category, functions in CATEGORY_FUNCTIONS.items():
+            if any(filename.endswith(suffix) and name == function for suffix, function in functions):
+                totals[category] += cumtime
+    return totals
+
+
+def _top_functions(stats: pstats.Stats, limit: int = 25) -> List[Dict[str, Any]]:
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            'function': f'{filename}:{line}({name})',
+            'calls': ncalls,
+            'total_seconds': round(tottime, 6),
+            'cumulative_seconds': round(cumtime, 6),
+        }
+        for (filename, line, name), (_, ncalls, tottime, cumtime, _) in rows
+    ]
+
+
+def store(entry: Dict[str, Any], raw: bytes):
+    """Keep a capture and trim the index to the last FINANCE_PROFILING_KEEP"""
+    ttl = getattr(settings, 'FINANCE_PROFILING_TTL', 86400)
+    keep = getattr(settings, 'FINANCE_PROFILING_KEEP', 50)
+    cache.set(_entry_key(entry['id']), {'summary': entry, 'raw': raw}, ttl)
+    with _index_lock:
+        index = cache.get(INDEX_KEY) or []
+        index.insert(0, {k: v for k, v in entry.items() if k != 'top_functions'})
+        for expired in index[keep:]:
+            cache.delete(_entry_key(expired['id']))
+        cache.set(INDEX_KEY, index[:keep], ttl)
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    return cache.get(INDEX_KEY) or []
+
+
+def get_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    return cache.get(_entry_key(profile_id))
+
+
+class ProfilingMiddleware:
+    """Profiles sampled or explicitly requested finance views for staff users"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            # Profilers follow one thread; async requests are not captured
+            return self.get_response(request)
+        if not (should_profile(request) and is_finance_view(request)):
+            return self.get_response(request)
+        return self._profile(request)
+
+    def _profile(self, request):
+        engine = getattr(settings, 'FINANCE_PROFILING_ENGINE', 'cprofile')
+        use_pyinstrument = engine == 'pyinstrument' and PyinstrumentProfiler is not None
+        timer = QueryTimer()
+        profiler = PyinstrumentProfiler() if use_pyinstrument else cProfile.Profile()
+
+        try:
+            if use_pyinstrument:
+                profiler.start()
+            else:
+                profiler.enable()
+        except (ValueError, RuntimeError) as e:
+            # Python 3.12+ allows one profiler at a time (e.g. a debugger or
+            # coverage already holds it); serve the request unprofiled
+            print(f"Not profiling {request.path}: {e}")
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timer))
+            try:
+                response = self.get_response(request)
+            finally:
+                if use_pyinstrument:
+                    profiler.stop()
+                else:
+                    profiler.disable()
+        total = time.perf_counter() - started
+
+        entry = {
+            'id': uuid.uuid4().hex,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'user': request.user.get_username(),
+            'engine': 'pyinstrument' if use_pyinstrument else 'cprofile',
+            'created_at': time.time(),
+            'total_seconds': round(total, 6),
+            'orm_seconds': round(timer.seconds, 6),
+            'orm_queries': timer.count,
+        }
+        if use_pyinstrument:
+            raw = profiler.output_html().encode()
+            entry.update({'mindsdb_seconds': None, 'serialization_seconds': None, 'top_functions': []})
+        else:
+            stats = pstats.Stats(profiler, stream=io.StringIO())
+            categories = _category_times(stats)
+            raw = marshal.dumps(stats.stats)
+            entry.update({
+                'mindsdb_seconds': round(categories['mindsdb'], 6),
+                'serialization_seconds': round(categories['serialization'], 6),
+                'top_functions': _top_functions(stats),
+            })
+        entry['other_seconds'] = round(max(
+            0.0, total - timer.seconds - (entry['mindsdb_seconds'] or 0) - (entry['serialization_seconds'] or 0)
+        ), 6)
+
+        try:
+            store(entry, raw)
+        except Exception as e:
+            print(f"Error storing profile for {entry['path']}: {e}")
+        response['X-Finance-Profile-Id'] = entry['id']
+        return response
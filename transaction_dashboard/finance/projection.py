@@ -0,0 +1,69 @@
+"""
+Field projection for knowledge base searches.
+
+A KB search returns one row per matching chunk with its id, content,
+metadata JSON and distance. Single metadata keys (see the INSERTs in
+docs/gui.sql) are selected with JSON_EXTRACT. Searches select only the
+requested fields, so MindsDB neither builds nor sends the rest. Without an
+explicit list they select the fields the dashboards render.
+"""
+from typing import Iterable, List, Optional, Union
+
+
+KB_COLUMNS = ('id', 'content', 'metadata', 'distance')
+METADATA_KEYS = {
+    'transaction': ('amount', 'use_chip', 'date', 'client_id'),
+    'client': ('per_capita_income', 'current_age', 'gender', 'birth_year'),
+}
+# kb type -> field -> SQL select expression
+KB_FIELDS = {
+    kb_type: {
+        **{column: column for column in KB_COLUMNS},
+        **{key: f"JSON_EXTRACT(metadata, '$.{key}') AS {key}" for key in keys},
+    }
+    for kb_type, keys in METADATA_KEYS.items()
+}
+DEFAULT_FIELDS = {
+    'transaction': ('id', 'content', 'amount', 'date', 'client_id', 'distance'),
+    'client': ('id', 'content', 'current_age', 'per_capita_income', 'gender', 'distance'),
+}
+ALL_FIELDS = '*'
+
+
+class ProjectionError(ValueError):
+    """Raised for a field the knowledge base does not have"""
+
+
+def parse_fields(value: Union[str, Iterable[str], None]) -> Optional[List[str]]:
+    """Fields from a comma-separated string or a list; None when not given"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    fields = [str(field).strip() for field in value if str(field).strip()]
+    return fields or None
+
+
+def select_list(kb_type: str, fields: Optional[List[str]] = None) -> str:
+    """
+    SELECT list for a search of `kb_type`'s knowledge base
+
+    Args:
+        fields: Field names, ['*'] for every column, or None for the defaults
+
+    Raises:
+        ProjectionError: for an unknown field
+    """
+    available = KB_FIELDS.get(kb_type)
+    if available is None:
+        # A KB this module does not describe: no projection
+        return '*'
+    if fields == [ALL_FIELDS]:
+        return '*'
+    fields = fields or DEFAULT_FIELDS[kb_type]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ProjectionError(
+            f'unknown {kb_type}_kb field(s): {", ".join(unknown)}; expected {", ".join(available)} or *'
+        )
+    return ', '.join(available[field] for field in dict.fromkeys(fields))
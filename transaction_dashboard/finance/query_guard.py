@@ -0,0 +1,201 @@
+"""
+Row caps and cost estimation for user-supplied MindsDB SQL.
+
+The guard does not try to be a full SQL parser. It tokenizes the statement
+just far enough to ignore string literals, comments and parenthesised
+subqueries, then looks at the top-level LIMIT/OFFSET and the tables being
+joined. That is enough to make sure no single query can pull an unbounded
+result set into a web worker.
+"""
+import re
+from typing import List, Optional
+
+from django.conf import settings
+
+
+ROW_RETURNING = ('SELECT', 'WITH')
+TOKEN_RE = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`)
+    | (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_.]*)
+    | (?P<number>\d+)
+    | (?P<symbol>[(),;])
+    | (?P<space>\s+)
+    | (?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+MODEL_NAME_RE = re.compile(r'(^|\.)\w*_model$', re.IGNORECASE)
+
+
+class QueryRejected(Exception):
+    """Raised when a query cannot be run within the configured limits"""
+
+
+class GuardedQuery:
+    """Result of guarding a query: the SQL to run plus what the guard decided"""
+
+    def __init__(self, sql: str, limit: Optional[int], offset: int, cost: int, truncated: bool):
+        self.sql = sql
+        self.limit = limit
+        self.offset = offset
+        self.cost = cost
+        self.truncated = truncated
+
+    @property
+    def over_budget(self) -> bool:
+        return self.cost > get_cost_budget()
+
+    def to_dict(self):
+        return {
+            'limit': self.limit,
+            'offset': self.offset,
+            'estimated_cost': self.cost,
+            'truncated': self.truncated,
+        }
+
+
+def get_max_rows() -> int:
+    return getattr(settings, 'MINDSDB_MAX_ROWS', 1000)
+
+
+def get_cost_budget() -> int:
+    return getattr(settings, 'MINDSDB_QUERY_COST_BUDGET', 100000)
+
+
+def clamp_limit(limit: Optional[int], max_rows: Optional[int] = None) -> int:
+    """Clamp a requested row count to 1..max_rows (MINDSDB_MAX_ROWS by default)"""
+    max_rows = max_rows or get_max_rows()
+    if limit is None:
+        return max_rows
+    return max(1, min(int(limit), max_rows))
+
+
+def _tokenize(query: str) -> List[tuple]:
+    """Return (kind, text, depth, start, end) for every significant token"""
+    tokens = []
+    depth = 0
+    for match in TOKEN_RE.finditer(query):
+        kind = match.lastgroup
+        text = match.group()
+        if kind in ('space', 'comment'):
+            continue
+        if text == '(':
+            depth += 1
+        elif text == ')':
+            depth -= 1
+        tokens.append((kind, text, depth, match.start(), match.end()))
+    return tokens
+
+
+def _closing(tokens: List[tuple], index: int) -> Optional[int]:
+    """Index of the parenthesis closing the one at tokens[index]"""
+    depth = tokens[index][2]
+    for i in range(index + 1, len(tokens)):
+        if tokens[i][1] == ')' and tokens[i][2] == depth - 1:
+            return i
+    return None
+
+
+def estimate_cost(tokens: List[tuple], rows: int) -> int:
+    """
+    Rough cost of a query in "row units"
+
+    Every returned row costs 1, each JOIN doubles it, and joining a model
+    (anything named *_model, which typically means one LLM call per row)
+    multiplies it by 100.
+    """
+    factor = 1
+    words = [(text.upper(), text) for kind, text, *_ in tokens if kind == 'word']
+    for i, (upper, _) in enumerate(words):
+        if upper == 'JOIN':
+            factor *= 2
+            if i + 1 < len(words) and MODEL_NAME_RE.search(words[i + 1][1]):
+                factor *= 100
+    return rows * factor
+
+
+def guard_query(query: str, limit: Optional[int] = None, offset: int = 0,
+                max_rows: Optional[int] = None) -> GuardedQuery:
+    """
+    Enforce a maximum row count on a single MindsDB statement
+
+    Row-returning statements, also when wrapped in parentheses, get a
+    LIMIT/OFFSET injected when they have none, or have their top-level LIMIT
+    clamped to MINDSDB_MAX_ROWS. Other statements (SHOW, DESCRIBE, CREATE ...)
+    are passed through unchanged.
+
+    Args:
+        query: SQL supplied by the user
+        limit: Page size requested by the caller, used when the query has no LIMIT
+        offset: Page offset requested by the caller, used when the query has no LIMIT
+        max_rows: Row cap to enforce instead of MINDSDB_MAX_ROWS
+
+    Raises:
+        QueryRejected: for empty input, more than one statement, or a
+            statement or row limit the guard cannot interpret
+    """
+    sql = query.strip()
+    tokens = _tokenize(sql)
+    while tokens and tokens[-1][1] == ';':
+        sql = sql[:tokens[-1][3]].rstrip()
+        tokens.pop()
+    if not tokens:
+        raise QueryRejected('Query is empty')
+    if any(text == ';' for _, text, *_ in tokens):
+        raise QueryRejected('Only one statement can be executed at a time')
+
+    # (SELECT ...) is still a SELECT: unwrap parentheses around the whole
+    # statement, so its LIMIT is the top-level one
+    while tokens[0][1] == '(' and _closing(tokens, 0) == len(tokens) - 1:
+        sql = sql[tokens[0][4]:tokens[-1][3]].strip()
+        tokens = _tokenize(sql)
+        if not tokens:
+            raise QueryRejected('Query is empty')
+
+    leading = next((t for t in tokens if t[1] != '('), None)
+    if leading is None or leading[0] != 'word':
+        raise QueryRejected('Could not interpret the statement')
+    if leading[1].upper() not in ROW_RETURNING:
+        if leading is not tokens[0]:
+            # e.g. (SELECT ...) UNION ... is guarded below; anything else in
+            # parentheses is not a statement MindsDB runs
+            raise QueryRejected('Could not interpret the statement')
+        return GuardedQuery(sql + ';', None, 0, 0, False)
+
+    max_rows = max_rows or get_max_rows()
+    top_level = [t for t in tokens if t[2] == 0]
+    for i, (kind, text, *_) in enumerate(top_level[:-1]):
+        if text.upper() == 'FETCH' and top_level[i + 1][1].upper() in ('FIRST', 'NEXT'):
+            raise QueryRejected('Use LIMIT instead of FETCH FIRST to page results')
+    limit_index = next(
+        (i for i in range(len(top_level) - 1, -1, -1) if top_level[i][1].upper() == 'LIMIT'),
+        None,
+    )
+
+    if limit_index is None:
+        if any(text.upper() == 'OFFSET' for _, text, *_ in top_level):
+            raise QueryRejected('OFFSET needs a LIMIT')
+        rows = clamp_limit(limit, max_rows)
+        offset = max(0, int(offset))
+        sql = f"{sql}\nLIMIT {rows} OFFSET {offset}"
+        return GuardedQuery(sql + ';', rows, offset, estimate_cost(tokens, rows), False)
+
+    # Existing LIMIT n, LIMIT n OFFSET m or LIMIT m, n, ending the statement
+    clause = tokens[tokens.index(top_level[limit_index]):]
+    shape = [kind if kind == 'number' else text.upper() for kind, text, *_ in clause]
+    if shape == ['LIMIT', 'number']:
+        requested_rows, requested_offset = int(clause[1][1]), 0
+    elif shape == ['LIMIT', 'number', 'OFFSET', 'number']:
+        requested_rows, requested_offset = int(clause[1][1]), int(clause[3][1])
+    elif shape == ['LIMIT', 'number', ',', 'number']:
+        requested_offset, requested_rows = int(clause[1][1]), int(clause[3][1])
+    else:
+        raise QueryRejected('Could not interpret the LIMIT clause')
+
+    rows = min(requested_rows, max_rows)
+    sql = f"{sql[:clause[0][3]].rstrip()}\nLIMIT {rows} OFFSET {requested_offset}"
+    return GuardedQuery(
+        sql + ';', rows, requested_offset, estimate_cost(tokens, rows), rows < requested_rows
+    )
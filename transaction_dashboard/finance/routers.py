@@ -0,0 +1,124 @@
+"""
+Primary/replica routing for the finance app.
+
+When a 'replica' database is configured, finance reads go to it and all
+writes go to 'default'. Reads stay on the primary when:
+
+* they run inside a transaction on the primary (select_for_update, profile
+  merges, job bookkeeping),
+* the current request is not a GET/HEAD/OPTIONS, or wrote something already,
+* the client wrote within the last FINANCE_REPLICA_PIN_SECONDS (tracked with
+  a short-lived cookie, so a redirect after a POST does not hit replica lag),
+* the code asked for it with pin_to_primary() (background writers).
+
+Other apps (auth, sessions, admin log) always use 'default'.
+"""
+import contextvars
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+PIN_COOKIE = 'finance_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Per request (or per background thread) routing state. A mutable dict, so
+# writes made inside sync_to_async threads are seen by the middleware.
+_routing = contextvars.ContextVar('finance_routing', default=None)
+
+
+def pin_to_primary():
+    """Send the rest of this request's (or thread's) finance reads to the primary"""
+    state = _routing.get()
+    if state is None:
+        _routing.set({'pinned': True, 'wrote': False})
+    else:
+        state['pinned'] = True
+
+
+def replica_configured() -> bool:
+    return REPLICA in settings.DATABASES
+
+
+class PrimaryReplicaRouter:
+    route_app_labels = {'finance'}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels or not replica_configured():
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Follow relations on the database the instance came from
+            return instance._state.db
+        state = _routing.get()
+        if (state and state['pinned']) or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        state = _routing.get()
+        if state is not None:
+            state['pinned'] = True
+            state['wrote'] = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {PRIMARY, REPLICA}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """Sets up per-request routing state and the read-after-write cookie"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token, state = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._finish(response, state)
+
+    async def __acall__(self, request):
+        token, state = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._finish(response, state)
+
+    def _start(self, request):
+        state = {
+            'pinned': request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES,
+            'wrote': False,
+        }
+        return _routing.set(state), state
+
+    def _finish(self, response, state):
+        if state['wrote'] and replica_configured():
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'FINANCE_REPLICA_PIN_SECONDS', 5),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
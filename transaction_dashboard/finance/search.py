@@ -0,0 +1,120 @@
+"""
+Keyword search over merchant locations and client addresses in PostgreSQL.
+
+merchants.search_vector (city, state, ZIP and merchant id) and
+client.search_vector (address) are tsvector columns that database triggers
+keep current on every insert and update (migration 0026). Both are GIN
+indexed, as are merchants.city and client.address with trigram indexes.
+
+Every word of a query matches as a prefix, so "chic il" finds
+"Chicago, IL". Queries of three or more characters also match by trigram
+similarity, which catches typos such as "chicgo". Results are ranked by
+ts_rank plus similarity, and every lookup is answered from the indexes
+without MindsDB.
+"""
+import re
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import F, Q, QuerySet
+
+from .models import Client, Merchant
+
+
+SEARCH_CONFIG = 'simple'
+KINDS = ('merchants', 'clients')
+# Shorter terms are similar to too many strings for a trigram match to help
+MIN_TRIGRAM_LENGTH = 3
+WORD = re.compile(r'[^\W_]+')
+
+
+class SearchError(ValueError):
+    """Raised for a query without a searchable word or an unknown result type"""
+
+
+def prefix_query(text: str) -> SearchQuery:
+    """'chic il' -> to_tsquery('simple', 'chic:* & il:*')"""
+    words = WORD.findall(text.lower())
+    if not words:
+        raise SearchError('the search needs at least one letter or digit')
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config=SEARCH_CONFIG)
+
+
+def _condition(text: str, field: str) -> Q:
+    condition = Q(search_vector=prefix_query(text))
+    if len(text.strip()) >= MIN_TRIGRAM_LENGTH:
+        condition |= Q(**{f'{field}__trigram_similar': text.strip()})
+    return condition
+
+
+def _rank(text: str, field: str):
+    rank = SearchRank(F('search_vector'), prefix_query(text))
+    if len(text.strip()) >= MIN_TRIGRAM_LENGTH:
+        rank = rank + TrigramSimilarity(field, text.strip())
+    return rank
+
+
+def search_merchants(text: str, queryset: Optional[QuerySet] = None, ranked: bool = True) -> QuerySet:
+    """
+    Merchants matching text by city, state, ZIP or merchant id
+
+    With ranked, rows are annotated with rank and ordered best first.
+    """
+    queryset = (Merchant.objects.all() if queryset is None else queryset).filter(_condition(text, 'city'))
+    if ranked:
+        queryset = queryset.annotate(rank=_rank(text, 'city')).order_by('-rank', 'id')
+    return queryset
+
+
+def search_clients(text: str, queryset: Optional[QuerySet] = None, ranked: bool = True) -> QuerySet:
+    """
+    Clients matching text by address
+
+    With ranked, rows are annotated with rank and ordered best first.
+    """
+    queryset = (Client.objects.all() if queryset is None else queryset).filter(_condition(text, 'address'))
+    if ranked:
+        queryset = queryset.annotate(rank=_rank(text, 'address')).order_by('-rank', 'id')
+    return queryset
+
+
+def search(text: str, kinds: Iterable[str] = KINDS, limit: int = 20) -> Dict[str, List[Dict]]:
+    """
+    Best matches per kind ('merchants', 'clients')
+
+    Raises:
+        SearchError: for an unknown kind or a query without a searchable word
+    """
+    kinds = list(kinds)
+    unknown = [kind for kind in kinds if kind not in KINDS]
+    if unknown:
+        raise SearchError(f'unknown search type(s): {", ".join(unknown)}; expected {", ".join(KINDS)} or all')
+    limit = max(1, min(limit, getattr(settings, 'FINANCE_SEARCH_MAX_RESULTS', 100)))
+
+    results = {}
+    if 'merchants' in kinds:
+        results['merchants'] = [
+            {
+                'id': merchant.id,
+                'merchant_id': merchant.code,
+                'city': merchant.city,
+                'state': merchant.state,
+                'zip': merchant.zip,
+                'mcc': merchant.mcc,
+                'rank': round(merchant.rank, 4),
+            }
+            for merchant in search_merchants(text).only('id', 'code', 'city', 'state', 'zip', 'mcc')[:limit]
+        ]
+    if 'clients' in kinds:
+        results['clients'] = [
+            {
+                'id': client.id,
+                'address': client.address,
+                'current_age': client.current_age,
+                'gender': client.gender,
+                'rank': round(client.rank, 4),
+            }
+            for client in search_clients(text).only('id', 'address', 'current_age', 'gender')[:limit]
+        ]
+    return results
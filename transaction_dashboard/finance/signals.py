@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Transaction
+from .leaderboards import update_leaderboards
+from .profiles import update_profiles
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, **kwargs):
+    """Keep spend profiles and leaderboards current for transactions saved one at a time (e.g. the admin)"""
+    if created and not kwargs.get('raw'):
+        update_profiles([instance])
+        update_leaderboards([instance])
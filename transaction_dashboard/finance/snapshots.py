@@ -0,0 +1,214 @@
+"""
+Knowledge base snapshots on local disk.
+
+Restoring client_kb or transaction_kb after MindsDB loses its storage would
+otherwise mean embedding every row again. export_snapshot() copies a KB's
+vector table (MINDSDB_KB_VECTOR_TABLES, or the live version's) into a directory of shards:
+
+    manifest.json           KB, vector table, embedding model, dimensions, rows
+    vectors-00000.npy       float16 vectors first seen in this shard
+    ids-00000.npy           int64 row ids
+    vector_index-00000.npy  int32 position of each row's vector in the
+                            concatenated vectors-*.npy files
+    rows-00000.jsonl.gz     content and metadata, one line per row
+
+Identical vectors are stored once, which matters for transaction_kb: its
+millions of rows share a few thousand merchant locations. import_snapshot()
+writes the rows back into the vector table with their vectors, so restoring
+is bulk I/O and does not call the embedding model.
+"""
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .mindsdb_util import mindsdb_util
+
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+
+class SnapshotError(ValueError):
+    """Raised for a KB without a vector table or an unusable snapshot"""
+
+
+def snapshot_dir(kb_name: str) -> Path:
+    return Path(getattr(settings, 'FINANCE_KB_SNAPSHOT_DIR', settings.BASE_DIR / 'kb_snapshots')) / kb_name
+
+
+def vector_table_for(kb_name: str) -> str:
+    """Vector table of the KB version kb_name resolves to"""
+    table = mindsdb_util.resolve_vector_table(kb_name)
+    if not table:
+        raise SnapshotError(f'{kb_name} has no vector table; map it in MINDSDB_KB_VECTOR_TABLES')
+    return table
+
+
+def _shard_path(directory: Path, kind: str, shard: int, suffix: str = 'npy') -> Path:
+    return directory / f'{kind}-{shard:05d}.{suffix}'
+
+
+def _save(path: Path, array: np.ndarray):
+    # np.save appends .npy to names without it, so write through a file object
+    tmp = path.with_name(f'.{path.name}.tmp')
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _pages(vector_table: str, page_size: int) -> Iterator[List[Dict]]:
+    after_id = None
+    while True:
+        rows = mindsdb_util.read_vector_table(vector_table, after_id=after_id, limit=page_size)
+        if not rows:
+            return
+        yield rows
+        after_id = int(rows[-1]['id'])
+
+
+def export_snapshot(kb_name: str, directory: str, shard_size: Optional[int] = None, page_size: int = 5000,
+                    log: Callable[[str], None] = print) -> Dict:
+    """
+    Copy a knowledge base's rows and vectors into `directory`
+
+    Returns:
+        The snapshot manifest
+    """
+    vector_table = vector_table_for(kb_name)
+    shard_size = shard_size or getattr(settings, 'FINANCE_KB_SNAPSHOT_SHARD_SIZE', 100000)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / MANIFEST).unlink(missing_ok=True)
+
+    known: Dict[bytes, int] = {}  # digest of a float16 vector -> position
+    dimensions = None
+    shards = []
+    ids, vector_index, new_vectors, lines = [], [], [], []
+
+    def flush():
+        shard = len(shards)
+        _save(_shard_path(directory, 'ids', shard), np.asarray(ids, dtype=np.int64))
+        _save(_shard_path(directory, 'vector_index', shard), np.asarray(vector_index, dtype=np.int32))
+        _save(
+            _shard_path(directory, 'vectors', shard),
+            np.asarray(new_vectors, dtype=np.float16).reshape(len(new_vectors), dimensions),
+        )
+        with gzip.open(_shard_path(directory, 'rows', shard, 'jsonl.gz'), 'wt', encoding='utf-8') as f:
+            f.writelines(lines)
+        shards.append({'rows': len(ids), 'vectors': len(new_vectors), 'first_id': ids[0], 'last_id': ids[-1]})
+        log(f'  shard {shard}: {len(ids)} rows, {len(new_vectors)} new vectors (last id {ids[-1]})')
+        for buffer in (ids, vector_index, new_vectors, lines):
+            buffer.clear()
+
+    for page in _pages(vector_table, page_size):
+        for row in page:
+            vector = np.asarray(row['embeddings'], dtype=np.float16)
+            if dimensions is None:
+                dimensions = vector.shape[0]
+            elif vector.shape[0] != dimensions:
+                raise SnapshotError(f'row {row["id"]} has {vector.shape[0]} dimensions, expected {dimensions}')
+            digest = hashlib.blake2b(vector.tobytes(), digest_size=16).digest()
+            position = known.get(digest)
+            if position is None:
+                position = known[digest] = len(known)
+                new_vectors.append(vector)
+            ids.append(int(row['id']))
+            vector_index.append(position)
+            lines.append(json.dumps({'content': row['content'], 'metadata': row['metadata']}, default=str) + '\n')
+            if len(ids) >= shard_size:
+                flush()
+    if ids:
+        flush()
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'kb': kb_name,
+        'vector_table': vector_table,
+        'embedding_model': getattr(settings, 'MINDSDB_EMBEDDING_MODEL', 'kb_embedding_model'),
+        'dimensions': dimensions,
+        'dtype': 'float16',
+        'rows': sum(shard['rows'] for shard in shards),
+        'vectors': len(known),
+        'max_id': shards[-1]['last_id'] if shards else None,
+        'shards': shards,
+        'created_at': datetime.now(dt_timezone.utc).isoformat(),
+    }
+    # Written last: a snapshot without a manifest is incomplete
+    with open(directory / MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_snapshot_manifest(directory: str) -> Dict:
+    try:
+        with open(Path(directory) / MANIFEST) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise SnapshotError(f'{directory} has no {MANIFEST}; is it a knowledge base snapshot?')
+    if manifest.get('format') != FORMAT_VERSION:
+        raise SnapshotError(f'unsupported snapshot format {manifest.get("format")!r}')
+    return manifest
+
+
+def _shards(directory: Path, manifest: Dict) -> Iterator[Tuple[np.ndarray, np.ndarray, List[Dict]]]:
+    # Vectors are memory-mapped and only the referenced rows are read
+    vector_shards = [
+        np.load(_shard_path(directory, 'vectors', shard), mmap_mode='r') for shard in range(len(manifest['shards']))
+    ]
+    offsets = np.cumsum([0] + [len(v) for v in vector_shards])
+    for shard in range(len(manifest['shards'])):
+        ids = np.load(_shard_path(directory, 'ids', shard))
+        vector_index = np.load(_shard_path(directory, 'vector_index', shard))
+        with gzip.open(_shard_path(directory, 'rows', shard, 'jsonl.gz'), 'rt', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        if not len(ids) == len(vector_index) == len(rows):
+            raise SnapshotError(f'shard {shard} is inconsistent: {len(ids)} ids, {len(rows)} rows')
+        owner = np.searchsorted(offsets, vector_index, side='right') - 1
+        vectors = np.empty((len(ids), manifest['dimensions']), dtype=np.float32)
+        for source in np.unique(owner):
+            mask = owner == source
+            vectors[mask] = vector_shards[source][vector_index[mask] - offsets[source]]
+        yield ids, vectors, rows
+
+
+def import_snapshot(directory: str, vector_table: Optional[str] = None, batch_size: int = 500,
+                    allow_model_mismatch: bool = False, log: Callable[[str], None] = print) -> Dict:
+    """
+    Write a snapshot's rows and vectors into a vector table
+
+    Args:
+        directory: Snapshot written by export_snapshot
+        vector_table: Target table (default: the KB's MINDSDB_KB_VECTOR_TABLES entry)
+        batch_size: Rows per INSERT statement
+        allow_model_mismatch: Import vectors from another embedding model anyway
+
+    Returns:
+        The snapshot manifest
+
+    Raises:
+        SnapshotError: if the snapshot is unreadable or was embedded with a
+            different model than MINDSDB_EMBEDDING_MODEL
+    """
+    directory = Path(directory)
+    manifest = read_snapshot_manifest(directory)
+    vector_table = vector_table or vector_table_for(manifest['kb'])
+    model = getattr(settings, 'MINDSDB_EMBEDDING_MODEL', 'kb_embedding_model')
+    if manifest['embedding_model'] != model and not allow_model_mismatch:
+        raise SnapshotError(
+            f"snapshot was embedded with {manifest['embedding_model']}, but MINDSDB_EMBEDDING_MODEL is {model}"
+        )
+
+    written = 0
+    for ids, vectors, rows in _shards(directory, manifest):
+        for row, row_id in zip(rows, ids.tolist()):
+            row['id'] = row_id
+        written += mindsdb_util.insert_embeddings(vector_table, rows, vectors, batch_size=batch_size)
+        log(f'  {written} of {manifest["rows"]} rows written (last id {ids[-1]})')
+    return manifest
@@ -1,3 +1,254 @@
-from django.test import TestCase
+from datetime import datetime, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from . import throttling, velocity
+from .geo import ClientSpatialIndex, haversine_km
+from .merchants import merchant_key
+from .planner import SearchPlan
+from .projection import ProjectionError, select_list
+from .query_guard import QueryRejected, guard_query
+from .search import SearchError, prefix_query
+
+
+@override_settings(MINDSDB_MAX_ROWS=100)
+class GuardQueryTests(SimpleTestCase):
+    def test_injects_limit_and_offset(self):
+        guarded = guard_query('SELECT * FROM transaction_kb', limit=20, offset=40)
+        self.assertEqual(guarded.sql, 'SELECT * FROM transaction_kb\nLIMIT 20 OFFSET 40;')
+        self.assertEqual((guarded.limit, guarded.offset), (20, 40))
+
+    def test_clamps_existing_limit(self):
+        guarded = guard_query('SELECT * FROM transaction_kb LIMIT 5000 OFFSET 10;')
+        self.assertEqual(guarded.sql, 'SELECT * FROM transaction_kb\nLIMIT 100 OFFSET 10;')
+        self.assertTrue(guarded.truncated)
+
+    def test_limit_with_comma(self):
+        guarded = guard_query('SELECT * FROM t LIMIT 10, 20')
+        self.assertEqual((guarded.limit, guarded.offset), (20, 10))
+
+    def test_parenthesised_select_is_capped(self):
+        for query in ('(SELECT * FROM transaction_kb)', '/* all */ ((SELECT * FROM transaction_kb))'):
+            guarded = guard_query(query)
+            self.assertEqual(guarded.sql, 'SELECT * FROM transaction_kb\nLIMIT 100 OFFSET 0;')
+            self.assertEqual(guarded.limit, 100)
+            self.assertGreater(guarded.cost, 0)
+
+    def test_union_of_parenthesised_selects_is_capped(self):
+        guarded = guard_query('(SELECT a FROM t) UNION (SELECT a FROM u)')
+        self.assertTrue(guarded.sql.endswith('\nLIMIT 100 OFFSET 0;'))
+
+    def test_limit_inside_subquery_is_not_top_level(self):
+        guarded = guard_query('SELECT * FROM t WHERE id IN (SELECT id FROM u LIMIT 2)')
+        self.assertTrue(guarded.sql.endswith('LIMIT 2)\nLIMIT 100 OFFSET 0;'))
+
+    def test_other_statements_pass_through(self):
+        guarded = guard_query('SHOW TABLES')
+        self.assertEqual(guarded.sql, 'SHOW TABLES;')
+        self.assertIsNone(guarded.limit)
+
+    def test_rejects(self):
+        for query in (
+            '', ';', 'SELECT 1; SELECT 2', 'SELECT * FROM t LIMIT 5 FOO 7', 'SELECT * FROM t LIMIT x',
+            'SELECT * FROM t FETCH FIRST 5 ROWS ONLY', 'SELECT * FROM t OFFSET 3', "'x'", '(',
+        ):
+            with self.subTest(query=query), self.assertRaises(QueryRejected):
+                guard_query(query)
+
+    def test_model_join_cost(self):
+        guarded = guard_query('SELECT * FROM t JOIN sentiment_model', limit=10)
+        self.assertEqual(guarded.cost, 10 * 2 * 100)
+
+
+class SearchPlanTests(SimpleTestCase):
+    def test_id_condition(self):
+        plan = SearchPlan('prefilter', 3, [4, 8, 15])
+        self.assertTrue(plan.prefiltered)
+        self.assertEqual(plan.id_condition('t.id'), 't.id IN (4, 8, 15)')
+        self.assertEqual(plan.to_dict()['candidate_ids'], 3)
+
+
+class MerchantKeyTests(SimpleTestCase):
+    def test_normalizes_missing_fields(self):
+        self.assertEqual(merchant_key(59935, 'ONLINE'), ('59935', 'ONLINE', '', '', 1000))
+        self.assertEqual(merchant_key('59935', 'ONLINE', None, '', ''), ('59935', 'ONLINE', '', '', 1000))
+
+    def test_mcc_is_an_integer(self):
+        self.assertEqual(merchant_key('1', 'Chicago', 'IL', '60601', '5411'), ('1', 'Chicago', 'IL', '60601', 5411))
+
+
+class ClientSpatialIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.lats = rng.uniform(25, 49, 2000)
+        self.lons = rng.uniform(-125, -67, 2000)
+        self.ids = np.arange(1, 2001)
+        self.index = ClientSpatialIndex(self.ids, self.lats, self.lons)
+
+    def test_within_radius_matches_brute_force(self):
+        lat, lon, radius = 41.88, -87.63, 300
+        distances = haversine_km(lat, lon, self.lats, self.lons)
+        expected = set(self.ids[distances <= radius].tolist())
+        results = self.index.within_radius(lat, lon, radius)
+        self.assertEqual({r['client_id'] for r in results}, expected)
+        self.assertEqual([r['distance_km'] for r in results], sorted(r['distance_km'] for r in results))
+
+    def test_within_radius_limit_keeps_nearest(self):
+        everything = self.index.within_radius(41.88, -87.63, 800)
+        self.assertEqual(self.index.within_radius(41.88, -87.63, 800, limit=5), everything[:5])
+
+    def test_nearest_matches_brute_force(self):
+        for lat, lon in ((41.88, -87.63), (25.0, -125.0), (60.0, 10.0)):
+            distances = haversine_km(lat, lon, self.lats, self.lons)
+            expected = self.ids[np.argsort(distances)[:10]].tolist()
+            with self.subTest(lat=lat, lon=lon):
+                self.assertEqual([r['client_id'] for r in self.index.nearest(lat, lon, 10)], expected)
+
+
+class VelocityTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        n = 300
+        self.keys = rng.integers(0, 6, n)
+        self.timestamps = rng.integers(0, 20000, n)
+        self.ids = np.arange(1, n + 1)
+        self.cents = rng.integers(100, 90000, n)
+        self.states = rng.integers(-1, 5, n)
+
+    def _brute_force(self, keys, window, metric):
+        values = np.empty(len(keys))
+        for i in range(len(keys)):
+            inside = (
+                (keys == keys[i]) & (self.timestamps >= self.timestamps[i] - window)
+                & ((self.timestamps < self.timestamps[i])
+                   | ((self.timestamps == self.timestamps[i]) & (self.ids <= self.ids[i])))
+            )
+            if metric == 'count':
+                values[i] = inside.sum()
+            elif metric == 'amount':
+                values[i] = self.cents[inside].sum() / 100
+            else:
+                values[i] = len(set(self.states[inside].tolist()) - {-1})
+        return values
+
+    def test_window_values(self):
+        for metric in velocity.METRICS:
+            with self.subTest(metric=metric):
+                np.testing.assert_allclose(
+                    velocity.window_values(self.keys, self.timestamps, self.ids, self.cents, self.states, 1800, metric),
+                    self._brute_force(self.keys, 1800, metric),
+                )
+
+    def test_engine_matches_window_values(self):
+        rules = [
+            velocity.VelocityRule('cards', 'card', 1800, 'count', 4),
+            velocity.VelocityRule('spend', 'client', 1800, 'amount', 2000),
+            velocity.VelocityRule('states', 'client', 1800, 'distinct_states', 3),
+        ]
+        transactions = [
+            SimpleNamespace(
+                id=int(self.ids[i]), card_id=int(self.keys[i]), client_id=int(self.keys[i]) % 3,
+                amount=self.cents[i] / 100, merchant_id=int(self.states[i]),
+                date=datetime.fromtimestamp(int(self.timestamps[i]), dt_timezone.utc),
+            )
+            for i in range(len(self.ids))
+        ]
+        states = {code: f'S{code}' if code >= 0 else '' for code in range(-1, 5)}
+        stored = []
+
+        def prime(engine, batch):
+            # What the transactions table would hold for the batch's windows
+            lo = min(velocity._epoch(t.date) for t in batch) - 1800
+            hi = max(velocity._epoch(t.date) for t in batch)
+            touched = {(r.name, getattr(t, velocity.KEYS[r.key])) for t in batch for r in engine.rules}
+            history = [t for t in stored if lo <= velocity._epoch(t.date) <= hi]
+            engine._feed(history, states, alert=False, only=touched)
+
+        engine = velocity.VelocityEngine(rules)
+        alerts = []
+        order = np.argsort(self.timestamps, kind='stable')
+        with mock.patch.object(velocity, '_merchant_states', lambda batch: states), \
+                mock.patch.object(velocity.VelocityEngine, '_prime', prime):
+            for chunk in np.array_split(order, 12):
+                batch = [transactions[i] for i in chunk]
+                alerts += engine.observe(batch)
+                stored += batch
+
+        expected = set()
+        for rule in rules:
+            keys = self.keys if rule.key == 'card' else self.keys % 3
+            values = velocity.window_values(keys, self.timestamps, self.ids, self.cents, self.states,
+                                            rule.window, rule.metric)
+            expected |= {(rule.name, int(self.ids[i])) for i in np.nonzero(values >= rule.threshold)[0]}
+        self.assertTrue(expected)
+        self.assertEqual({(a['rule'], a['transaction_id']) for a in alerts}, expected)
+
+
+class SelectListTests(SimpleTestCase):
+    def test_default_fields(self):
+        self.assertEqual(
+            select_list('client'),
+            "id, content, JSON_EXTRACT(metadata, '$.current_age') AS current_age, "
+            "JSON_EXTRACT(metadata, '$.per_capita_income') AS per_capita_income, "
+            "JSON_EXTRACT(metadata, '$.gender') AS gender, distance",
+        )
+
+    def test_requested_fields_without_duplicates(self):
+        self.assertEqual(
+            select_list('transaction', ['id', 'amount', 'id']),
+            "id, JSON_EXTRACT(metadata, '$.amount') AS amount",
+        )
+
+    def test_star_and_unknown_kb(self):
+        self.assertEqual(select_list('transaction', ['*']), '*')
+        self.assertEqual(select_list('merchant', ['anything']), '*')
+
+    def test_unknown_field(self):
+        with self.assertRaises(ProjectionError):
+            select_list('transaction', ['id', 'password'])
+
+
+class PrefixQueryTests(SimpleTestCase):
+    def test_every_word_is_a_prefix(self):
+        query = prefix_query('Chic, IL')
+        self.assertEqual(query.function, 'to_tsquery')
+        self.assertEqual(query.source_expressions[-1].value, 'chic:* & il:*')
+
+    def test_needs_a_letter_or_digit(self):
+        for text in ('', '#', '--', ' . '):
+            with self.subTest(text=text), self.assertRaises(SearchError):
+                prefix_query(text)
+
+
+@override_settings(FINANCE_THROTTLE_RATES={'stats': '5/min', 'semantic': '2/min'})
+class ThrottlingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_rate(self):
+        self.assertEqual(throttling.parse_rate('30/min'), (30, 60))
+        self.assertEqual(throttling.parse_rate('1000 / day'), (1000, 86400))
+        for rate in ('30', 'x/min', '30/week'):
+            with self.subTest(rate=rate), self.assertRaises(ValueError):
+                throttling.parse_rate(rate)
+
+    def test_take_all_refunds_when_any_class_is_over_budget(self):
+        throttling.take('semantic', 'ip:1', 2)
+        with self.assertRaises(throttling.Throttled):
+            throttling.take_all({'stats': 3, 'semantic': 1}, 'ip:1')
+        # The stats tokens were given back
+        throttling.take_all({'stats': 5}, 'ip:1')
+        with self.assertRaises(throttling.Throttled):
+            throttling.take('stats', 'ip:1')
+
+    def test_budget_holds_across_a_window_boundary(self):
+        with mock.patch.object(throttling.time, 'time', return_value=60 * 1000 + 59):
+            throttling.take('semantic', 'ip:2', 2)
+        with mock.patch.object(throttling.time, 'time', return_value=60 * 1001):
+            with self.assertRaises(throttling.Throttled) as raised:
+                throttling.take('semantic', 'ip:2')
+        self.assertAlmostEqual(raised.exception.retry_after, 30)
@@ -0,0 +1,261 @@
+"""
+Rate limits and fair scheduling in front of MindsDB.
+
+Every MindsDB-backed request belongs to a query class:
+
+    stats      knowledge base counts and the connection check
+    search     the dashboard's filtered searches and pattern analysis
+    semantic   semantic searches and user-supplied SQL
+
+Rate limits: each user, or client IP for anonymous requests, has a budget
+per class set by FINANCE_THROTTLE_RATES ("30/min" allows 30 in any sliding
+minute). A budget is one counter per clock window in the Django cache, spent
+with cache.add and cache.incr, which are atomic, so concurrent requests
+cannot both spend the last token and with REDIS_URL the limits hold across
+workers. The sliding window is estimated as the current window's count plus
+the previous window's, weighted by how much of it is still within the last
+period, so a burst straddling a window boundary cannot spend the budget
+twice. Requests over the limit get 429 with Retry-After.
+
+Scheduling: at most FINANCE_MINDSDB_CONCURRENCY MindsDB requests run at once
+per process, one of them kept free for stats. Waiting requests are admitted
+by class (stats first, semantic last) and within a class by virtual finish
+time per user, so a user with many queued searches takes turns with everyone
+else instead of going first. A request still waiting after
+FINANCE_MINDSDB_QUEUE_TIMEOUT seconds gets 429.
+"""
+import functools
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+
+# Lower is admitted first
+QUERY_CLASSES = {'stats': 0, 'search': 1, 'semantic': 2}
+PERIODS = {'s': 1, 'sec': 1, 'min': 60, 'hour': 3600, 'day': 86400}
+DEFAULT_RATES = {'stats': '120/min', 'search': '30/min', 'semantic': '10/min'}
+
+
+class Throttled(Exception):
+    """Raised when a request is over its rate limit or waited too long for MindsDB"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """'30/min' -> (30 requests, 60 seconds)"""
+    count, _, period = rate.partition('/')
+    try:
+        return int(count), PERIODS[period.strip().lower()]
+    except (KeyError, ValueError):
+        raise ValueError(f'invalid rate {rate!r}; expected e.g. 30/min')
+
+
+def get_rate(query_class: str) -> Tuple[int, int]:
+    rates = {**DEFAULT_RATES, **getattr(settings, 'FINANCE_THROTTLE_RATES', {})}
+    return parse_rate(rates[query_class])
+
+
+def client_identity(request) -> str:
+    """The user for signed-in requests, otherwise the client IP"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    address = request.META.get('REMOTE_ADDR', '')
+    if getattr(settings, 'FINANCE_THROTTLE_TRUST_FORWARDED', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        address = forwarded.split(',')[0].strip() or address
+    return f'ip:{address}'
+
+
+def _spend(query_class: str, identity: str, cost: int, now: float) -> str:
+    # Returns the counter's key, so the tokens can be given back
+    count, period = get_rate(query_class)
+    if cost > count:
+        raise Throttled(f'at most {count} {query_class} queries per {period} seconds', period)
+
+    window, elapsed = divmod(now, period)
+    prefix = f'finance:throttle:{query_class}:{identity}'
+    key = f'{prefix}:{int(window)}'
+    # Kept through the next window, which weighs it in
+    cache.add(key, 0, 2 * period + 1)
+    try:
+        current = cache.incr(key, cost)
+    except ValueError:
+        # Expired between add and incr
+        cache.add(key, 0, 2 * period + 1)
+        current = cache.incr(key, cost)
+    previous = cache.get(f'{prefix}:{int(window) - 1}') or 0
+    # Sliding window: the previous window counts for the part of it that
+    # still lies within the last `period` seconds
+    share = 1 - elapsed / period
+    if previous * share + current > count:
+        _refund(key, cost)
+        retry_after = _retry_after(previous, current - cost, count - cost, period, elapsed)
+        raise Throttled(
+            f'rate limit for {query_class} queries exceeded; retry in {math.ceil(retry_after)} seconds',
+            retry_after,
+        )
+    return key
+
+
+def _retry_after(previous: int, current: int, allowed: int, period: float, elapsed: float) -> float:
+    # Seconds until previous * share + current falls to `allowed` tokens
+    if current <= allowed:
+        return max(0.0, (1 - (allowed - current) / previous) * period - elapsed)
+    # Not within this window: the current count becomes the weighted one
+    return period - elapsed + (1 - allowed / current) * period
+
+
+def _refund(key: str, cost: int):
+    try:
+        cache.decr(key, cost)
+    except ValueError:
+        # The window has already ended
+        pass
+
+
+def take(query_class: str, identity: str, cost: int = 1) -> None:
+    """
+    Spend `cost` tokens from the identity's budget for the class
+
+    Raises:
+        Throttled: if the budget does not hold enough tokens
+    """
+    _spend(query_class, identity, cost, time.time())
+
+
+def take_all(costs: Dict[str, int], identity: str) -> None:
+    """
+    Spend tokens from several classes' budgets, all or none
+
+    Raises:
+        Throttled: if any budget does not hold enough tokens; nothing is spent
+    """
+    now = time.time()
+    spent = []
+    try:
+        for query_class, cost in costs.items():
+            spent.append((_spend(query_class, identity, cost, now), cost))
+    except Throttled:
+        for key, cost in spent:
+            _refund(key, cost)
+        raise
+
+
+class FairScheduler:
+    """Admits a bounded number of MindsDB requests, by class priority then per-user virtual time"""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._running = 0
+        self._waiting = []  # [priority, virtual finish, sequence, cancelled]
+        self._virtual: Dict[str, float] = {name: 0.0 for name in QUERY_CLASSES}
+        self._finish: Dict[Tuple[str, str], float] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self.stats = {'admitted': 0, 'timed_out': 0}
+
+    @contextmanager
+    def slot(self, query_class: str, identity: str, timeout: Optional[float] = None):
+        """
+        Hold one of the slots while the block runs
+
+        Raises:
+            Throttled: if no slot came free within the timeout
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'FINANCE_MINDSDB_QUEUE_TIMEOUT', 10)
+        self._acquire(query_class, identity, timeout)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    def _acquire(self, query_class: str, identity: str, timeout: float):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            key = (query_class, identity)
+            start = max(self._virtual[query_class], self._finish.get(key, 0.0))
+            self._finish[key] = start + 1
+            entry = [QUERY_CLASSES[query_class], start + 1, next(self._sequence), False]
+            heapq.heappush(self._waiting, entry)
+            # One slot is kept for stats, so they never wait behind scans
+            slots = self.slots if query_class == 'stats' else max(1, self.slots - 1)
+            while not (self._running < slots and self._head() is entry):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    entry[3] = True
+                    self.stats['timed_out'] += 1
+                    # The next waiter may be at the head now
+                    self._condition.notify_all()
+                    raise Throttled('MindsDB is busy; retry shortly', 1)
+                self._condition.wait(remaining)
+            heapq.heappop(self._waiting)
+            self._running += 1
+            self._virtual[query_class] = max(self._virtual[query_class], start)
+            self.stats['admitted'] += 1
+            self._forget_idle()
+
+    def _head(self):
+        while self._waiting and self._waiting[0][3]:
+            heapq.heappop(self._waiting)
+        return self._waiting[0] if self._waiting else None
+
+    def _forget_idle(self):
+        # Users whose turn has passed start again from the class's virtual time anyway
+        if len(self._finish) > 10000:
+            self._finish = {
+                key: finish for key, finish in self._finish.items() if finish > self._virtual[key[0]]
+            }
+
+
+def throttled_response(error: Throttled) -> JsonResponse:
+    response = JsonResponse({
+        'success': False,
+        'error': str(error),
+        'retry_after': math.ceil(error.retry_after),
+    }, status=429)
+    response['Retry-After'] = str(math.ceil(error.retry_after))
+    return response
+
+
+def throttle(query_class: str, schedule: bool = True):
+    """
+    View decorator applying the class's rate limit and, with schedule, running
+    the view in one of the MindsDB slots
+    """
+    if query_class not in QUERY_CLASSES:
+        raise ValueError(f'query class must be one of {", ".join(QUERY_CLASSES)}')
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not getattr(settings, 'FINANCE_THROTTLE_ENABLED', True):
+                return view(request, *args, **kwargs)
+            identity = client_identity(request)
+            try:
+                take(query_class, identity)
+                if not schedule:
+                    return view(request, *args, **kwargs)
+                with mindsdb_scheduler.slot(query_class, identity):
+                    return view(request, *args, **kwargs)
+            except Throttled as e:
+                return throttled_response(e)
+        return wrapper
+    return decorator
+
+
+mindsdb_scheduler = FairScheduler(slots=getattr(settings, 'FINANCE_MINDSDB_CONCURRENCY', 4))
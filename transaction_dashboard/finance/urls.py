@@ -9,6 +9,16 @@ urlpatterns = [
     path('api/clients/', views.api_clients, name='api_clients'),
     path('api/cards/', views.api_cards, name='api_cards'),
     path('api/transactions/', views.api_transactions, name='api_transactions'),
+    path('api/clients/nearby/', views.api_clients_nearby, name='api_clients_nearby'),
+    path('api/transactions/far-from-home/', views.api_transactions_far_from_home, name='api_transactions_far_from_home'),
+    path('api/transactions/ingest/', views.api_transactions_ingest, name='api_transactions_ingest'),
+    path('api/transactions/archive/', views.api_archive_transactions, name='api_archive_transactions'),
+    path('api/search/', views.api_search, name='api_search'),
+    path('api/live/', views.api_live_stream, name='api_live_stream'),
+    path('api/clients/<int:client_id>/profile/', views.api_client_profile, name='api_client_profile'),
+    path('api/cards/<int:card_id>/profile/', views.api_card_profile, name='api_card_profile'),
+    path('api/analytics/spend/', views.api_analytics_spend, name='api_analytics_spend'),
+    path('api/leaderboards/<str:board>/', views.api_leaderboard, name='api_leaderboard'),
     path('api/mindsdb/wealthy-clients/', views.api_mindsdb_wealthy_clients, name='api_mindsdb_wealthy_clients'),
     path('api/mindsdb/travel-expenses/', views.api_mindsdb_travel_expenses, name='api_mindsdb_travel_expenses'),
     path('api/mindsdb/online-shopping/', views.api_mindsdb_online_shopping, name='api_mindsdb_online_shopping'),
@@ -16,5 +26,13 @@ urlpatterns = [
     path('api/mindsdb/unusual-spending/', views.api_mindsdb_unusual_spending, name='api_mindsdb_unusual_spending'),
     path('api/mindsdb/custom-search/', views.api_mindsdb_custom_search, name='api_mindsdb_custom_search'),
     path('api/mindsdb/stats/', views.api_mindsdb_stats, name='api_mindsdb_stats'),
+    path('api/mindsdb/batch/', views.api_mindsdb_batch, name='api_mindsdb_batch'),
     path('api/mindsdb/execute-query/', views.api_mindsdb_execute_query, name='api_mindsdb_execute_query'),
+    path('api/mindsdb/jobs/', views.api_mindsdb_jobs, name='api_mindsdb_jobs'),
+    path('api/mindsdb/jobs/<uuid:job_id>/', views.api_mindsdb_job_status, name='api_mindsdb_job_status'),
+    path('api/mindsdb/jobs/<uuid:job_id>/results/', views.api_mindsdb_job_results, name='api_mindsdb_job_results'),
+    path('api/mindsdb/jobs/<uuid:job_id>/cancel/', views.api_mindsdb_job_cancel, name='api_mindsdb_job_cancel'),
+    path('api/profiling/', views.api_profiling_list, name='api_profiling_list'),
+    path('api/profiling/<str:profile_id>/', views.api_profiling_detail, name='api_profiling_detail'),
+    path('api/profiling/<str:profile_id>/download/', views.api_profiling_download, name='api_profiling_download'),
 ] 
\ No newline at end of file
@@ -0,0 +1,396 @@
+"""
+Velocity rules over sliding time windows, per card or per client.
+
+A rule counts something about the transactions of one card or client within
+the last `window` seconds and alerts when it reaches `threshold`:
+
+    count             number of transactions
+    amount            total spend in dollars
+    distinct_states   number of merchant states (online purchases have none)
+
+FINANCE_VELOCITY_RULES lists the rules as dicts with name, key ('card' or
+'client'), window, metric and threshold.
+
+At ingest, every (rule, card/client) pair keeps its window as a deque with a
+running count, total and state counter. Adding a transaction appends it and
+evicts the events that fell out of the window, so each rule costs O(1)
+amortized per transaction. The windows of the cards and clients a batch
+touches are reloaded from the transactions table first (one indexed range
+query per key), so transactions that other workers or processes stored
+count too, and a batch that was rolled back leaves nothing behind. Only
+batches committed at the same moment by two workers miss each other;
+rebuild_velocity_alerts closes that gap. Idle windows are dropped once the
+newest ingested transaction is a full window past them.
+
+rebuild_alerts() evaluates the same rules over the stored history in one
+vectorized NumPy pass on the columnar loader (finance.loaders), with the same
+window boundaries: an alert for a transaction considers the transactions of
+the same card or client at most `window` seconds older than it.
+"""
+import threading
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .loaders import load_transactions
+from .models import Merchant, Transaction, VelocityAlert
+
+
+KEYS = {'card': 'card_id', 'client': 'client_id'}
+METRICS = ('count', 'amount', 'distinct_states')
+DEFAULT_RULES = [
+    {'name': 'card_burst', 'key': 'card', 'window': 600, 'metric': 'count', 'threshold': 5},
+    {'name': 'card_spend_burst', 'key': 'card', 'window': 3600, 'metric': 'amount', 'threshold': 5000},
+    {'name': 'client_multi_state', 'key': 'client', 'window': 3600, 'metric': 'distinct_states', 'threshold': 3},
+]
+
+
+class VelocityRule:
+    """One velocity check: metric over a sliding window per card or client"""
+
+    def __init__(self, name: str, key: str, window: int, metric: str, threshold: float):
+        if key not in KEYS:
+            raise ValueError(f'{name}: key must be one of {", ".join(KEYS)}')
+        if metric not in METRICS:
+            raise ValueError(f'{name}: metric must be one of {", ".join(METRICS)}')
+        if window <= 0:
+            raise ValueError(f'{name}: window must be positive')
+        self.name = name
+        self.key = key
+        self.window = int(window)
+        self.metric = metric
+        self.threshold = float(threshold)
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> 'VelocityRule':
+        return cls(**spec)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'key': self.key,
+            'window': self.window,
+            'metric': self.metric,
+            'threshold': self.threshold,
+        }
+
+    def describe(self, value: float) -> str:
+        minutes = self.window / 60
+        span = f'{minutes:g} minutes' if minutes < 120 else f'{minutes / 60:g} hours'
+        if self.metric == 'count':
+            what = f'{int(value)} transactions'
+        elif self.metric == 'amount':
+            what = f'${value:,.2f} spent'
+        else:
+            what = f'{int(value)} merchant states'
+        return f'{what} on one {self.key} within {span}'
+
+
+def get_rules() -> List[VelocityRule]:
+    return [VelocityRule.from_dict(spec) for spec in getattr(settings, 'FINANCE_VELOCITY_RULES', DEFAULT_RULES)]
+
+
+def _epoch(moment: datetime) -> float:
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment.timestamp()
+
+
+def _merchant_states(transactions: List[Transaction]) -> Dict[int, str]:
+    return dict(
+        Merchant.objects.filter(id__in={t.merchant_id for t in transactions}).values_list('id', 'state')
+    )
+
+
+class _Window:
+    """Events of one card or client inside one rule's window, with running aggregates"""
+    __slots__ = ('events', 'total', 'states')
+
+    def __init__(self):
+        self.events = deque()  # (timestamp, transaction id, amount, state)
+        self.total = 0.0
+        self.states = Counter()
+
+    @property
+    def latest(self) -> Optional[float]:
+        return self.events[-1][0] if self.events else None
+
+    def add(self, event):
+        if not self.events or self.events[-1][:2] <= event[:2]:
+            self.events.append(event)
+        else:
+            # A late event; the deque only holds one window, so this is short
+            position = len(self.events)
+            while position and self.events[position - 1][:2] > event[:2]:
+                position -= 1
+            self.events.insert(position, event)
+        self.total += event[2]
+        if event[3]:
+            self.states[event[3]] += 1
+
+    def evict(self, before: float):
+        while self.events and self.events[0][0] < before:
+            _, _, amount, state = self.events.popleft()
+            self.total -= amount
+            if state:
+                self.states[state] -= 1
+                if not self.states[state]:
+                    del self.states[state]
+
+    def value(self, metric: str, event, window: int) -> float:
+        if self.events[-1] is event:
+            # The usual case: the window ends at the newest event
+            if metric == 'count':
+                return float(len(self.events))
+            if metric == 'amount':
+                return self.total
+            return float(len(self.states))
+        events = [e for e in self.events if e[0] >= event[0] - window and e[:2] <= event[:2]]
+        if metric == 'count':
+            return float(len(events))
+        if metric == 'amount':
+            return sum(e[2] for e in events)
+        return float(len({e[3] for e in events if e[3]}))
+
+
+class VelocityEngine:
+    """Sliding windows for the velocity rules, reloaded from the table for every batch"""
+
+    def __init__(self, rules: List[VelocityRule]):
+        self.rules = rules
+        self._rule_windows = {rule.name: rule.window for rule in rules}
+        self._windows: 'OrderedDict[tuple, _Window]' = OrderedDict()
+        self._high_water = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, transactions: List[Transaction]) -> List[Dict[str, Any]]:
+        """
+        Evaluate the rules on newly stored transactions
+
+        Returns:
+            One alert per (rule, transaction) at or above the rule's threshold
+        """
+        if not transactions or not self.rules:
+            return []
+        with self._lock:
+            # Another worker may have stored transactions for these since
+            for rule in self.rules:
+                for t in transactions:
+                    self._windows.pop((rule.name, getattr(t, KEYS[rule.key])), None)
+        self._prime(transactions)
+        return self._feed(transactions, _merchant_states(transactions), alert=True)
+
+    def _feed(self, transactions: Iterable[Transaction], states: Dict[int, str], alert: bool,
+              only: Optional[set] = None) -> List[Dict[str, Any]]:
+        alerts = []
+        with self._lock:
+            for t in sorted(transactions, key=lambda t: (_epoch(t.date), t.id)):
+                event = (_epoch(t.date), t.id, float(t.amount), states.get(t.merchant_id) or None)
+                for rule in self.rules:
+                    entity = getattr(t, KEYS[rule.key])
+                    if only is not None and (rule.name, entity) not in only:
+                        continue
+                    value = self._push(rule, entity, event)
+                    if alert and value is not None and value >= rule.threshold:
+                        alerts.append({
+                            'rule': rule.name,
+                            'transaction_id': t.id,
+                            'card_id': t.card_id,
+                            'client_id': t.client_id,
+                            'date': t.date,
+                            'amount': float(t.amount),
+                            'value': round(value, 2),
+                            'threshold': rule.threshold,
+                            'window_seconds': rule.window,
+                            'reason': rule.describe(value),
+                            'backend': 'velocity',
+                        })
+                self._high_water = max(self._high_water, event[0])
+            self._prune()
+        return alerts
+
+    def _push(self, rule: VelocityRule, entity: int, event) -> Optional[float]:
+        key = (rule.name, entity)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _Window()
+        else:
+            self._windows.move_to_end(key)
+        if window.latest is not None and event[0] < window.latest - rule.window:
+            # Older than anything still buffered; rebuild_alerts covers it
+            return None
+        window.add(event)
+        window.evict(window.latest - rule.window)
+        return window.value(rule.metric, event, rule.window)
+
+    def _prime(self, transactions: List[Transaction]):
+        """Load the stored history of the batch's cards and clients for the window"""
+        batch_ids = [t.id for t in transactions]
+        earliest = min(_epoch(t.date) for t in transactions)
+        latest = max(_epoch(t.date) for t in transactions)
+        for key, field in KEYS.items():
+            rules = [rule for rule in self.rules if rule.key == key]
+            if not rules:
+                continue
+            unseen = {
+                (rule.name, getattr(t, field)) for t in transactions for rule in rules
+                if (rule.name, getattr(t, field)) not in self._windows
+            }
+            if not unseen:
+                continue
+            longest = max(rule.window for rule in rules)
+            history = list(
+                Transaction.objects.filter(**{
+                    f'{field}__in': {entity for _, entity in unseen},
+                    'date__gte': datetime.fromtimestamp(earliest - longest, dt_timezone.utc),
+                    'date__lte': datetime.fromtimestamp(latest, dt_timezone.utc),
+                })
+                .exclude(id__in=batch_ids)
+                .only('id', 'date', 'amount', 'card_id', 'client_id', 'merchant_id')
+            )
+            if history:
+                self._feed(history, _merchant_states(history), alert=False, only=unseen)
+
+    def _prune(self):
+        # Least recently touched first; stop at the first window still in use
+        while self._windows:
+            (rule_name, _), window = next(iter(self._windows.items()))
+            latest = window.latest
+            if latest is not None and latest >= self._high_water - self._rule_windows[rule_name]:
+                return
+            self._windows.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._windows)
+
+
+def save_alerts(alerts: List[Dict[str, Any]]) -> None:
+    VelocityAlert.objects.bulk_create(
+        [
+            VelocityAlert(
+                rule=a['rule'], transaction_id=a['transaction_id'], card_id=a['card_id'],
+                client_id=a['client_id'], date=a['date'], value=a['value'],
+                threshold=a['threshold'], window_seconds=a['window_seconds'],
+            )
+            for a in alerts
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def check_velocity(transactions: List[Transaction]) -> List[Dict[str, Any]]:
+    """Run the velocity rules on a stored batch and persist the alerts"""
+    alerts = velocity_engine.observe(transactions)
+    if alerts:
+        save_alerts(alerts)
+    return alerts
+
+
+def window_values(keys: np.ndarray, timestamps: np.ndarray, ids: np.ndarray, amount_cents: np.ndarray,
+                  states: np.ndarray, window: int, metric: str) -> np.ndarray:
+    """
+    Rule metric for every transaction over the window ending at it
+
+    Args:
+        keys: Card or client id per transaction
+        timestamps: Epoch seconds per transaction
+        ids: Transaction ids (order within the same second)
+        amount_cents: Amounts in cents
+        states: Merchant state codes, -1 for none
+        window: Window length in seconds
+        metric: One of METRICS
+
+    Returns:
+        float64 array aligned with the inputs
+    """
+    n = len(keys)
+    if n == 0:
+        return np.empty(0)
+    order = np.lexsort((ids, timestamps, keys))
+    t = timestamps[order].astype(np.int64)
+    _, rank = np.unique(keys[order], return_inverse=True)
+    # One sorted axis for all keys: each key gets its own span of the timeline
+    span = int(t.max() - t.min()) + window + 1
+    composite = rank.astype(np.int64) * span + (t - t.min())
+    start = np.searchsorted(composite, composite - window, side='left')
+    position = np.arange(n)
+
+    if metric == 'count':
+        values = (position - start + 1).astype(np.float64)
+    elif metric == 'amount':
+        cumulative = np.concatenate(([0], np.cumsum(amount_cents[order])))
+        values = (cumulative[position + 1] - cumulative[start]) / 100.0
+    else:
+        s = states[order]
+        # Previous event of the same key with the same state
+        by_state = np.lexsort((position, s, rank))
+        same = (rank[by_state][1:] == rank[by_state][:-1]) & (s[by_state][1:] == s[by_state][:-1])
+        previous = np.full(n, -1)
+        previous[by_state[1:][same]] = by_state[:-1][same]
+        # A state counts once: at its first occurrence inside the window
+        values = np.zeros(n)
+        reach = position - start
+        for back in range(int(reach.max()) + 1):
+            rows = position[reach >= back]
+            events = rows - back
+            values[rows] += (s[events] != -1) & (previous[events] < start[rows])
+
+    result = np.empty(n)
+    result[order] = values
+    return result
+
+
+def rebuild_alerts(rules: Optional[List[VelocityRule]] = None, since: Optional[datetime] = None,
+                   batch_size: int = 5000) -> Dict[str, int]:
+    """
+    Recompute velocity alerts from the stored transactions in one vectorized pass
+
+    Existing alerts of the rules are replaced; with `since`, only those for
+    transactions from then on, still counting the history before it.
+
+    Returns:
+        Number of alerts per rule
+    """
+    rules = rules or get_rules()
+    queryset = Transaction.objects.all()
+    if since is not None:
+        queryset = queryset.filter(date__gte=since - timedelta(seconds=max(rule.window for rule in rules)))
+    arrays = load_transactions(queryset, use_cache=False)
+    timestamps = arrays['date'].astype(np.int64)
+    in_scope = timestamps >= (_epoch(since) if since is not None else -np.inf)
+    counts = {}
+    for rule in rules:
+        values = window_values(
+            arrays[KEYS[rule.key]], timestamps, arrays['id'], arrays['amount_cents'],
+            arrays['merchant_state'], rule.window, rule.metric,
+        )
+        hits = np.nonzero((values >= rule.threshold) & in_scope)[0]
+        alerts = [
+            VelocityAlert(
+                rule=rule.name,
+                transaction_id=int(arrays['id'][i]),
+                card_id=int(arrays['card_id'][i]),
+                client_id=int(arrays['client_id'][i]),
+                date=datetime.fromtimestamp(int(timestamps[i]), dt_timezone.utc),
+                value=round(float(values[i]), 2),
+                threshold=rule.threshold,
+                window_seconds=rule.window,
+            )
+            for i in hits
+        ]
+        with db_transaction.atomic():
+            stale = VelocityAlert.objects.filter(rule=rule.name)
+            if since is not None:
+                stale = stale.filter(date__gte=since)
+            stale.delete()
+            VelocityAlert.objects.bulk_create(alerts, batch_size=batch_size, ignore_conflicts=True)
+        counts[rule.name] = len(alerts)
+    return counts
+
+
+velocity_engine = VelocityEngine(get_rules())
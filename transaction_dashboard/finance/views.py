@@ -1,9 +1,34 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from .models import Client, Card, Transaction
+from .models import Client, Card, Transaction, ClientProfile, CardProfile, QueryJob, VelocityAlert
 from .mindsdb_util import mindsdb_util
+from .batch import BatchError, batch_runner, parse_specs
+from .analytics import spend_series
+from .archive import COLUMNS as ARCHIVE_COLUMNS, archive_cutoff, read_latest, read_manifest, table_to_rows
+from .leaderboards import leaderboard
+from .ingest import BufferFull, build_transactions, ingest_buffer
+from .geo import distances_from_home, get_client_index
+from .live import format_event, live_feed
+from .profiling import get_profile, list_profiles
+from .projection import ALL_FIELDS, DEFAULT_FIELDS, ProjectionError, parse_fields, select_list
+from .search import KINDS as SEARCH_KINDS, search
+from .jobs import JobLimitExceeded, job_runner
+from .query_guard import QueryRejected, clamp_limit, guard_query
+from .throttling import Throttled, client_identity, take_all, throttle, throttled_response
+from .warmup import cached_call
+from .velocity import get_rules
 
 
 def index(request):
@@ -12,7 +37,7 @@ def index(request):
         'total_clients': Client.objects.count(),
         'total_cards': Card.objects.count(),
         'total_transactions': Transaction.objects.count(),
-        'recent_transactions': Transaction.objects.select_related('client', 'card').order_by('-date')[:10],
+        'recent_transactions': Transaction.objects.select_related('client', 'card', 'merchant').order_by('-date')[:10],
     }
     return render(request, 'finance/index.html', context)
 
@@ -61,41 +86,412 @@ def api_cards(request):
 @csrf_exempt
 @require_http_methods(["GET"])
 def api_transactions(request):
-    """API endpoint to get all transactions"""
-    transactions = Transaction.objects.select_related('client', 'card').all()[:25]
-    data = []
-    for transaction in transactions:
-        data.append({
+    """
+    API endpoint to get the latest transactions
+
+    start and end (ISO, end exclusive), client_id and limit filter the list.
+    Ranges that reach before the archive cutoff include archived transactions.
+    """
+    try:
+        start = _parse_moment(request.GET.get('start'))
+        end = _parse_moment(request.GET.get('end'))
+        client_id = int(request.GET['client_id']) if request.GET.get('client_id') else None
+        limit = clamp_limit(int(request.GET.get('limit', 25)))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    transactions = Transaction.objects.select_related('merchant').order_by('-date', 'id')
+    if start is not None:
+        transactions = transactions.filter(date__gte=start)
+    if end is not None:
+        transactions = transactions.filter(date__lt=end)
+    if client_id is not None:
+        transactions = transactions.filter(client_id=client_id)
+    rows = []
+    for transaction in transactions[:limit]:
+        rows.append((transaction.date, {
             'id': transaction.id,
             'date': transaction.date.isoformat(),
-            'client_id': transaction.client.id,
-            'card_id': transaction.card.id,
+            'client_id': transaction.client_id,
+            'card_id': transaction.card_id,
             'amount': float(transaction.amount),
             'use_chip': transaction.use_chip,
-            'merchant_id': transaction.merchant_id,
+            'merchant_id': transaction.merchant.code,
             'merchant_city': transaction.merchant_city,
             'merchant_state': transaction.merchant_state,
             'zip': transaction.zip,
-        })
-    return JsonResponse({'transactions': data})
+        }))
+
+    cutoff = archive_cutoff()
+    if cutoff is not None and (start is None or start < cutoff) and (len(rows) < limit or rows[-1][0] < cutoff):
+        # Only archived rows newer than the oldest listed one can make the page
+        lower = start if len(rows) < limit else max(filter(None, [start, rows[-1][0]]))
+        archived = read_latest(
+            limit,
+            ['id', 'date', 'client_id', 'card_id', 'amount', 'use_chip', 'merchant_code',
+             'merchant_city', 'merchant_state', 'zip'],
+            start=lower, end=min(end, cutoff) if end else cutoff, client_id=client_id,
+        )
+        for row in archived.to_pylist():
+            moment = row['date']
+            row['date'] = moment.isoformat()
+            row['amount'] = float(row['amount'])
+            row['merchant_id'] = row.pop('merchant_code')
+            rows.append((moment, row))
+        rows.sort(key=lambda pair: (-pair[0].timestamp(), pair[1]['id']))
+
+    return JsonResponse({'transactions': [row for _, row in rows[:limit]]})
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_search(request):
+    """
+    API endpoint for keyword search over merchants and client addresses
+
+    Every word of q matches as a prefix, and longer terms also by trigram
+    similarity, against PostgreSQL's full-text indexes; results are ranked
+    best first. type is merchants, clients or all (default).
+    """
+    query = request.GET.get('q', '')
+    kind = request.GET.get('type', 'all')
+    try:
+        limit = int(request.GET.get('limit', 20))
+        results = search(query, SEARCH_KINDS if kind == 'all' else kind.split(','), limit)
+    except ValueError as e:
+        # SearchError is a ValueError too
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'query': query, 'results': results})
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_archive_transactions(request):
+    """
+    API endpoint to read archived transactions straight from the Parquet files
+
+    start and end (ISO, end exclusive), client_id, card_id, merchant_state and
+    mcc filter; columns picks the fields returned (comma separated).
+    """
+    try:
+        filters = {
+            'start': _parse_moment(request.GET.get('start')),
+            'end': _parse_moment(request.GET.get('end')),
+        }
+        for name in ('client_id', 'card_id', 'mcc'):
+            if request.GET.get(name):
+                filters[name] = int(request.GET[name])
+        if request.GET.get('merchant_state'):
+            filters['merchant_state'] = request.GET['merchant_state']
+        columns = [c.strip() for c in request.GET.get('columns', '').split(',') if c.strip()] or list(ARCHIVE_COLUMNS)
+        limit = clamp_limit(int(request.GET.get('limit', 1000)))
+        # Newest months first, stopping once the page is full
+        table = read_latest(limit, columns, **filters)
+    except ValueError as e:
+        # ArchiveError is a ValueError too
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    results = table_to_rows(table)
+    manifest = read_manifest()
+    return JsonResponse({
+        'success': True,
+        'archive': {'cutoff': manifest.get('cutoff'), 'months': manifest.get('months', {})},
+        'filters': filters,
+        'results': results,
+        'count': len(results)
+    }, encoder=DjangoJSONEncoder)
+
+
+@require_http_methods(["GET"])
+async def api_live_stream(request):
+    """
+    Server-Sent Events stream of new transactions ('transactions'), knowledge
+    base count changes ('kb_counts') and anomaly alerts ('alerts')
+
+    All open streams share one poller (see finance.live). Browsers reconnect
+    with Last-Event-ID and receive the buffered events they missed.
+    """
+    last_event_id = request.headers.get('Last-Event-ID')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    heartbeat = getattr(settings, 'FINANCE_LIVE_HEARTBEAT', 15)
+
+    async def stream():
+        subscriber = live_feed.subscribe(last_event_id)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_event(event)
+        finally:
+            live_feed.unsubscribe(subscriber)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_clients_nearby(request):
+    """
+    API endpoint to find clients near a location
+
+    Pass lat and lon plus either radius_km (all clients within the radius) or
+    k (the k nearest clients).
+    """
+    try:
+        lat = float(request.GET['lat'])
+        lon = float(request.GET['lon'])
+        radius_km = request.GET.get('radius_km')
+        radius_km = float(radius_km) if radius_km is not None else None
+        k = request.GET.get('k')
+        k = clamp_limit(int(k)) if k is not None else None
+        limit = clamp_limit(int(request.GET.get('limit', 100)))
+        if radius_km is None and k is None:
+            raise ValueError('radius_km or k is required')
+    except (KeyError, ValueError) as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'lat, lon and radius_km or k are required numbers ({e})'
+        }, status=400)
+
+    index = get_client_index()
+    if k is not None:
+        results = index.nearest(lat, lon, k)
+    else:
+        results = index.within_radius(lat, lon, radius_km, limit=limit)
+
+    return JsonResponse({
+        'success': True,
+        'query': {'lat': lat, 'lon': lon, 'radius_km': radius_km, 'k': k},
+        'results': results,
+        'count': len(results)
+    })
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_transactions_far_from_home(request):
+    """
+    API endpoint to find recent transactions whose merchant ZIP is far from the
+    client's home
+    """
+    try:
+        min_km = float(request.GET.get('min_km', 100))
+        limit = clamp_limit(int(request.GET.get('limit', 1000)))
+        client_id = request.GET.get('client_id')
+        client_id = int(client_id) if client_id else None
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'min_km, limit and client_id must be numbers'
+        }, status=400)
+
+    transactions = Transaction.objects.order_by('-date')
+    if client_id is not None:
+        transactions = transactions.filter(client_id=client_id)
+    rows = list(transactions.values_list('id', 'date', 'client_id', 'amount', 'merchant__city', 'merchant__state', 'merchant__zip')[:limit])
+    distances = distances_from_home([r[2] for r in rows], [r[6] for r in rows])
+
+    data = [
+        {
+            'id': row[0],
+            'date': row[1].isoformat(),
+            'client_id': row[2],
+            'amount': float(row[3]),
+            'merchant_city': row[4],
+            'merchant_state': row[5] or None,
+            'zip': row[6] or None,
+            'distance_km': round(float(distance), 1),
+        }
+        for row, distance in zip(rows, distances)
+        if distance >= min_km
+    ]
+    return JsonResponse({
+        'success': True,
+        'min_km': min_km,
+        'scanned': len(rows),
+        'results': data,
+        'count': len(data)
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_transactions_ingest(request):
+    """
+    API endpoint to ingest a batch of transactions
+
+    Accepts {"transactions": [...]} and queues the validated rows for the next
+    micro-batch. Responds 202 once queued, or 503 with Retry-After when the
+    ingest buffer is full.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON in request body'
+        }, status=400)
+
+    items = data.get('transactions') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return JsonResponse({
+            'success': False,
+            'error': 'transactions must be a non-empty list'
+        }, status=400)
+
+    transactions, errors = build_transactions(items)
+    if errors:
+        return JsonResponse({
+            'success': False,
+            'error': 'Validation failed',
+            'errors': {str(index): messages for index, messages in sorted(errors.items())}
+        }, status=400)
+
+    try:
+        depth = ingest_buffer.submit(transactions)
+    except BufferFull as e:
+        response = JsonResponse({'success': False, 'error': str(e)}, status=503)
+        response['Retry-After'] = str(max(1, int(ingest_buffer.flush_interval)))
+        return response
+
+    return JsonResponse({
+        'success': True,
+        'accepted': len(transactions),
+        'buffered': depth
+    }, status=202)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_client_profile(request, client_id):
+    """API endpoint to get the precomputed spend profile of a client"""
+    try:
+        profile = ClientProfile.objects.get(client_id=client_id)
+    except ClientProfile.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': f'No profile for client {client_id}'
+        }, status=404)
+    return JsonResponse({'success': True, 'client_id': client_id, 'profile': profile.to_dict()})
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_card_profile(request, card_id):
+    """API endpoint to get the precomputed spend profile of a card"""
+    try:
+        profile = CardProfile.objects.get(card_id=card_id)
+    except CardProfile.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': f'No profile for card {card_id}'
+        }, status=404)
+    return JsonResponse({'success': True, 'card_id': card_id, 'profile': profile.to_dict()})
+
+
+def _parse_moment(value):
+    """Parse an ISO date or datetime query parameter as an aware datetime"""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'{value!r} is not an ISO date')
+        moment = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_analytics_spend(request):
+    """
+    API endpoint for spend over time, bucketed by day, week or month
+
+    Optional dimension (merchant_state, mcc, card_brand, use_chip) splits each
+    bucket; client_id and card_id filter; start and end (ISO dates, end
+    exclusive) default to the last 365 days; window sets the moving average
+    length in buckets.
+    """
+    try:
+        client_id = request.GET.get('client_id')
+        card_id = request.GET.get('card_id')
+        filters = {
+            'granularity': request.GET.get('granularity', 'day'),
+            'dimension': request.GET.get('dimension') or None,
+            'start': _parse_moment(request.GET.get('start')),
+            'end': _parse_moment(request.GET.get('end')),
+            'window': int(request.GET.get('window', 7)),
+            'client_id': int(client_id) if client_id else None,
+            'card_id': int(card_id) if card_id else None,
+        }
+        results, cache_info = spend_series(**filters)
+    except ValueError as e:
+        # AnalyticsError is a ValueError too
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'filters': filters,
+        'results': results,
+        'count': len(results),
+        'cache': cache_info
+    })
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
+def api_leaderboard(request, board):
+    """
+    API endpoint for a precomputed top-N board: the largest transactions, top
+    merchants (optionally within a state) or top-spending clients
+
+    period is one of FINANCE_LEADERBOARD_PERIODS and date (ISO) picks the
+    period containing it, defaulting to the current one.
+    """
+    try:
+        result = leaderboard(
+            board,
+            period=request.GET.get('period', 'week'),
+            on=_parse_moment(request.GET.get('date')),
+            state=request.GET.get('state') or None,
+            limit=int(request.GET.get('limit', 10)),
+        )
+    except ValueError as e:
+        # LeaderboardError is a ValueError too
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({'success': True, **result, 'count': len(result['entries'])})
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@throttle('search')
 def api_mindsdb_wealthy_clients(request):
     """API endpoint to find wealthy clients using MindsDB semantic search"""
     try:
         min_age = int(request.GET.get('min_age', 40))
         min_income = float(request.GET.get('min_income', 70000))
         
-        results = mindsdb_util.find_wealthy_clients(min_age=min_age, min_income=min_income)
+        results, cache_info = cached_call('find_wealthy_clients', min_age=min_age, min_income=min_income)
         
         return JsonResponse({
             'success': True,
             'query_type': 'wealthy_clients',
             'filters': {'min_age': min_age, 'min_income': min_income},
             'results': results,
-            'count': len(results)
+            'count': len(results),
+            'cache': cache_info
         })
     except Exception as e:
         return JsonResponse({
@@ -106,20 +502,22 @@ def api_mindsdb_wealthy_clients(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@throttle('search')
 def api_mindsdb_travel_expenses(request):
     """API endpoint to find travel expenses using MindsDB semantic search"""
     try:
         min_amount = float(request.GET.get('min_amount', 500))
         use_chip = request.GET.get('use_chip', 'true').lower() == 'true'
         
-        results = mindsdb_util.find_travel_expenses(min_amount=min_amount, use_chip=use_chip)
+        results, cache_info = cached_call('find_travel_expenses', min_amount=min_amount, use_chip=use_chip)
         
         return JsonResponse({
             'success': True,
             'query_type': 'travel_expenses',
             'filters': {'min_amount': min_amount, 'use_chip': use_chip},
             'results': results,
-            'count': len(results)
+            'count': len(results),
+            'cache': cache_info
         })
     except Exception as e:
         return JsonResponse({
@@ -130,19 +528,21 @@ def api_mindsdb_travel_expenses(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@throttle('search')
 def api_mindsdb_online_shopping(request):
     """API endpoint to find online shopping transactions using MindsDB semantic search"""
     try:
         state = request.GET.get('state', 'California')
         
-        results = mindsdb_util.find_online_shopping(state=state)
+        results, cache_info = cached_call('find_online_shopping', state=state)
         
         return JsonResponse({
             'success': True,
             'query_type': 'online_shopping',
             'filters': {'state': state},
             'results': results,
-            'count': len(results)
+            'count': len(results),
+            'cache': cache_info
         })
     except Exception as e:
         return JsonResponse({
@@ -153,17 +553,58 @@ def api_mindsdb_online_shopping(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@throttle('search')
 def api_mindsdb_suspicious_transactions(request):
-    """API endpoint to find suspicious transactions with AI summaries"""
+    """
+    API endpoint for transactions that tripped a velocity rule (finance.velocity)
+
+    Filter with rule, card_id and client_id; include_mindsdb=true adds the
+    MindsDB suspicious pattern analysis for the same client.
+    """
     try:
-        results = mindsdb_util.find_suspicious_transactions()
-        
-        return JsonResponse({
+        alerts = VelocityAlert.objects.select_related('transaction__merchant')
+        if request.GET.get('rule'):
+            alerts = alerts.filter(rule=request.GET['rule'])
+        if request.GET.get('card_id'):
+            alerts = alerts.filter(card_id=int(request.GET['card_id']))
+        client_id = int(request.GET['client_id']) if request.GET.get('client_id') else None
+        if client_id is not None:
+            alerts = alerts.filter(client_id=client_id)
+        limit = clamp_limit(int(request.GET.get('limit', 50)))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    try:
+        rules = {rule.name: rule for rule in get_rules()}
+        results = []
+        for alert in alerts[:limit]:
+            merchant = alert.transaction.merchant
+            rule = rules.get(alert.rule)
+            results.append({
+                'transaction_id': alert.transaction_id,
+                'amount': float(alert.transaction.amount),
+                'date': alert.date.isoformat(),
+                'merchant_city': merchant.city if merchant else None,
+                'merchant_state': merchant.state if merchant else None,
+                'client_id': alert.client_id,
+                'card_id': alert.card_id,
+                'rule': alert.rule,
+                'value': alert.value,
+                'threshold': alert.threshold,
+                'window_seconds': alert.window_seconds,
+                'reason': rule.describe(alert.value) if rule else f'{alert.rule}: {alert.value:g}',
+            })
+
+        response = {
             'success': True,
             'query_type': 'suspicious_transactions',
+            'rules': [rule.to_dict() for rule in rules.values()],
             'results': results,
             'count': len(results)
-        })
+        }
+        if request.GET.get('include_mindsdb', 'false').lower() == 'true':
+            response['mindsdb_results'] = mindsdb_util.analyze_suspicious_patterns(client_id=client_id)
+        return JsonResponse(response)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -173,6 +614,7 @@ def api_mindsdb_suspicious_transactions(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@throttle('search')
 def api_mindsdb_unusual_spending(request):
     """API endpoint to find unusual spending patterns with AI summaries"""
     try:
@@ -193,6 +635,7 @@ def api_mindsdb_unusual_spending(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@throttle('semantic')
 def api_mindsdb_custom_search(request):
     """API endpoint for custom semantic search"""
     try:
@@ -221,10 +664,29 @@ def api_mindsdb_custom_search(request):
                 except ValueError:
                     filters[filter_key] = value
         
+        try:
+            limit = clamp_limit(int(request.GET.get('limit', 10)))
+            offset = max(0, int(request.GET.get('offset', 0)))
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'limit and offset must be integers'
+            }, status=400)
+
+        # Comma-separated columns to return; * for all of them
+        fields = parse_fields(request.GET.get('fields'))
+        try:
+            select_list(kb_type, fields)
+        except ProjectionError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        
         results = mindsdb_util.custom_semantic_search(
             search_term=search_term,
             kb_type=kb_type,
-            filters=filters if filters else None
+            filters=filters if filters else None,
+            limit=limit,
+            offset=offset,
+            fields=fields
         )
         
         return JsonResponse({
@@ -233,6 +695,10 @@ def api_mindsdb_custom_search(request):
             'search_term': search_term,
             'kb_type': kb_type,
             'filters': filters,
+            'limit': limit,
+            'offset': offset,
+            'fields': fields or list(DEFAULT_FIELDS.get(kb_type, [ALL_FIELDS])),
+            'next_offset': offset + limit if len(results) == limit else None,
             'results': results,
             'count': len(results)
         })
@@ -245,16 +711,18 @@ def api_mindsdb_custom_search(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@throttle('stats')
 def api_mindsdb_stats(request):
     """API endpoint to get MindsDB knowledge base statistics"""
     try:
-        stats = mindsdb_util.get_knowledge_base_stats()
+        stats, cache_info = cached_call('get_knowledge_base_stats')
         connection_status = mindsdb_util.test_connection()
         
         return JsonResponse({
             'success': True,
             'connection_status': connection_status,
-            'knowledge_base_stats': stats
+            'knowledge_base_stats': stats,
+            'cache': cache_info
         })
     except Exception as e:
         return JsonResponse({
@@ -265,10 +733,63 @@ def api_mindsdb_stats(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+def api_mindsdb_batch(request):
+    """
+    API endpoint to run several named MindsDB queries concurrently
+
+    With "stream": true each result is sent as one NDJSON line as soon as its
+    query finishes; otherwise the results come back together, keyed by name.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON in request body'
+        }, status=400)
+
+    if not isinstance(data, dict):
+        return JsonResponse({
+            'success': False,
+            'error': 'request body must be a JSON object'
+        }, status=400)
+
+    try:
+        queries = parse_specs(data.get('queries'))
+    except BatchError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    # Each query counts against its class's rate limit
+    identity = client_identity(request)
+    if getattr(settings, 'FINANCE_THROTTLE_ENABLED', True):
+        costs = Counter(query['class'] for query in queries)
+        try:
+            take_all(costs, identity)
+        except Throttled as e:
+            return throttled_response(e)
+
+    started = time.monotonic()
+    results = batch_runner.run(queries, identity)
+    if data.get('stream'):
+        lines = (json.dumps(result, cls=DjangoJSONEncoder) + '\n' for result in results)
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    by_name = {result['name']: result for result in results}
+    return JsonResponse({
+        'success': all(result['success'] for result in by_name.values()),
+        'results': {query['name']: by_name[query['name']] for query in queries},
+        'elapsed_seconds': round(time.monotonic() - started, 3),
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@throttle('semantic')
 def api_mindsdb_execute_query(request):
     """API endpoint to execute custom MindsDB SQL queries"""
     try:
-        import json
         data = json.loads(request.body)
         query = data.get('query', '')
         
@@ -278,13 +799,40 @@ def api_mindsdb_execute_query(request):
                 'error': 'query parameter is required'
             }, status=400)
         
-        results = mindsdb_util.execute_query(query)
+        try:
+            guarded = guard_query(query, limit=data.get('limit'), offset=data.get('offset', 0))
+        except (QueryRejected, TypeError, ValueError) as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=400)
+        
+        # Long-running or over-budget queries are handed to the background job queue
+        if data.get('async') or guarded.over_budget:
+            try:
+                job = _submit_job(request, query)
+            except QueryRejected as e:
+                return JsonResponse({'success': False, 'error': str(e)}, status=400)
+            except JobLimitExceeded as e:
+                return JsonResponse({'success': False, 'error': str(e)}, status=429)
+            return JsonResponse({
+                'success': True,
+                'query': query,
+                'queued': True,
+                'guard': guarded.to_dict(),
+                **job.to_dict()
+            }, status=202)
+        
+        results = mindsdb_util.execute_query(guarded.sql)
         
         return JsonResponse({
             'success': True,
             'query': query,
+            'executed_query': guarded.sql,
+            'guard': guarded.to_dict(),
             'results': results,
-            'count': len(results)
+            'count': len(results),
+            'has_more': guarded.limit is not None and len(results) == guarded.limit,
         })
     except json.JSONDecodeError:
         return JsonResponse({
@@ -298,6 +846,167 @@ def api_mindsdb_execute_query(request):
         }, status=500)
 
 
+def _job_owner(request):
+    """Identify who a query job belongs to for per-user concurrency limits"""
+    if request.user.is_authenticated:
+        return request.user.get_username()
+    return f"ip:{request.META.get('REMOTE_ADDR', 'unknown')}"
+
+
+def _submit_job(request, query):
+    """Guard a query with the job row cap and submit it to the worker pool"""
+    guarded = guard_query(query, max_rows=getattr(settings, 'MINDSDB_JOB_MAX_ROWS', 100000))
+    return job_runner.submit(guarded.sql, owner=_job_owner(request))
+
+
+def _get_job(request, job_id):
+    job_runner.expire_stale()
+    return QueryJob.objects.filter(pk=job_id, owner=_job_owner(request)).first()
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@throttle('semantic', schedule=False)
+def api_mindsdb_jobs(request):
+    """API endpoint to submit a MindsDB query for background execution"""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid JSON in request body'
+        }, status=400)
+
+    if not isinstance(data, dict):
+        return JsonResponse({
+            'success': False,
+            'error': 'request body must be a JSON object'
+        }, status=400)
+
+    query = data.get('query', '')
+    if not query:
+        return JsonResponse({
+            'success': False,
+            'error': 'query parameter is required'
+        }, status=400)
+
+    try:
+        job = _submit_job(request, query)
+    except QueryRejected as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except JobLimitExceeded as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=429)
+
+    return JsonResponse({'success': True, **job.to_dict()}, status=202)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_mindsdb_job_status(request, job_id):
+    """API endpoint to poll the status of a background query job"""
+    job = _get_job(request, job_id)
+    if job is None:
+        return JsonResponse({'success': False, 'error': 'Job not found'}, status=404)
+    return JsonResponse({'success': True, **job.to_dict()})
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_mindsdb_job_results(request, job_id):
+    """API endpoint to fetch a page of results from a finished query job"""
+    job = _get_job(request, job_id)
+    if job is None:
+        return JsonResponse({'success': False, 'error': 'Job not found'}, status=404)
+    if job.status != 'succeeded':
+        return JsonResponse({
+            'success': False,
+            'error': f'Job is {job.status}, results are not available',
+            **job.to_dict()
+        }, status=409)
+
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+        page_size = min(1000, max(1, int(request.GET.get('page_size', 100))))
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'page and page_size must be integers'
+        }, status=400)
+
+    start = (page - 1) * page_size
+    rows = job.rows.filter(position__gte=start, position__lt=start + page_size).values_list('data', flat=True)
+    return JsonResponse({
+        'success': True,
+        'job_id': str(job.id),
+        'page': page,
+        'page_size': page_size,
+        'total': job.row_count,
+        'has_next': start + page_size < job.row_count,
+        'results': list(rows),
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_mindsdb_job_cancel(request, job_id):
+    """API endpoint to cancel a pending or running query job"""
+    job = _get_job(request, job_id)
+    if job is None:
+        return JsonResponse({'success': False, 'error': 'Job not found'}, status=404)
+    job = job_runner.cancel(job)
+    return JsonResponse({'success': True, **job.to_dict()})
+
+
+def _staff_only(request):
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Staff access required'}, status=403)
+    return None
+
+
+@require_http_methods(["GET"])
+def api_profiling_list(request):
+    """API endpoint to list the most recent request profiles"""
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    profiles = list_profiles()
+    return JsonResponse({'success': True, 'profiles': profiles, 'count': len(profiles)})
+
+
+@require_http_methods(["GET"])
+def api_profiling_detail(request, profile_id):
+    """API endpoint to get one profile's time breakdown and top functions"""
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    profile = get_profile(profile_id)
+    if profile is None:
+        return JsonResponse({'success': False, 'error': 'Profile not found'}, status=404)
+    return JsonResponse({'success': True, **profile['summary']})
+
+
+@require_http_methods(["GET"])
+def api_profiling_download(request, profile_id):
+    """
+    API endpoint to download a raw profile: a .prof file for pstats/snakeviz,
+    or an HTML report for pyinstrument captures
+    """
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    profile = get_profile(profile_id)
+    if profile is None:
+        return JsonResponse({'success': False, 'error': 'Profile not found'}, status=404)
+    if profile['summary']['engine'] == 'pyinstrument':
+        response = HttpResponse(profile['raw'], content_type='text/html')
+        filename = f'{profile_id}.html'
+    else:
+        response = HttpResponse(profile['raw'], content_type='application/octet-stream')
+        filename = f'{profile_id}.prof'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 def mindsdb_dashboard(request):
     """MindsDB Knowledge Base Dashboard view"""
     return render(request, 'finance/mindsdb_dashboard.html')
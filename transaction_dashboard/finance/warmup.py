@@ -0,0 +1,165 @@
+"""
+Shared-cache results for the MindsDB dashboard's default queries.
+
+The dashboard opens with the same few searches (wealthy clients over 40 with
+$70k+, chip travel expenses over $500, online shopping in California) and the
+knowledge base stats. Their results are kept in the Django cache, keyed by
+method and arguments, so every worker serves them from REDIS_URL instead of
+running a semantic search per visitor. Only those canonical arguments are
+kept for FINANCE_WARMUP_TTL, since nothing refreshes any other arguments;
+those are cached for FINANCE_WARMUP_ADHOC_TTL seconds (0 turns that off).
+
+A background scheduler in each web process re-runs the canonical queries
+shortly after startup, every FINANCE_WARMUP_INTERVAL seconds, and whenever
+sync_kb records a finished sync. A cache lock makes sure only one process
+does the work per round.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .mindsdb_util import mindsdb_util
+
+
+CANONICAL_QUERIES = (
+    ('find_wealthy_clients', {'min_age': 40, 'min_income': 70000.0}),
+    ('find_travel_expenses', {'min_amount': 500.0, 'use_chip': True}),
+    ('find_online_shopping', {'state': 'California'}),
+    ('get_knowledge_base_stats', {}),
+)
+KB_SYNCED_KEY = 'finance:warmup:kb_synced_at'
+LOCK_KEY = 'finance:warmup:lock'
+LAST_RUN_KEY = 'finance:warmup:last_run'
+
+
+def cache_key(method: str, kwargs: Dict[str, Any]) -> str:
+    digest = hashlib.sha1(json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()
+    return f'finance:mindsdb:{method}:{digest}'
+
+
+def get_ttl(method: str, kwargs: Dict[str, Any]) -> int:
+    """Seconds a result may be served from the cache"""
+    if (method, kwargs) in CANONICAL_QUERIES:
+        return getattr(settings, 'FINANCE_WARMUP_TTL', 3600)
+    return getattr(settings, 'FINANCE_WARMUP_ADHOC_TTL', 60)
+
+
+def refresh(method: str, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+    """Run a MindsDBUtil method and store its result in the shared cache"""
+    results = getattr(mindsdb_util, method)(**kwargs)
+    entry = {'results': results, 'computed_at': time.time()}
+    ttl = get_ttl(method, kwargs)
+    if ttl > 0:
+        cache.set(cache_key(method, kwargs), entry, ttl)
+    return results, describe(entry, hit=False)
+
+
+def cached_call(method: str, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Return a MindsDBUtil method's result from the shared cache, running it on a miss
+
+    Returns:
+        Tuple of (results, cache info with hit, computed_at and age_seconds)
+    """
+    entry = cache.get(cache_key(method, kwargs))
+    if entry is not None:
+        return entry['results'], describe(entry, hit=True)
+    return refresh(method, **kwargs)
+
+
+def describe(entry: Dict[str, Any], hit: bool) -> Dict[str, Any]:
+    return {
+        'hit': hit,
+        'computed_at': entry['computed_at'],
+        'age_seconds': round(time.time() - entry['computed_at'], 1),
+    }
+
+
+def mark_kb_synced():
+    """Record that a knowledge base was reloaded, so schedulers rewarm"""
+    # The row counts changed for certain; the next request recounts
+    cache.delete(cache_key('get_knowledge_base_stats', {}))
+    cache.set(KB_SYNCED_KEY, time.time(), None)
+
+
+def warm_all() -> Dict[str, Optional[float]]:
+    """
+    Re-run every canonical query
+
+    Returns:
+        Seconds taken per method, or None where the query failed
+    """
+    timings = {}
+    for method, kwargs in CANONICAL_QUERIES:
+        started = time.monotonic()
+        try:
+            refresh(method, **kwargs)
+            timings[method] = round(time.monotonic() - started, 3)
+        except Exception as e:
+            print(f"Error warming {method}: {e}")
+            timings[method] = None
+    cache.set(LAST_RUN_KEY, {'finished_at': time.time(), 'timings': timings}, None)
+    return timings
+
+
+class WarmupScheduler:
+    """Background thread keeping the canonical query results warm"""
+
+    def __init__(self, interval: float, startup_delay: float, check_interval: float = 30.0):
+        self.interval = interval
+        self.startup_delay = startup_delay
+        self.check_interval = check_interval
+        self.last_run: Optional[float] = None
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='finance-warmup', daemon=True)
+            self._thread.start()
+
+    def trigger(self):
+        """Rewarm now instead of at the next interval"""
+        self.last_run = None
+        self._wake.set()
+
+    def _due(self) -> bool:
+        if self.last_run is None or time.time() - self.last_run >= self.interval:
+            return True
+        synced_at = cache.get(KB_SYNCED_KEY)
+        return synced_at is not None and synced_at > self.last_run
+
+    def _run(self):
+        self._wake.wait(self.startup_delay)
+        while True:
+            self._wake.clear()
+            try:
+                # One process per round does the work; the others skip
+                if self._due() and cache.add(LOCK_KEY, True, self.check_interval * 10):
+                    try:
+                        warm_all()
+                    finally:
+                        cache.delete(LOCK_KEY)
+                    self.last_run = time.time()
+                elif self._due():
+                    # Another process warmed the cache; adopt its run time
+                    last = cache.get(LAST_RUN_KEY)
+                    if last and last['finished_at'] > (self.last_run or 0):
+                        self.last_run = last['finished_at']
+            except Exception as e:
+                print(f"Error in warm-up scheduler: {e}")
+            finally:
+                close_old_connections()
+            self._wake.wait(self.check_interval)
+
+
+warmup_scheduler = WarmupScheduler(
+    interval=getattr(settings, 'FINANCE_WARMUP_INTERVAL', 900),
+    startup_delay=getattr(settings, 'FINANCE_WARMUP_STARTUP_DELAY', 5),
+)
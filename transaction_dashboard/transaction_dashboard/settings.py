@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'finance',
 ]
 
@@ -51,8 +53,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'finance.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'finance.routers.ReplicaPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'transaction_dashboard.urls'
@@ -78,17 +82,74 @@ WSGI_APPLICATION = 'transaction_dashboard.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Connections are kept open for DB_CONN_MAX_AGE seconds and health-checked
+# before reuse. DB_POOL=true switches to Django's psycopg connection pool
+# instead (requires psycopg[pool] in place of psycopg2; persistent connections
+# are then handled by the pool). Behind PgBouncer in transaction mode, set
+# DB_DISABLE_SERVER_SIDE_CURSORS=true.
+
+DB_POOL = os.getenv('DB_POOL', 'False').lower() == 'true'
+
+
+def _database(prefix, default_host):
+    options = {}
+    if DB_POOL:
+        options['pool'] = {
+            'min_size': int(os.getenv(f'{prefix}_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv(f'{prefix}_POOL_MAX_SIZE', '10')),
+            'timeout': float(os.getenv(f'{prefix}_POOL_TIMEOUT', '10')),
+        }
+    return {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('DB_NAME', 'fraud_mindsdb'),
-        'USER': os.getenv('DB_USER', 'frauduser'),
-        'PASSWORD': os.getenv('DB_PASSWORD', 'fraudpassword'),
-        'HOST': os.getenv('DB_HOST', 'localhost'),
-        'PORT': os.getenv('DB_PORT', '5432'),
+        'NAME': os.getenv(f'{prefix}_NAME', os.getenv('DB_NAME', 'fraud_mindsdb')),
+        'USER': os.getenv(f'{prefix}_USER', os.getenv('DB_USER', 'frauduser')),
+        'PASSWORD': os.getenv(f'{prefix}_PASSWORD', os.getenv('DB_PASSWORD', 'fraudpassword')),
+        'HOST': os.getenv(f'{prefix}_HOST', default_host),
+        'PORT': os.getenv(f'{prefix}_PORT', os.getenv('DB_PORT', '5432')),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS', 'False').lower() == 'true',
+        'OPTIONS': options,
     }
+
+
+DATABASES = {
+    'default': _database('DB', 'localhost'),
 }
 
+# Read replica: set DB_REPLICA_HOST (and DB_REPLICA_NAME/USER/PASSWORD/PORT if
+# they differ from the primary) to send finance reads to a streaming replica.
+# See finance.routers for which queries stay on the primary.
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = _database('DB_REPLICA', os.getenv('DB_REPLICA_HOST'))
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['finance.routers.PrimaryReplicaRouter']
+
+# After a client writes, its reads stay on the primary for this many seconds
+# so it does not see replica lag (read-after-write)
+FINANCE_REPLICA_PIN_SECONDS = int(os.getenv('FINANCE_REPLICA_PIN_SECONDS', '5'))
+
+
+# Cache
+# Set REDIS_URL to share cached data (admin filter choices, dashboard results,
+# rate limits) across workers; requires the redis package. Without it each
+# process uses its own local-memory cache.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,3 +191,166 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Transaction ingestion
+# Micro-batches are flushed when they reach the batch size or after the flush
+# interval (seconds); submissions beyond the buffer limit are rejected with 503.
+
+FINANCE_INGEST_BATCH_SIZE = int(os.getenv('FINANCE_INGEST_BATCH_SIZE', '5000'))
+FINANCE_INGEST_FLUSH_INTERVAL = float(os.getenv('FINANCE_INGEST_FLUSH_INTERVAL', '1.0'))
+FINANCE_INGEST_MAX_BUFFERED = int(os.getenv('FINANCE_INGEST_MAX_BUFFERED', '100000'))
+# A batch whose database write fails is retried this many times, then its
+# transactions are appended to the dead-letter file (JSON lines) for replay
+FINANCE_INGEST_MAX_ATTEMPTS = int(os.getenv('FINANCE_INGEST_MAX_ATTEMPTS', '3'))
+FINANCE_INGEST_DEAD_LETTER = os.getenv('FINANCE_INGEST_DEAD_LETTER', str(BASE_DIR / 'ingest_dead_letter.jsonl'))
+
+# 'local' scores against client spend profiles, 'mindsdb' uses MINDSDB_ANOMALY_MODEL
+FINANCE_ANOMALY_BACKEND = os.getenv('FINANCE_ANOMALY_BACKEND', 'local')
+FINANCE_ANOMALY_THRESHOLD = float(os.getenv('FINANCE_ANOMALY_THRESHOLD', '3.0'))
+MINDSDB_ANOMALY_MODEL = os.getenv('MINDSDB_ANOMALY_MODEL', 'anomaly_detection_model')
+MINDSDB_PG_DATABASE = os.getenv('MINDSDB_PG_DATABASE', 'django_db')
+
+# Background MindsDB query jobs
+MINDSDB_JOB_WORKERS = int(os.getenv('MINDSDB_JOB_WORKERS', '4'))
+MINDSDB_JOB_MAX_PER_USER = int(os.getenv('MINDSDB_JOB_MAX_PER_USER', '2'))
+MINDSDB_JOB_TIMEOUT = int(os.getenv('MINDSDB_JOB_TIMEOUT', '300'))
+MINDSDB_JOB_MAX_ROWS = int(os.getenv('MINDSDB_JOB_MAX_ROWS', '100000'))
+
+# Query guard: row cap for synchronous MindsDB queries and the estimated cost
+# above which /api/mindsdb/execute-query/ queues the query as a background job
+MINDSDB_MAX_ROWS = int(os.getenv('MINDSDB_MAX_ROWS', '1000'))
+MINDSDB_QUERY_COST_BUDGET = int(os.getenv('MINDSDB_QUERY_COST_BUDGET', '100000'))
+
+# Knowledge base searches whose structured filters match at most this many
+# rows in PostgreSQL are narrowed to an id list before querying MindsDB
+FINANCE_PREFILTER_MAX_IDS = int(os.getenv('FINANCE_PREFILTER_MAX_IDS', '2000'))
+
+# KB ingestion driven from Django embeds each distinct content string once with
+# MINDSDB_EMBEDDING_MODEL and caches the vector. Map each KB to its vector
+# table, e.g. "transaction_kb=vector_db.transaction_embeddings,client_kb=vector_db.client_embeddings";
+# KBs without a mapping are inserted as plain content and embedded by MindsDB.
+MINDSDB_EMBEDDING_MODEL = os.getenv('MINDSDB_EMBEDDING_MODEL', 'kb_embedding_model')
+MINDSDB_EMBEDDING_COLUMN = os.getenv('MINDSDB_EMBEDDING_COLUMN', 'embeddings')
+MINDSDB_KB_VECTOR_TABLES = dict(
+    item.split('=', 1) for item in os.getenv('MINDSDB_KB_VECTOR_TABLES', '').split(',') if '=' in item
+)
+FINANCE_EMBEDDING_BATCH_SIZE = int(os.getenv('FINANCE_EMBEDDING_BATCH_SIZE', '256'))
+FINANCE_EMBEDDING_MEMORY_CACHE = int(os.getenv('FINANCE_EMBEDDING_MEMORY_CACHE', '50000'))
+
+# Knowledge base snapshots (finance.snapshots): export_kb_snapshot writes a
+# KB's vector table to FINANCE_KB_SNAPSHOT_DIR/<kb name> in shards of this
+# many rows, and import_kb_snapshot loads it back without re-embedding
+FINANCE_KB_SNAPSHOT_DIR = os.getenv('FINANCE_KB_SNAPSHOT_DIR', str(BASE_DIR / 'kb_snapshots'))
+FINANCE_KB_SNAPSHOT_SHARD_SIZE = int(os.getenv('FINANCE_KB_SNAPSHOT_SHARD_SIZE', '100000'))
+
+# Blue/green knowledge base rebuilds (finance.kb_rebuild): rebuild_kb creates
+# new KBs with FINANCE_KB_MODEL, and each process re-reads which version a KB
+# name points to after FINANCE_KB_ALIAS_TTL seconds (at once with REDIS_URL)
+FINANCE_KB_MODEL = os.getenv('FINANCE_KB_MODEL', 'sentence_transformers')
+FINANCE_KB_ALIAS_TTL = int(os.getenv('FINANCE_KB_ALIAS_TTL', '30'))
+
+# Keyword search (finance.search, /api/search/): most results returned per type
+FINANCE_SEARCH_MAX_RESULTS = int(os.getenv('FINANCE_SEARCH_MAX_RESULTS', '100'))
+
+# Transaction admin: use PostgreSQL's estimate instead of COUNT(*) above this
+# many rows, and recompute cached filter choices after this many seconds
+FINANCE_ADMIN_EXACT_COUNT_LIMIT = int(os.getenv('FINANCE_ADMIN_EXACT_COUNT_LIMIT', '100000'))
+FINANCE_ADMIN_FILTER_CACHE_TTL = int(os.getenv('FINANCE_ADMIN_FILTER_CACHE_TTL', '3600'))
+
+# Client spatial index: grid cell size in degrees and rebuild interval in
+# seconds. Merchant locations come from a ZIP centroid file (zip,lat,lon or the
+# Census ZCTA gazetteer); without it far-from-home distances are unknown.
+FINANCE_GEO_CELL_DEGREES = float(os.getenv('FINANCE_GEO_CELL_DEGREES', '0.5'))
+FINANCE_GEO_INDEX_TTL = int(os.getenv('FINANCE_GEO_INDEX_TTL', '600'))
+FINANCE_ZIP_CENTROIDS_PATH = os.getenv('FINANCE_ZIP_CENTROIDS_PATH')
+
+# Columnar transaction loader (finance.loaders): in-process reuse window in
+# seconds, number of result sets kept (in memory and on disk), and an
+# optional directory for memory-mapped .npy snapshots
+FINANCE_ARRAY_CACHE_TTL = int(os.getenv('FINANCE_ARRAY_CACHE_TTL', '300'))
+FINANCE_ARRAY_CACHE_ENTRIES = int(os.getenv('FINANCE_ARRAY_CACHE_ENTRIES', '8'))
+FINANCE_ARRAY_CACHE_DIR = os.getenv('FINANCE_ARRAY_CACHE_DIR')
+
+# Spend analytics (/api/analytics/spend/): seconds a bucketed series stays
+# cached, the most buckets one request may read (the moving-average lead-in
+# included) and the longest moving-average window
+FINANCE_ANALYTICS_CACHE_TTL = int(os.getenv('FINANCE_ANALYTICS_CACHE_TTL', '300'))
+FINANCE_ANALYTICS_MAX_BUCKETS = int(os.getenv('FINANCE_ANALYTICS_MAX_BUCKETS', '1100'))
+FINANCE_ANALYTICS_MAX_WINDOW = int(os.getenv('FINANCE_ANALYTICS_MAX_WINDOW', '366'))
+
+# Top-N leaderboards (finance.leaderboards): periods kept up to date at ingest
+# (any of day, week, month, all) and how many of the largest transactions
+# each period keeps. Run rebuild_leaderboards after changing the periods.
+FINANCE_LEADERBOARD_PERIODS = [
+    p.strip() for p in os.getenv('FINANCE_LEADERBOARD_PERIODS', 'week,month,all').split(',') if p.strip()
+]
+FINANCE_LEADERBOARD_SIZE = int(os.getenv('FINANCE_LEADERBOARD_SIZE', '100'))
+
+# Velocity rules (finance.velocity), checked on every ingested transaction:
+# key is card or client, window is in seconds, metric is count, amount or
+# distinct_states. Override with a JSON list in FINANCE_VELOCITY_RULES and run
+# rebuild_velocity_alerts to apply new rules to stored transactions.
+FINANCE_VELOCITY_RULES = json.loads(os.getenv('FINANCE_VELOCITY_RULES', '[]')) or [
+    {'name': 'card_burst', 'key': 'card', 'window': 600, 'metric': 'count', 'threshold': 5},
+    {'name': 'card_spend_burst', 'key': 'card', 'window': 3600, 'metric': 'amount', 'threshold': 5000},
+    {'name': 'client_multi_state', 'key': 'client', 'window': 3600, 'metric': 'distinct_states', 'threshold': 3},
+]
+
+# Transaction archive (finance.archive): directory of the monthly Parquet
+# partitions written by archive_transactions, their compression codec and the
+# rows moved per database transaction. Needs the pyarrow package.
+FINANCE_ARCHIVE_DIR = os.getenv('FINANCE_ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+FINANCE_ARCHIVE_COMPRESSION = os.getenv('FINANCE_ARCHIVE_COMPRESSION', 'zstd')
+FINANCE_ARCHIVE_BATCH_SIZE = int(os.getenv('FINANCE_ARCHIVE_BATCH_SIZE', '100000'))
+
+# Live dashboard feed (/api/live/): seconds between polls for new
+# transactions and between knowledge base counts, events kept for
+# Last-Event-ID replay, and events queued per slow client before dropping.
+# Streaming needs an ASGI server, e.g. uvicorn transaction_dashboard.asgi:application
+FINANCE_LIVE_POLL_INTERVAL = float(os.getenv('FINANCE_LIVE_POLL_INTERVAL', '2.0'))
+FINANCE_LIVE_KB_INTERVAL = float(os.getenv('FINANCE_LIVE_KB_INTERVAL', '30'))
+FINANCE_LIVE_REPLAY_SIZE = int(os.getenv('FINANCE_LIVE_REPLAY_SIZE', '200'))
+FINANCE_LIVE_MAX_QUEUE = int(os.getenv('FINANCE_LIVE_MAX_QUEUE', '100'))
+FINANCE_LIVE_HEARTBEAT = float(os.getenv('FINANCE_LIVE_HEARTBEAT', '15'))
+
+# Dashboard warm-up (finance.warmup): web processes re-run the MindsDB
+# dashboard's default queries this many seconds after startup, every
+# FINANCE_WARMUP_INTERVAL seconds and after sync_kb, and keep the results in
+# the cache for FINANCE_WARMUP_TTL seconds. Results for any other arguments
+# are cached for FINANCE_WARMUP_ADHOC_TTL seconds (0 = not cached)
+FINANCE_WARMUP_ENABLED = os.getenv('FINANCE_WARMUP_ENABLED', 'True').lower() == 'true'
+FINANCE_WARMUP_STARTUP_DELAY = float(os.getenv('FINANCE_WARMUP_STARTUP_DELAY', '5'))
+FINANCE_WARMUP_INTERVAL = int(os.getenv('FINANCE_WARMUP_INTERVAL', '900'))
+FINANCE_WARMUP_TTL = int(os.getenv('FINANCE_WARMUP_TTL', '3600'))
+FINANCE_WARMUP_ADHOC_TTL = int(os.getenv('FINANCE_WARMUP_ADHOC_TTL', '60'))
+
+# Batched dashboard queries (/api/mindsdb/batch/): threads shared by all
+# batches in a process, queries allowed per batch, and seconds a batch waits
+# before reporting its unfinished queries as timed out
+FINANCE_BATCH_WORKERS = int(os.getenv('FINANCE_BATCH_WORKERS', '8'))
+FINANCE_BATCH_MAX_QUERIES = int(os.getenv('FINANCE_BATCH_MAX_QUERIES', '10'))
+FINANCE_BATCH_TIMEOUT = float(os.getenv('FINANCE_BATCH_TIMEOUT', '60'))
+
+# Rate limits and scheduling for the MindsDB endpoints (finance.throttling):
+# token buckets per user (or IP) and query class, kept in the cache, e.g.
+# "stats=120/min,search=30/min,semantic=10/min"; MindsDB requests a process
+# runs at once, and seconds a request may wait for one before getting 429.
+# Trust X-Forwarded-For only behind a proxy that sets it.
+FINANCE_THROTTLE_ENABLED = os.getenv('FINANCE_THROTTLE_ENABLED', 'True').lower() == 'true'
+FINANCE_THROTTLE_RATES = dict(
+    item.split('=', 1) for item in os.getenv('FINANCE_THROTTLE_RATES', '').split(',') if '=' in item
+)
+FINANCE_THROTTLE_TRUST_FORWARDED = os.getenv('FINANCE_THROTTLE_TRUST_FORWARDED', 'False').lower() == 'true'
+FINANCE_MINDSDB_CONCURRENCY = int(os.getenv('FINANCE_MINDSDB_CONCURRENCY', '4'))
+FINANCE_MINDSDB_QUEUE_TIMEOUT = float(os.getenv('FINANCE_MINDSDB_QUEUE_TIMEOUT', '10'))
+
+# Request profiling (finance.profiling): staff requests to finance views are
+# profiled when they send X-Finance-Profile: 1 or fall in the sample rate. The
+# last FINANCE_PROFILING_KEEP captures are listed at /api/profiling/.
+# FINANCE_PROFILING_ENGINE = 'pyinstrument' needs the pyinstrument package.
+FINANCE_PROFILING_ENABLED = os.getenv('FINANCE_PROFILING_ENABLED', 'True').lower() == 'true'
+FINANCE_PROFILING_SAMPLE_RATE = float(os.getenv('FINANCE_PROFILING_SAMPLE_RATE', '0'))
+FINANCE_PROFILING_ENGINE = os.getenv('FINANCE_PROFILING_ENGINE', 'cprofile')
+FINANCE_PROFILING_KEEP = int(os.getenv('FINANCE_PROFILING_KEEP', '50'))
+FINANCE_PROFILING_TTL = int(os.getenv('FINANCE_PROFILING_TTL', '86400'))
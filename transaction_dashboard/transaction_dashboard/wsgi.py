@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transaction_dashboard.settings')
 
 application = get_wsgi_application()
+
+# Keep the MindsDB dashboard's default queries warm in server processes only
+from django.conf import settings  # noqa: E402
+
+if settings.FINANCE_WARMUP_ENABLED:
+    from finance.warmup import warmup_scheduler
+    warmup_scheduler.start()